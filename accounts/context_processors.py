@@ -1,25 +1,23 @@
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 from .models import OnboardingTask
 
-def onboarding_status(request):
-    if not request.user.is_anonymous and request.user.customer:
-        percent_complete = OnboardingTask.objects.percent_complete(request.user.customer)
+def get_onboarding_status(request):
+    if not request.user.is_anonymous and request.user.customer_id:
+        status = OnboardingTask.objects.get_status(request.user.customer_id)
+        percent_complete = status['percent_complete']
 
-        has_incomplete_tasks = OnboardingTask.objects.filter(customer=request.user.customer, completed=False).exists()
-        if has_incomplete_tasks:
+        if status['has_incomplete_tasks']:
             show_onboarding = True
-        else:
-            has_completed_tasks = OnboardingTask.objects.filter(customer=request.user.customer, completed=True).exists()
-            if has_completed_tasks:
-                most_recent_task_completion = OnboardingTask.objects.filter(customer=request.user.customer, completed=True).order_by("-updated")[0]
-                td = timezone.now() - most_recent_task_completion.updated
-                hours_since_last_task_completed = td.total_seconds() / 60 / 60
-                if hours_since_last_task_completed > 2.0:
-                    show_onboarding = False
-                else:
-                    show_onboarding = True
-            else:
+        elif status['last_completed']:
+            td = timezone.now() - status['last_completed']
+            hours_since_last_task_completed = td.total_seconds() / 60 / 60
+            if hours_since_last_task_completed > 2.0:
                 show_onboarding = False
+            else:
+                show_onboarding = True
+        else:
+            show_onboarding = False
     else:
         percent_complete = 0.0
         show_onboarding = False
@@ -28,3 +26,14 @@ def onboarding_status(request):
         'percent_complete_as_float_onboarding_tasks': percent_complete,
         'percent_complete_onboarding_tasks': round(percent_complete*100),
     }
+
+def onboarding_status(request):
+    # Templates call callables when they resolve them so nothing is looked
+    # up unless the template actually uses one of these. Partials and error
+    # pages that don't render the sidenav never touch the cache or the DB.
+    status = SimpleLazyObject(lambda: get_onboarding_status(request))
+    return {
+        'show_onboarding': lambda: status['show_onboarding'],
+        'percent_complete_as_float_onboarding_tasks': lambda: status['percent_complete_as_float_onboarding_tasks'],
+        'percent_complete_onboarding_tasks': lambda: status['percent_complete_onboarding_tasks'],
+    }
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import Customer
+from accounts.tasks import get_customer_purge_name, purge_customer
+from common.purge import Purge
+
+
+class Command(BaseCommand):
+    help = "Deletes a customer and all of their data in small batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("customer_id", type=int)
+        parser.add_argument(
+            "--background",
+            dest="background",
+            action="store_true",
+            default=False,
+            help="Queue it for Celery instead of running it here",
+        )
+        parser.add_argument(
+            "--status",
+            dest="status",
+            action="store_true",
+            default=False,
+            help="Show how far a purge has got",
+        )
+        parser.add_argument(
+            "--noinput", dest="interactive", action="store_false", default=True
+        )
+
+    def handle(self, *args, **options):
+        customer_id = options["customer_id"]
+        if options["status"]:
+            print(Purge.get_progress(get_customer_purge_name(customer_id)))
+            return
+
+        customer = Customer.objects.filter(pk=customer_id).first()
+        if customer is None:
+            # Maybe a previous purge already got it.
+            raise CommandError(f"Customer {customer_id} doesn't exist")
+        if options["interactive"]:
+            answer = input(f"Type '{customer.name}' to delete all of its data: ")
+            if answer != customer.name:
+                raise CommandError("Purge cancelled")
+
+        if options["background"]:
+            purge_customer.delay(customer_id)
+            print("Queued. Check on it with --status.")
+        else:
+            for label, total in sorted(purge_customer(customer_id).items()):
+                print(f"{label}: {total}")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from accounts.stripe_sync import StripeUsageSync
+
+
+class Command(BaseCommand):
+    help = "Sends feedback counts to Stripe as usage and refreshes next MRR payments"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run", dest="dry_run", action="store_true", default=False
+        )
+        parser.add_argument("--max-workers", dest="max_workers", type=int, default=4)
+
+    def handle(self, *args, **options):
+        results = StripeUsageSync(
+            dry_run=options["dry_run"], max_workers=options["max_workers"]
+        ).execute()
+        for sub, next_mrr_payment, reported_feedback_count in results:
+            print(
+                f"{sub.customer_id} {sub.stripe_subscription_id}: "
+                f"next_mrr_payment={next_mrr_payment} "
+                f"reported_feedback_count={reported_feedback_count}"
+            )
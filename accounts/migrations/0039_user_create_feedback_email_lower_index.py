@@ -0,0 +1,20 @@
+# Generated by Django 2.1.3 on 2026-10-19 13:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0038_auto_20201008_2234"),
+    ]
+
+    # Backs MyUserManager.get_by_create_feedback_email which is how the inbound
+    # email pipeline finds the User a forwarded email belongs to. There isn't a
+    # built in expression Index class in Django 2.1 so we use Raw SQL.
+    operations = [
+        migrations.RunSQL(
+            "CREATE INDEX accounts_user_create_feedback_email_lower ON accounts_user (LOWER(create_feedback_email));",
+            "DROP INDEX accounts_user_create_feedback_email_lower",
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.3 on 2026-10-19 13:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0039_user_create_feedback_email_lower_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="subscription",
+            name="reported_feedback_count",
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
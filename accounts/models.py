@@ -11,11 +11,13 @@ from django.contrib.auth.models import (
     PermissionsMixin,
 )
 from django.contrib.auth.tokens import default_token_generator
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.mail import send_mail
 from django.core.validators import EmailValidator
 from django.db import models
-from django.db.models.signals import post_save
+from django.db.models.functions import Lower
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.template import loader
 from django.urls import reverse_lazy
@@ -23,6 +25,8 @@ from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from rest_framework.authtoken.models import Token
 
+from common.cache import get_customer_cache_key
+
 
 def validate_domain(domain):
     bad_domains = [
@@ -180,56 +184,40 @@ class Customer(models.Model):
         return Subscription.PLAN_TIERED_PRICES[index_array[0][0]]
 
     def newest_feedback_created_one_hour_ago(self):
-        if self.newest_feedback():
-            newest_feedback_created = self.newest_feedback().created
-        else:
+        newest_feedback_created = self.get_stats().newest_feedback_created
+        if newest_feedback_created is None:
             newest_feedback_created = timezone.now()
         return (
             round((timezone.now() - newest_feedback_created).total_seconds() / 60) >= 60
         )
 
-    def newest_feedback(self):
-        from feedback.models import (
-            Feedback,
-        )  # Avoid circular import. Move to a context processor?
+    def get_stats(self):
+        from feedback.models import CustomerStats  # Avoid circular import.
 
-        return Feedback.objects.filter(customer=self).order_by("created").last()
+        return CustomerStats.objects.for_customer(self)
 
-    def total_feedback_count(self):
-        from feedback.models import (
-            Feedback,
-        )  # Avoid circular import. Move to a context processor?
+    def newest_feedback(self):
+        return self.get_stats().newest_feedback
 
-        return Feedback.objects.filter(customer=self).count()
+    def total_feedback_count(self):
+        return self.get_stats().total_feedback
 
     def feedback_submitted_last_7_days_count(self):
-        from feedback.models import (
-            Feedback,
-        )  # Avoid circular import. Move to a context processor?
+        from feedback.models import FeedbackCountBucket  # Avoid circular import.
 
+        # Counts whole hours so this can include up to an hour of extra
+        # feedback at the start of the window.
         seven_days_ago = timezone.now() - timedelta(days=7)
-        return Feedback.objects.filter(
-            customer=self, created__gte=seven_days_ago
-        ).count()
+        return FeedbackCountBucket.objects.total_since(self.id, seven_days_ago)
 
     def untriaged_feedback_count(self):
-        from feedback.models import (
-            Feedback,
-        )  # Avoid circular import. Move to a context processor?
-
-        return Feedback.objects.filter(customer=self, state=Feedback.ACTIVE).count()
+        return self.get_stats().active_feedback
 
     def pending_feedback_count(self):
-        from feedback.models import Feedback
-
-        return Feedback.objects.filter(customer=self, state=Feedback.PENDING).count()
+        return self.get_stats().pending_feedback
 
     def shipped_feature_request_count(self):
-        from feedback.models import FeatureRequest
-
-        return FeatureRequest.objects.filter(
-            customer=self, state=FeatureRequest.SHIPPED
-        ).count()
+        return self.get_stats().shipped_feature_requests
 
     def onboarding_percent_complete(self):
         return int(OnboardingTask.objects.percent_complete(self) * 100)
@@ -386,6 +374,8 @@ class Subscription(models.Model):
     stripe_customer_id = models.CharField(max_length=255)
     stripe_subscription_id = models.CharField(max_length=255)
     next_mrr_payment = models.FloatField(null=True, blank=True)
+    # Feedback count as of the last sync with Stripe. See StripeUsageSync.
+    reported_feedback_count = models.IntegerField(null=True, blank=True)
     trial_end_date = models.DateTimeField(null=True, blank=True)
     card_on_file = models.BooleanField(default=False)
     status = models.CharField(choices=STATUS_CHOICES, max_length=30)
@@ -571,17 +561,18 @@ class Subscription(models.Model):
 
     # Updates subscription.next_mrr_payment field in our db.
     def update_next_mrr_payment(self, stripe_sub):
+        self.next_mrr_payment = self.get_next_mrr_payment(stripe_sub)
+        self.save()
+
+    def get_next_mrr_payment(self, stripe_sub, stripe_api=stripe):
         if self.is_plan_per_seat():
             quantity = stripe_sub["quantity"]
             amount = stripe_sub["plan"]["amount"]
-            billing_amount = quantity * amount
-            self.next_mrr_payment = billing_amount
-            self.save()
+            return quantity * amount
         else:
             # Works for both usage tiered and feature tiered
-            next_invoice = stripe.Invoice.upcoming(customer=stripe_sub["customer"])
-            self.next_mrr_payment = next_invoice["total"]
-            self.save()
+            next_invoice = stripe_api.Invoice.upcoming(customer=stripe_sub["customer"])
+            return next_invoice["total"]
 
     def has_payment_source(self):
         return len(self.get_stripe_customer()["sources"]["data"]) > 0
@@ -676,6 +667,17 @@ class MyUserManager(BaseUserManager):
 
         return self._create_user(email, password, **extra_fields)
 
+    def get_by_create_feedback_email(self, email):
+        # To avoid confusion we always force the secret to be lowercase.
+        # We also migrated everything to lowercase but on the of chance
+        # that someone saved one with mixed case we match on LOWER() which
+        # is backed by the accounts_user_create_feedback_email_lower index.
+        return (
+            self.get_queryset()
+            .annotate(create_feedback_email_lower=Lower("create_feedback_email"))
+            .get(create_feedback_email_lower=email.lower())
+        )
+
 
 class Discount(models.Model):
     code = models.CharField(max_length=255, unique=True)
@@ -890,7 +892,21 @@ class FeedbackTriageSettings(models.Model):
     updated = models.DateTimeField(auto_now=True, editable=False)
 
 
-class OnboardingTaskManager(models.Manager):
+class OnboardingTaskQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # Nearly everything checks off tasks with a queryset update() which
+        # doesn't send signals so this is where the status cache gets
+        # invalidated.
+        customer_ids = set(self.values_list("customer_id", flat=True))
+        rows = super().update(**kwargs)
+        for customer_id in customer_ids:
+            OnboardingTask.objects.refresh_status_cache(customer_id)
+        return rows
+
+
+class OnboardingTaskManager(models.Manager.from_queryset(OnboardingTaskQuerySet)):
+    STATUS_CACHE_TIMEOUT = 24 * 60 * 60
+
     def create_initial_tasks(self, customer):
         for task_type, task_name in OnboardingTask.TASK_TYPES:
             self.get_queryset().create(customer=customer, task_type=task_type)
@@ -899,15 +915,98 @@ class OnboardingTaskManager(models.Manager):
         ).update(completed=True)
 
     def percent_complete(self, customer):
-        total_tasks = self.get_queryset().filter(customer=customer).count()
-        completed_tasks = (
-            self.get_queryset().filter(customer=customer, completed=True).count()
+        return self.get_status(customer.id)["percent_complete"]
+
+    def get_status_cache_key(self, customer_id):
+        return get_customer_cache_key(customer_id, "onboarding_status")
+
+    def get_completed_cache_key(self, customer_id):
+        return get_customer_cache_key(customer_id, "onboarding_completed")
+
+    def refresh_status_cache(self, customer_id):
+        cache.delete_many(
+            [
+                self.get_status_cache_key(customer_id),
+                self.get_completed_cache_key(customer_id),
+            ]
+        )
+
+    def get_completed_bitmap(self, customer_id):
+        """
+        Returns a bitmap (see OnboardingTask.TASK_BITS) of the tasks the
+        customer doesn't need to complete anymore. Tasks the customer
+        doesn't have a row for count as completed since there is nothing
+        to update.
+        """
+        bitmap = cache.get(self.get_completed_cache_key(customer_id))
+        if bitmap is None:
+            incomplete_task_types = set(
+                self.get_queryset()
+                .filter(customer_id=customer_id, completed=False)
+                .values_list("task_type", flat=True)
+            )
+            bitmap = 0
+            for task_type, bit in OnboardingTask.TASK_BITS.items():
+                if task_type not in incomplete_task_types:
+                    bitmap |= bit
+            cache.set(
+                self.get_completed_cache_key(customer_id),
+                bitmap,
+                self.STATUS_CACHE_TIMEOUT,
+            )
+        return bitmap
+
+    def complete_task(self, customer_id, task_type):
+        """
+        Marks the task completed. This gets called on hot paths like creating
+        feedback and viewing feature requests so it only writes when the task
+        actually flips from incomplete to completed. Returns True if it did.
+        """
+        if self.get_completed_bitmap(customer_id) & OnboardingTask.TASK_BITS[task_type]:
+            return False
+        completed = (
+            self.get_queryset()
+            .filter(customer_id=customer_id, task_type=task_type, completed=False)
+            .update(completed=True, updated=timezone.now())
+        )
+        # update() only refreshes the cache when it matched something.
+        self.refresh_status_cache(customer_id)
+        return completed > 0
+
+    def get_status(self, customer_id):
+        """
+        Returns a dict with the customer's 'percent_complete', whether they
+        have any incomplete tasks and when they last completed one. It's
+        shown in the chrome of every page so it's cached until a task
+        changes.
+        """
+        status = cache.get(self.get_status_cache_key(customer_id))
+        if status is not None:
+            return status
+
+        tasks = self.get_queryset().filter(customer_id=customer_id)
+        counts = tasks.aggregate(
+            total=models.Count("id"),
+            # Not called "completed", the filters would then refer to it
+            # rather than the field.
+            completed_count=models.Count("id", filter=models.Q(completed=True)),
+            last_completed=models.Max("updated", filter=models.Q(completed=True)),
         )
-        if total_tasks > 0:
-            val = round(completed_tasks / float(total_tasks), 2)
+        if counts["total"] > 0:
+            percent_complete = round(
+                counts["completed_count"] / float(counts["total"]), 2
+            )
         else:
-            val = 0
-        return val
+            percent_complete = 0
+        status = {
+            "percent_complete": percent_complete,
+            "has_incomplete_tasks": counts["completed_count"] < counts["total"],
+            "last_completed": counts["last_completed"],
+        }
+        cache.set(
+            self.get_status_cache_key(customer_id), status, self.STATUS_CACHE_TIMEOUT
+        )
+        return status
 
 
 class OnboardingTask(models.Model):
@@ -932,6 +1031,25 @@ class OnboardingTask(models.Model):
         (TASK_CLOSE_THE_LOOP, TASK_CLOSE_THE_LOOP),
     )
 
+    # Position of each task in the cached completion bitmap. Only ever
+    # append to this otherwise cached bitmaps will be read wrong.
+    TASK_BITS = {
+        task_type: 1 << index
+        for index, task_type in enumerate(
+            (
+                TASK_CREATE_VAULT,
+                TASK_CREATE_FEEDBACK,
+                TASK_CREATE_FEATURE_REQUEST,
+                TASK_TRIAGE_FEEDBACK,
+                TASK_CONNECT_HELP_DESK,
+                TASK_SUBMIT_FEEDBACK_VIA_HELP_DESK,
+                TASK_CREATE_FEEDBACK_CE,
+                TASK_VIEW_FEATURE_REQUEST_DETAILS,
+                TASK_CLOSE_THE_LOOP,
+            )
+        )
+    }
+
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
     task_type = models.CharField(choices=TASK_TYPES, blank=False, max_length=255)
     completed = models.BooleanField(default=False)
@@ -999,3 +1117,9 @@ class OnboardingTask(models.Model):
         else:
             raise Exception("Invalid onboarding task type")
         return url
+
+
+@receiver(post_save, sender=OnboardingTask)
+@receiver(post_delete, sender=OnboardingTask)
+def refresh_onboarding_status_cache(sender, instance, **kwargs):
+    OnboardingTask.objects.refresh_status_cache(instance.customer_id)
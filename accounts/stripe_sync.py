@@ -0,0 +1,144 @@
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import stripe
+from django.conf import settings
+from django.utils import timezone
+from sentry_sdk import capture_exception
+
+from .models import Subscription
+
+
+class StripeUsageSync(object):
+    """
+    Pushes each active subscription's feedback count to Stripe as a usage
+    record and refreshes our copy of its next MRR payment.
+
+    Stripe subscriptions are fetched a page at a time with `list` rather than
+    one `retrieve` per subscription and subscriptions whose feedback count
+    hasn't changed since the last usage record we sent are skipped entirely.
+    The remaining Stripe calls run on a small thread pool. Only the Stripe
+    calls run on the pool; all DB reads and writes happen on the calling
+    thread.
+
+    With `dry_run` no usage records are sent to Stripe and nothing is saved,
+    the planned changes are just logged and returned.
+
+    `stripe_api` is the module used to talk to Stripe. It's a parameter so a
+    local stub can stand in for the real API.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    PAGE_SIZE = 100
+
+    def __init__(self, dry_run=False, max_workers=4, stripe_api=stripe):
+        self.dry_run = dry_run
+        self.max_workers = max_workers
+        self.stripe_api = stripe_api
+
+    def execute(self):
+        self.stripe_api.api_key = settings.STRIPE_API_KEY
+
+        subs = {
+            sub.stripe_subscription_id: sub
+            for sub in Subscription.objects.filter(status=Subscription.STATUS_ACTIVE)
+        }
+        feedback_counts = self.get_feedback_counts(subs.values())
+
+        work = []
+        for stripe_sub in self.list_stripe_subscriptions():
+            sub = subs.get(stripe_sub["id"])
+            if sub is None:
+                continue
+            total_feedback = feedback_counts.get(sub.customer_id, 0)
+            if self.needs_sync(sub, total_feedback):
+                work.append((sub, stripe_sub, total_feedback))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(lambda args: self.sync(*args), work))
+
+        for sub, next_mrr_payment, reported_feedback_count in results:
+            self.logger.info(
+                f"{'[dry run] ' if self.dry_run else ''}{sub.stripe_subscription_id}: "
+                f"next_mrr_payment={next_mrr_payment} "
+                f"reported_feedback_count={reported_feedback_count}"
+            )
+            if self.dry_run:
+                continue
+            sub.next_mrr_payment = next_mrr_payment
+            if reported_feedback_count is not None:
+                sub.reported_feedback_count = reported_feedback_count
+            sub.save(update_fields=["next_mrr_payment", "reported_feedback_count"])
+        return results
+
+    def get_feedback_counts(self, subs):
+        from feedback.models import CustomerStats  # Avoid circular import.
+
+        customer_ids = {sub.customer_id for sub in subs}
+        counts = dict(
+            CustomerStats.objects.filter(customer_id__in=customer_ids).values_list(
+                "customer_id", "total_feedback"
+            )
+        )
+        for customer_id in customer_ids - counts.keys():
+            counts[customer_id] = CustomerStats.objects.rebuild(
+                customer_id
+            ).total_feedback
+        return counts
+
+    def list_stripe_subscriptions(self):
+        # The default list excludes canceled subscriptions which is what we
+        # want. Items and their plans come back inline so there is nothing
+        # to expand and no need for a retrieve per subscription.
+        return self.stripe_api.Subscription.list(
+            limit=self.PAGE_SIZE
+        ).auto_paging_iter()
+
+    def needs_sync(self, sub, total_feedback):
+        # Per seat MRR is computed from the listed subscription so it's free
+        # to refresh. Everything else costs an upcoming invoice call which
+        # only changes when the usage does.
+        return (
+            sub.is_plan_per_seat()
+            or sub.next_mrr_payment is None
+            or sub.reported_feedback_count != total_feedback
+        )
+
+    def sync(self, sub, stripe_sub, total_feedback):
+        # Runs on the thread pool. No DB access in here.
+        reported_feedback_count = None
+        if sub.reported_feedback_count != total_feedback:
+            reported_feedback_count = total_feedback
+            # Usage hangs off the SubscriptionItem, not the Subscription,
+            # so we need to find the item that belongs to the tiered plan.
+            for item in stripe_sub["items"]["data"]:
+                if item["plan"]["id"] == settings.PLAN_TIERED:
+                    if not self.report_usage(item, total_feedback):
+                        reported_feedback_count = None
+
+        try:
+            next_mrr_payment = sub.get_next_mrr_payment(
+                stripe_sub, stripe_api=self.stripe_api
+            )
+        except Exception as e:
+            capture_exception(e)
+            next_mrr_payment = sub.next_mrr_payment
+        return sub, next_mrr_payment, reported_feedback_count
+
+    def report_usage(self, item, total_feedback):
+        if self.dry_run:
+            return True
+        try:
+            self.stripe_api.SubscriptionItem.create_usage_record(
+                item["id"],
+                quantity=total_feedback,
+                timestamp=timezone.now(),
+                action="set",
+                idempotency_key=str(uuid.uuid1()),
+            )
+            return True
+        except Exception as e:
+            capture_exception(e)
+            return False
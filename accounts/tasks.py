@@ -1,17 +1,18 @@
 import random
-import uuid
 from datetime import timedelta
 
-import stripe
 from celery import shared_task
 from django.conf import settings
 from django.core.mail import mail_admins
 from django.db.models import Count, Q
 from django.template import loader
 from django.utils import timezone
-from sentry_sdk import capture_exception
 
-from .models import Subscription, User
+from common.cache import invalidate_customer_cache
+from common.purge import Purge
+
+from .models import Customer, Subscription, User
+from .stripe_sync import StripeUsageSync
 
 
 @shared_task
@@ -81,35 +82,8 @@ def send_admin_subscription_summary_email():
 
 
 @shared_task
-def sync_feedback_counts_and_mrr_with_stripe():
-    subs = Subscription.objects.filter(status=Subscription.STATUS_ACTIVE)
-    subs = subs.annotate(total_feedback=Count("customer__feedback"))
-
-    for sub in subs:
-        stripe.api_key = settings.STRIPE_API_KEY
-        stripe_subscription = stripe.Subscription.retrieve(sub.stripe_subscription_id)
-
-        # We're looping through all subscription items in this code
-        # (a Stripe subscription can have multiple "items". An item
-        # is an instance of a plan).  We need to find the SubscriptionItem
-        # that belongs to the tiered plan.  This is because usage hangs
-        # off the SubscriptionItem, not the Subscription.  When we find the
-        # SubscriptionItem we use Stripe's usage API to send in feedback count.
-
-        print(sub.stripe_subscription_id)
-        for ss in stripe_subscription["items"]["data"]:
-            sub.update_next_mrr_payment(stripe_subscription)
-            if ss["plan"]["id"] == settings.PLAN_TIERED:
-                try:
-                    stripe.SubscriptionItem.create_usage_record(
-                        ss["id"],
-                        quantity=sub.total_feedback,
-                        timestamp=timezone.now(),
-                        action="set",
-                        idempotency_key=str(uuid.uuid1()),
-                    )
-                except Exception as e:
-                    capture_exception(e)
+def sync_feedback_counts_and_mrr_with_stripe(dry_run=False):
+    StripeUsageSync(dry_run=dry_run).execute()
 
 
 @shared_task
@@ -127,3 +101,23 @@ def send_signup_survey_email(user_id):
     )
 
     user.email_user(subject, txt_message, "Kareem Mayan <k@savio.io>")
+
+
+def get_customer_purge_name(customer_id):
+    return f"customer_{customer_id}"
+
+
+# acks_late so a worker dying part way through gets it redelivered. Purges
+# pick up where they left off.
+@shared_task(acks_late=True)
+def purge_customer(customer_id):
+    """
+    Deletes a customer and all of their data in small batches rather than
+    one huge cascading delete. Check on it with
+    Purge.get_progress(get_customer_purge_name(customer_id)).
+    """
+    deleted = Purge(get_customer_purge_name(customer_id)).run(
+        Customer.objects.filter(pk=customer_id)
+    )
+    invalidate_customer_cache(customer_id)
+    return dict(deleted)
@@ -1,3 +1,249 @@
+import threading
+from types import SimpleNamespace
+
+from django.conf import settings
 from django.test import TestCase
 
-# Create your tests here.
+from appaccounts.models import AppCompany, AppUser
+from common.purge import Purge
+from feedback.models import CustomerStats, FeatureRequest, Feedback, Theme
+
+from .models import Customer, OnboardingTask, Subscription, User
+from .stripe_sync import StripeUsageSync
+from .tasks import get_customer_purge_name, purge_customer
+
+
+class FakeStripe(object):
+    """
+    Just enough of the stripe module for StripeUsageSync. Records every call
+    so tests can check what would have been sent to Stripe.
+    """
+
+    def __init__(self, subscriptions, upcoming_total=1000, fail_usage_records=False):
+        self.subscriptions = subscriptions
+        self.upcoming_total = upcoming_total
+        self.fail_usage_records = fail_usage_records
+        self.calls = []
+        self.lock = threading.Lock()
+
+        self.Subscription = SimpleNamespace(list=self.list_subscriptions)
+        self.Invoice = SimpleNamespace(upcoming=self.upcoming_invoice)
+        self.SubscriptionItem = SimpleNamespace(
+            create_usage_record=self.create_usage_record
+        )
+
+    def record(self, *call):
+        # The sync calls us from its thread pool.
+        with self.lock:
+            self.calls.append(call)
+
+    def get_calls(self, name):
+        return [call[1:] for call in self.calls if call[0] == name]
+
+    def list_subscriptions(self, limit):
+        self.record("Subscription.list", limit)
+        return SimpleNamespace(auto_paging_iter=lambda: iter(self.subscriptions))
+
+    def upcoming_invoice(self, customer):
+        self.record("Invoice.upcoming", customer)
+        return {"total": self.upcoming_total}
+
+    def create_usage_record(self, item_id, quantity, **kwargs):
+        self.record("SubscriptionItem.create_usage_record", item_id, quantity)
+        if self.fail_usage_records:
+            raise Exception("Stripe is down")
+
+
+class StripeUsageSyncTestCase(TestCase):
+    def create_subscription(self, name, total_feedback, **kwargs):
+        customer = Customer.objects.create(name=name)
+        CustomerStats.objects.create(customer=customer, total_feedback=total_feedback)
+        defaults = {
+            "plan": Subscription.PLAN_TIERED,
+            "plan_type": Subscription.PLAN_TYPE_USAGE_TIERED,
+            "stripe_customer_id": f"cus_{name}",
+            "stripe_subscription_id": f"sub_{name}",
+            "status": Subscription.STATUS_ACTIVE,
+        }
+        defaults.update(kwargs)
+        return Subscription.objects.create(customer=customer, **defaults)
+
+    def get_stripe_subscription(self, sub):
+        return {
+            "id": sub.stripe_subscription_id,
+            "customer": sub.stripe_customer_id,
+            "quantity": 1,
+            "plan": {"amount": 0},
+            "items": {
+                "data": [{"id": f"si_{sub.pk}", "plan": {"id": settings.PLAN_TIERED}}]
+            },
+        }
+
+    def sync(self, subs, **kwargs):
+        dry_run = kwargs.pop("dry_run", False)
+        stripe_api = FakeStripe(
+            [self.get_stripe_subscription(sub) for sub in subs], **kwargs
+        )
+        StripeUsageSync(dry_run=dry_run, stripe_api=stripe_api).execute()
+        for sub in subs:
+            sub.refresh_from_db()
+        return stripe_api
+
+    def test_unchanged_counts_are_skipped(self):
+        sub = self.create_subscription(
+            "unchanged", 10, reported_feedback_count=10, next_mrr_payment=500
+        )
+
+        stripe_api = self.sync([sub])
+
+        self.assertEqual(stripe_api.get_calls("Invoice.upcoming"), [])
+        self.assertEqual(
+            stripe_api.get_calls("SubscriptionItem.create_usage_record"), []
+        )
+        self.assertEqual(sub.next_mrr_payment, 500)
+
+    def test_changed_counts_are_reported(self):
+        sub = self.create_subscription(
+            "changed", 12, reported_feedback_count=10, next_mrr_payment=500
+        )
+
+        stripe_api = self.sync([sub], upcoming_total=700)
+
+        self.assertEqual(
+            stripe_api.get_calls("SubscriptionItem.create_usage_record"),
+            [(f"si_{sub.pk}", 12)],
+        )
+        self.assertEqual(sub.reported_feedback_count, 12)
+        self.assertEqual(sub.next_mrr_payment, 700)
+
+    def test_dry_run_writes_nothing(self):
+        sub = self.create_subscription(
+            "dry", 12, reported_feedback_count=10, next_mrr_payment=500
+        )
+
+        stripe_api = self.sync([sub], dry_run=True, upcoming_total=700)
+
+        self.assertEqual(
+            stripe_api.get_calls("SubscriptionItem.create_usage_record"), []
+        )
+        self.assertEqual(sub.reported_feedback_count, 10)
+        self.assertEqual(sub.next_mrr_payment, 500)
+
+    def test_one_upcoming_invoice_call_per_subscription(self):
+        subs = [
+            self.create_subscription(f"sub{i}", i, reported_feedback_count=None)
+            for i in range(3)
+        ]
+
+        stripe_api = self.sync(subs)
+
+        self.assertEqual(len(stripe_api.get_calls("Subscription.list")), 1)
+        self.assertCountEqual(
+            stripe_api.get_calls("Invoice.upcoming"),
+            [(sub.stripe_customer_id,) for sub in subs],
+        )
+
+    def test_failed_usage_record_keeps_reported_count(self):
+        sub = self.create_subscription(
+            "failing", 12, reported_feedback_count=10, next_mrr_payment=500
+        )
+
+        stripe_api = self.sync([sub], fail_usage_records=True, upcoming_total=700)
+
+        self.assertEqual(
+            len(stripe_api.get_calls("SubscriptionItem.create_usage_record")), 1
+        )
+        self.assertEqual(sub.reported_feedback_count, 10)
+        # The MRR is still refreshed so the next run retries just the usage.
+        self.assertEqual(sub.next_mrr_payment, 700)
+
+
+class OnboardingTaskStatusTestCase(TestCase):
+    def test_status(self):
+        customer = Customer.objects.create(name="Acme")
+        for task_type in (
+            OnboardingTask.TASK_CREATE_FEEDBACK,
+            OnboardingTask.TASK_CREATE_FEATURE_REQUEST,
+            OnboardingTask.TASK_TRIAGE_FEEDBACK,
+            OnboardingTask.TASK_CLOSE_THE_LOOP,
+        ):
+            OnboardingTask.objects.create(customer=customer, task_type=task_type)
+        OnboardingTask.objects.complete_task(
+            customer.id, OnboardingTask.TASK_CREATE_FEEDBACK
+        )
+
+        status = OnboardingTask.objects.get_status(customer.id)
+
+        self.assertEqual(status["percent_complete"], 0.25)
+        self.assertTrue(status["has_incomplete_tasks"])
+        self.assertEqual(
+            status["last_completed"],
+            OnboardingTask.objects.get(
+                customer=customer, task_type=OnboardingTask.TASK_CREATE_FEEDBACK
+            ).updated,
+        )
+
+
+class PurgeCustomerTestCase(TestCase):
+    def create_customer(self, name):
+        customer = Customer.objects.create(name=name)
+        CustomerStats.objects.rebuild(customer.id)
+        User.objects.create_user(
+            f"owner@{name.lower()}.example.com",
+            "password",
+            customer=customer,
+            role=User.ROLE_OWNER,
+        )
+        company = AppCompany.objects.create(customer=customer, name="Co")
+        app_user = AppUser.objects.create(
+            customer=customer, company=company, name="Jane", email="jane@co.com"
+        )
+        theme = Theme.objects.create(customer=customer, title="Billing")
+        feature_request = FeatureRequest.objects.create(
+            customer=customer, title="Exports"
+        )
+        feature_request.themes.add(theme)
+        for i in range(3):
+            feedback = Feedback.objects.create(
+                customer=customer,
+                user=app_user,
+                feature_request=feature_request,
+                problem=f"Problem {i}",
+                feedback_type=Feedback.EXISTING,
+            )
+            feedback.themes.add(theme)
+        return customer
+
+    def get_counts(self, customer):
+        return {
+            model._meta.label: model.objects.filter(customer=customer).count()
+            for model in (
+                User,
+                CustomerStats,
+                AppCompany,
+                AppUser,
+                Theme,
+                FeatureRequest,
+                Feedback,
+            )
+        }
+
+    def test_purge_customer(self):
+        customer = self.create_customer("Acme")
+        other = self.create_customer("Other")
+        other_counts = self.get_counts(other)
+
+        deleted = purge_customer(customer.id)
+
+        self.assertFalse(Customer.objects.filter(pk=customer.pk).exists())
+        self.assertEqual(set(self.get_counts(customer).values()), {0})
+        self.assertEqual(self.get_counts(other), other_counts)
+        self.assertEqual(
+            Feedback.themes.through.objects.filter(feedback__customer=other).count(), 3,
+        )
+        self.assertEqual(deleted["accounts.Customer"], 1)
+        self.assertEqual(deleted["feedback.Feedback"], 3)
+        self.assertEqual(deleted["feedback.Feedback_themes"], 3)
+        self.assertEqual(deleted["feedback.FeatureRequest_themes"], 1)
+        progress = Purge.get_progress(get_customer_purge_name(customer.id))
+        self.assertTrue(progress["finished"])
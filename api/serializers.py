@@ -1,11 +1,21 @@
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
 from django.utils import timezone
 from rest_framework import serializers
 from rest_framework.compat import unicode_to_repr
 from rest_framework.fields import empty
 
 from accounts.models import OnboardingTask
-from appaccounts.models import AppUser
-from feedback.models import FeatureRequest, Feedback, Theme
+from appaccounts.models import AppUser, get_email_domain
+from feedback.models import (
+    CustomerStats,
+    FeatureRequest,
+    Feedback,
+    FeedbackIngestRules,
+    Theme,
+)
 from internal_analytics import tracking
 
 
@@ -44,6 +54,86 @@ class CustomerFilteredPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField)
 #         fields = ('customer', 'customer_name', 'id', 'email', 'first_name', 'last_name', 'role', 'permissions')
 
 
+class EagerLoadingMixin(object):
+    """
+    Lets a serializer say which related rows its fields read so list and
+    detail endpoints can fetch them up front instead of once per object.
+
+    Fields that read a relation are listed in `Meta.select_related` (or
+    `Meta.prefetch_related` for to-many relations), keyed by field name.
+    Nested serializers that use this mixin are followed automatically.
+    Only fields that are actually being rendered count, so a field left out
+    with `?fields=` doesn't cost a join.
+
+    `?fields=id,title` on a GET limits the top level serializer to those
+    fields.
+    """
+
+    SPARSE_FIELDS_PARAM = "fields"
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get("request")
+        # Only the top level serializer (or the child of a top level list)
+        # is limited, nested serializers render in full.
+        is_top_level = self.root is self or (
+            self.parent is self.root
+            and isinstance(self.root, serializers.ListSerializer)
+        )
+        if request is None or request.method != "GET" or not is_top_level:
+            return fields
+        requested = request.query_params.get(self.SPARSE_FIELDS_PARAM)
+        if not requested:
+            return fields
+        requested = {name.strip() for name in requested.split(",")}
+        return {name: field for name, field in fields.items() if name in requested}
+
+    def get_eager_loading(self, prefix=""):
+        """
+        Returns the select_related and prefetch_related lookups the fields
+        being rendered need, relative to `prefix`.
+        """
+        meta = getattr(self, "Meta", None)
+        declared_select = getattr(meta, "select_related", {})
+        declared_prefetch = getattr(meta, "prefetch_related", {})
+        select_related = []
+        prefetch_related = []
+        for name, field in self.fields.items():
+            if field.write_only:
+                continue
+            select_related.extend(
+                prefix + lookup for lookup in declared_select.get(name, ())
+            )
+            prefetch_related.extend(
+                prefix + lookup for lookup in declared_prefetch.get(name, ())
+            )
+
+            lookup = prefix + field.source.replace(".", "__")
+            if isinstance(field, serializers.ListSerializer) and isinstance(
+                field.child, EagerLoadingMixin
+            ):
+                # Everything below a to-many relation has to be prefetched.
+                child_select, child_prefetch = field.child.get_eager_loading(
+                    lookup + "__"
+                )
+                prefetch_related.extend([lookup] + child_select + child_prefetch)
+            elif isinstance(field, serializers.ManyRelatedField):
+                prefetch_related.append(lookup)
+            elif isinstance(field, EagerLoadingMixin):
+                child_select, child_prefetch = field.get_eager_loading(lookup + "__")
+                select_related.extend([lookup] + child_select)
+                prefetch_related.extend(child_prefetch)
+        return select_related, prefetch_related
+
+    def setup_eager_loading(self, queryset):
+        select_related, prefetch_related = self.get_eager_loading()
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+
+
 class TenantSerializer(serializers.ModelSerializer):
     def validate_customer(self, value):
         if value:
@@ -58,7 +148,7 @@ class TenantSerializer(serializers.ModelSerializer):
         return value
 
 
-class AppUserSerializer(TenantSerializer):
+class AppUserSerializer(EagerLoadingMixin, TenantSerializer):
     customer = serializers.HiddenField(default=CurrentCustomerDefault(),)
 
     company_name = serializers.SerializerMethodField()
@@ -72,9 +162,10 @@ class AppUserSerializer(TenantSerializer):
     class Meta:
         model = AppUser
         fields = ("customer", "id", "company", "company_name", "name", "email")
+        select_related = {"company_name": ("company",)}
 
 
-class FeatureRequestSerializer(serializers.ModelSerializer):
+class FeatureRequestSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     customer = serializers.HiddenField(default=CurrentCustomerDefault(),)
 
     state_display = serializers.SerializerMethodField()
@@ -100,7 +191,7 @@ class FeatureRequestSerializer(serializers.ModelSerializer):
         )
 
 
-class FeedbackSerializer(serializers.ModelSerializer):
+class FeedbackSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     customer = serializers.HiddenField(default=CurrentCustomerDefault(),)
 
     feedback_type_display = serializers.SerializerMethodField()
@@ -124,7 +215,7 @@ class FeedbackSerializer(serializers.ModelSerializer):
         )
 
 
-class DetailedFeedbackSerializer(serializers.ModelSerializer):
+class DetailedFeedbackSerializer(EagerLoadingMixin, serializers.ModelSerializer):
     customer = serializers.HiddenField(default=CurrentCustomerDefault(),)
 
     feature_request = FeatureRequestSerializer()
@@ -276,9 +367,9 @@ class ChromeExtensionFeedbackSerializer(serializers.Serializer):
             user.id, user.customer, feedback, tracking.EVENT_SOURCE_CE
         )
 
-        OnboardingTask.objects.filter(
-            customer=customer, task_type=OnboardingTask.TASK_CREATE_FEEDBACK_CE
-        ).update(completed=True, updated=timezone.now())
+        OnboardingTask.objects.complete_task(
+            customer.id, OnboardingTask.TASK_CREATE_FEEDBACK_CE
+        )
 
         return {"id": feedback.pk, "first_entry": first_entry}
 
@@ -369,3 +460,287 @@ class OneShotFeedbackSerializer(serializers.Serializer):
             user.id, user.customer, feedback, tracking.EVENT_SOURCE_API
         )
         return {"id": feedback.pk}
+
+
+class BulkFeedbackItemSerializer(OneShotFeedbackSerializer):
+    idempotency_key = serializers.CharField(
+        max_length=255, allow_blank=True, required=False
+    )
+
+
+class BulkFeedbackSerializer(serializers.Serializer):
+    """
+    Creates a batch of feedback in one request. Each item takes the same
+    fields as OneShotFeedbackSerializer plus an optional idempotency_key.
+
+    Items are validated one at a time but app users, feature requests and
+    tags are looked up for the whole batch at once and everything missing is
+    inserted with bulk_create. An invalid item doesn't stop the rest of the
+    batch, the result for each item says what happened to it.
+
+    Items with an idempotency_key we've already seen (in this batch or an
+    earlier one) aren't created again, their result points at the existing
+    feedback. That makes it safe to retry a batch that timed out.
+    """
+
+    MAX_ITEMS = 1000
+
+    STATUS_CREATED = "created"
+    STATUS_EXISTING = "existing"
+    STATUS_INVALID = "invalid"
+
+    items = serializers.ListField(
+        child=serializers.DictField(), allow_empty=False, max_length=MAX_ITEMS
+    )
+
+    def save(self):
+        user = self.context.get("request").user
+        # A concurrent retry of the same batch can insert the same
+        # idempotency keys (or app users) between our lookups and our
+        # inserts. Going round again picks up what it created.
+        for attempt in range(2):
+            try:
+                with transaction.atomic():
+                    results, feedbacks, feature_requests = self.create_items(user)
+                break
+            except IntegrityError:
+                if attempt:
+                    raise
+
+        for feature_request in feature_requests:
+            tracking.feature_request_created(user, tracking.EVENT_SOURCE_API)
+        for feedback in feedbacks:
+            tracking.feedback_created(
+                user.id, user.customer, feedback, tracking.EVENT_SOURCE_API
+            )
+        return {"created": len(feedbacks), "results": results}
+
+    def create_items(self, user):
+        customer = user.customer
+        items = self.validated_data["items"]
+        results = [None] * len(items)
+
+        valid_items = []
+        for index, item in enumerate(items):
+            item_serializer = BulkFeedbackItemSerializer(
+                data=item, context=self.context
+            )
+            if item_serializer.is_valid():
+                valid_items.append((index, item_serializer.validated_data))
+            else:
+                results[index] = {
+                    "status": self.STATUS_INVALID,
+                    "errors": item_serializer.errors,
+                }
+
+        keys = {
+            data.get("idempotency_key")
+            for index, data in valid_items
+            if data.get("idempotency_key")
+        }
+        existing_ids = dict(
+            Feedback.objects.filter(
+                customer=customer, idempotency_key__in=keys
+            ).values_list("idempotency_key", "id")
+        )
+
+        to_create = []
+        repeats = []
+        batch_keys = set()
+        for index, data in valid_items:
+            key = data.get("idempotency_key") or None
+            if key in existing_ids:
+                results[index] = {
+                    "status": self.STATUS_EXISTING,
+                    "id": existing_ids[key],
+                }
+            elif key in batch_keys:
+                repeats.append((index, key))
+            else:
+                if key:
+                    batch_keys.add(key)
+                to_create.append((index, data))
+
+        # Titles are lists in item order so, like creating the items one at
+        # a time, a new feature request or tag gets its first spelling.
+        feature_requests, new_feature_requests = self.get_feature_requests(
+            customer,
+            [
+                data["feature_request_title"]
+                for index, data in to_create
+                if data.get("feature_request_title")
+            ],
+        )
+        app_users = self.get_app_users(customer, [data for index, data in to_create])
+        themes = self.get_themes(
+            customer, [tag for index, data in to_create for tag in data.get("tags", [])]
+        )
+
+        feedbacks = []
+        for index, data in to_create:
+            fr_title = data.get("feature_request_title", "")
+            feedback = Feedback(
+                customer=customer,
+                created_by=user,
+                user=app_users.get(self.get_app_user_key(data)),
+                feature_request=feature_requests.get(fr_title.lower())
+                if fr_title
+                else None,
+                problem=data["problem"],
+                source_url=data.get("source_url", ""),
+                feedback_type=data["feedback_type"],
+                state=data["state"] or Feedback.ACTIVE,
+                source_username="Savio API",
+                idempotency_key=data.get("idempotency_key") or None,
+            )
+            # bulk_create skips save() so render what it would have.
+            feedback.render_markdown()
+            feedback.fingerprint_problem()
+            feedbacks.append(feedback)
+        # Like the one shot API, which saves with override_auto_triage.
+        FeedbackIngestRules.for_customer(customer.id).apply_to_batch(
+            feedbacks, override_auto_triage=True
+        )
+        Feedback.objects.bulk_create(feedbacks)
+
+        FeedbackThemes = Feedback.themes.through
+        feedback_themes = []
+        for (index, data), feedback in zip(to_create, feedbacks):
+            theme_ids = {themes[tag.lower()].pk for tag in data.get("tags", [])}
+            feedback_themes.extend(
+                FeedbackThemes(feedback_id=feedback.pk, theme_id=theme_id)
+                for theme_id in theme_ids
+            )
+            results[index] = {"status": self.STATUS_CREATED, "id": feedback.pk}
+        FeedbackThemes.objects.bulk_create(feedback_themes)
+        # bulk_create doesn't send m2m_changed so count them ourselves.
+        Theme.objects.add_usage(
+            "total_feedback",
+            Counter(feedback_theme.theme_id for feedback_theme in feedback_themes),
+        )
+
+        created_ids = {
+            feedback.idempotency_key: feedback.pk
+            for feedback in feedbacks
+            if feedback.idempotency_key
+        }
+        for index, key in repeats:
+            results[index] = {"status": self.STATUS_EXISTING, "id": created_ids[key]}
+
+        if feedbacks:
+            CustomerStats.objects.feedback_bulk_created(customer.id, feedbacks)
+            OnboardingTask.objects.complete_task(
+                customer.id, OnboardingTask.TASK_CREATE_FEEDBACK
+            )
+        return results, feedbacks, new_feature_requests
+
+    def get_feature_requests(self, customer, titles):
+        # Matched case insensitively like OneShotFeedbackSerializer. Returns
+        # the feature requests keyed by lowercased title and the ones we
+        # had to create.
+        feature_requests = {}
+        for feature_request in (
+            FeatureRequest.objects.annotate(title_lower=Lower("title"))
+            .filter(customer=customer, title_lower__in={t.lower() for t in titles})
+            .order_by("id")
+        ):
+            feature_requests.setdefault(feature_request.title_lower, feature_request)
+
+        new_feature_requests = []
+        for title in titles:
+            if title.lower() not in feature_requests:
+                feature_request = FeatureRequest(customer=customer, title=title)
+                feature_request.render_markdown()
+                feature_requests[title.lower()] = feature_request
+                new_feature_requests.append(feature_request)
+
+        if new_feature_requests:
+            FeatureRequest.objects.bulk_create(new_feature_requests)
+            OnboardingTask.objects.complete_task(
+                customer.id, OnboardingTask.TASK_CREATE_FEATURE_REQUEST
+            )
+        return feature_requests, new_feature_requests
+
+    def get_app_user_key(self, data):
+        email = data.get("person_email", "")
+        name = data.get("person_name", "")
+        if email:
+            return ("email", email.lower())
+        elif name:
+            return ("name", name)
+        return None
+
+    def get_app_users(self, customer, items):
+        """
+        Finds or creates the AppUser for each item, by email if there is one
+        and by name otherwise. Returns them keyed by get_app_user_key.
+        """
+        names_by_email = {}
+        names = set()
+        for data in items:
+            key = self.get_app_user_key(data)
+            if key and key[0] == "email":
+                names_by_email[key[1]] = (
+                    data["person_email"],
+                    data.get("person_name", ""),
+                )
+            elif key:
+                names.add(key[1])
+
+        app_users = {}
+        for app_user in AppUser.objects.annotate(email_lower=Lower("email")).filter(
+            customer=customer, email_lower__in=names_by_email.keys()
+        ):
+            app_users[("email", app_user.email_lower)] = app_user
+            email, name = names_by_email[app_user.email_lower]
+            if name and name != app_user.name:
+                # Like the one shot API the latest name we're sent wins.
+                AppUser.objects.filter(pk=app_user.pk).update(
+                    name=name, updated=timezone.now()
+                )
+                app_user.name = name
+
+        for app_user in AppUser.objects.filter(
+            customer=customer, name__in=names
+        ).order_by("id"):
+            app_users.setdefault(("name", app_user.name), app_user)
+
+        new_app_users = [
+            AppUser(
+                customer=customer,
+                email=email,
+                name=name,
+                email_domain=get_email_domain(email),
+            )
+            for email_lower, (email, name) in names_by_email.items()
+            if ("email", email_lower) not in app_users
+        ] + [
+            AppUser(customer=customer, email=None, name=name)
+            for name in names
+            if ("name", name) not in app_users
+        ]
+        AppUser.objects.bulk_create(new_app_users)
+        for app_user in new_app_users:
+            if app_user.email:
+                app_users[("email", app_user.email.lower())] = app_user
+            else:
+                app_users[("name", app_user.name)] = app_user
+        return app_users
+
+    def get_themes(self, customer, titles):
+        themes = {}
+        for theme in (
+            Theme.objects.annotate(title_lower=Lower("title"))
+            .filter(customer=customer, title_lower__in={t.lower() for t in titles})
+            .order_by("id")
+        ):
+            themes.setdefault(theme.title_lower, theme)
+
+        new_themes = []
+        for title in titles:
+            if title.lower() not in themes:
+                theme = Theme(customer=customer, title=title)
+                themes[title.lower()] = theme
+                new_themes.append(theme)
+        Theme.objects.bulk_create(new_themes)
+        return themes
@@ -0,0 +1,336 @@
+import datetime
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import Customer, User
+from appaccounts.models import AppCompany, AppUser
+from common.purge import Purge
+from feedback.models import (
+    CustomerStats,
+    FeatureRequest,
+    Feedback,
+    FeedbackCountBucket,
+    Theme,
+)
+
+
+class ApiTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer, self.user, self.client = self.create_customer("Acme")
+
+    def create_customer(self, name):
+        customer = Customer.objects.create(name=name)
+        CustomerStats.objects.rebuild(customer.id)
+        user = User.objects.create_user(
+            f"owner@{name.lower()}.example.com",
+            "password",
+            customer=customer,
+            role=User.ROLE_OWNER,
+        )
+        client = APIClient()
+        client.force_authenticate(user)
+        return customer, user, client
+
+    def create_feedback(self, count):
+        start = Feedback.objects.count()
+        for i in range(start, start + count):
+            company = AppCompany.objects.create(customer=self.customer, name=f"Co {i}")
+            app_user = AppUser.objects.create(
+                customer=self.customer,
+                company=company,
+                name=f"User {i}",
+                email=f"user{i}@co{i}.example.com",
+            )
+            feature_request = FeatureRequest.objects.create(
+                customer=self.customer, title=f"Feature {i}"
+            )
+            Feedback.objects.create(
+                customer=self.customer,
+                user=app_user,
+                feature_request=feature_request,
+                problem=f"I need feature {i}",
+                feedback_type=Feedback.EXISTING,
+            )
+
+
+class BulkFeedbackTestCase(ApiTestCase):
+    def post(self, *items, client=None):
+        response = (client or self.client).post(
+            reverse("api-bulk-create-feedback"), {"items": items}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def item(self, problem, **kwargs):
+        return dict(problem=problem, feedback_type=Feedback.EXISTING, **kwargs)
+
+    def get_statuses(self, data):
+        return [result["status"] for result in data["results"]]
+
+    def test_repeated_idempotency_key_in_the_same_batch(self):
+        data = self.post(
+            self.item("Slow search", idempotency_key="a"),
+            self.item("Slow search", idempotency_key="a"),
+        )
+
+        self.assertEqual(data["created"], 1)
+        self.assertEqual(self.get_statuses(data), ["created", "existing"])
+        first, repeat = data["results"]
+        self.assertEqual(first["id"], repeat["id"])
+        self.assertEqual(Feedback.objects.count(), 1)
+
+    def test_idempotency_key_from_an_earlier_batch(self):
+        first = self.post(self.item("Slow search", idempotency_key="a"))
+
+        # Retrying a batch that timed out.
+        data = self.post(
+            self.item("Slow search", idempotency_key="a"),
+            self.item("No dark mode", idempotency_key="b"),
+        )
+
+        self.assertEqual(self.get_statuses(data), ["existing", "created"])
+        self.assertEqual(data["results"][0]["id"], first["results"][0]["id"])
+        self.assertEqual(Feedback.objects.count(), 2)
+        self.assertEqual(CustomerStats.objects.get().total_feedback, 2)
+
+    def test_invalid_items_dont_stop_the_batch(self):
+        data = self.post(
+            self.item("Slow search"),
+            {"problem": "No feedback type"},
+            self.item("No dark mode", person_email="not an email"),
+            self.item("No dark mode"),
+        )
+
+        self.assertEqual(data["created"], 2)
+        self.assertEqual(
+            self.get_statuses(data), ["created", "invalid", "invalid", "created"]
+        )
+        self.assertIn("feedback_type", data["results"][1]["errors"])
+        self.assertIn("person_email", data["results"][2]["errors"])
+        self.assertCountEqual(
+            Feedback.objects.values_list("problem", flat=True),
+            ["Slow search", "No dark mode"],
+        )
+
+    def test_existing_records_are_matched_case_insensitively(self):
+        feature_request = FeatureRequest.objects.create(
+            customer=self.customer, title="Export to CSV"
+        )
+        theme = Theme.objects.create(customer=self.customer, title="Billing")
+        app_user = AppUser.objects.create(
+            customer=self.customer, email="Jane@Example.com", name="J"
+        )
+
+        self.post(
+            self.item(
+                "I need exports",
+                feature_request_title="export to csv",
+                tags=["billing", "BILLING"],
+                person_email="jane@example.com",
+                person_name="Jane",
+            )
+        )
+
+        feedback = Feedback.objects.get()
+        self.assertEqual(feedback.feature_request, feature_request)
+        self.assertEqual(list(feedback.themes.all()), [theme])
+        self.assertEqual(feedback.user, app_user)
+        self.assertEqual(FeatureRequest.objects.count(), 1)
+        self.assertEqual(Theme.objects.count(), 1)
+        self.assertEqual(AppUser.objects.count(), 1)
+        # The latest name we're sent wins, like the one shot API.
+        app_user.refresh_from_db()
+        self.assertEqual(app_user.name, "Jane")
+
+    def test_counters_match_creating_one_at_a_time(self):
+        items = [
+            self.item("Slow search", tags=["Search", "Speed"]),
+            self.item("Slower search", tags=["search"], state=Feedback.PENDING),
+            self.item("No dark mode", tags=["UI"], state=Feedback.ARCHIVED),
+            self.item("Can't export", feature_request_title="Export"),
+        ]
+        other_customer, other_user, other_client = self.create_customer("Other")
+
+        self.post(*items)
+        for item in items:
+            response = other_client.post(
+                reverse("api-create-feedback"), item, format="json"
+            )
+            self.assertEqual(response.status_code, 201)
+
+        def get_counters(customer):
+            stats = CustomerStats.objects.get(customer=customer)
+            return {
+                "total": stats.total_feedback,
+                "active": stats.active_feedback,
+                "pending": stats.pending_feedback,
+                "newest": stats.newest_feedback.problem,
+                "buckets": list(
+                    FeedbackCountBucket.objects.filter(customer=customer)
+                    .order_by("hour")
+                    .values_list("hour", "count")
+                ),
+                "themes": dict(
+                    Theme.objects.filter(customer=customer).values_list(
+                        "title", "total_feedback"
+                    )
+                ),
+            }
+
+        counters = get_counters(self.customer)
+        self.assertEqual(counters, get_counters(other_customer))
+        self.assertEqual(counters["themes"], {"Search": 2, "Speed": 1, "UI": 1})
+
+
+class EagerLoadingTestCase(ApiTestCase):
+    # Each endpoint with its model and, for ?fields=, a couple of cheap
+    # fields and the fields that read a relation.
+    ENDPOINTS = [
+        ("/app/api/feedback/", Feedback, "id,problem", ()),
+        (
+            "/app/api/detailed-feedback/",
+            Feedback,
+            "id,problem",
+            ("user", "feature_request"),
+        ),
+        ("/app/api/featurerequest/", FeatureRequest, "id,title", ()),
+        ("/app/api/users/", AppUser, "id,name", ("company_name",)),
+    ]
+
+    def get(self, url, fields=None):
+        params = {"fields": fields} if fields else {}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), [query["sql"] for query in queries]
+
+    def get_query_counts(self):
+        query_counts = {}
+        for url, model, fields, expensive in self.ENDPOINTS:
+            detail_url = f"{url}{model.objects.last().pk}/"
+            for requested in (None, fields):
+                data, queries = self.get(url, requested)
+                query_counts[url, requested] = len(queries)
+                data, queries = self.get(detail_url, requested)
+                query_counts[url + "<pk>/", requested] = len(queries)
+        return query_counts
+
+    def test_query_count_doesnt_grow_with_rows(self):
+        self.create_feedback(1)
+        # The first request fills the per customer caches.
+        self.get_query_counts()
+        query_counts = self.get_query_counts()
+
+        self.create_feedback(10)
+        self.assertEqual(self.get_query_counts(), query_counts)
+
+    def test_fields_leaves_out_related_rows(self):
+        self.create_feedback(3)
+        for url, model, fields, expensive in self.ENDPOINTS:
+            full, full_queries = self.get(url)
+            sparse, sparse_queries = self.get(url, fields)
+
+            for name in expensive:
+                self.assertIn(name, full["results"][0])
+            for result in sparse["results"]:
+                self.assertEqual(set(result), set(fields.split(",")))
+            if expensive:
+                # The page's query no longer joins the user and company.
+                self.assertIn("appaccounts_appcompany", full_queries[-1])
+                self.assertNotIn("appaccounts_appcompany", sparse_queries[-1])
+
+
+class ConditionalGetTestCase(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_feedback(3)
+        self.feedback = list(Feedback.objects.order_by("id"))
+
+    def set_updated(self, feedback, updated):
+        Feedback.objects.filter(pk=feedback.pk).update(updated=updated)
+
+    def test_if_none_match(self):
+        url = "/app/api/detailed-feedback/"
+        etag = self.client.get(url)["ETag"]
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+        # Changing a nested row changes the ETag too.
+        app_user = self.feedback[0].user
+        app_user.name = "Renamed"
+        app_user.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def assertChangesEtags(self, delete):
+        # Deleting a related row nulls out the feedback's foreign key
+        # without saving the feedback.
+        urls = ["/app/api/feedback/", "/app/api/detailed-feedback/"]
+        etags = [self.client.get(url)["ETag"] for url in urls]
+
+        delete()
+
+        for url, etag in zip(urls, etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, url)
+
+    def test_deleting_a_feature_request_changes_the_etag(self):
+        self.assertChangesEtags(self.feedback[0].feature_request.delete)
+
+    def test_deleting_an_app_user_changes_the_etag(self):
+        self.assertChangesEtags(self.feedback[0].user.delete)
+
+    def test_purging_a_feature_request_changes_the_etag(self):
+        feature_requests = FeatureRequest.objects.filter(
+            pk=self.feedback[0].feature_request_id
+        )
+        self.assertChangesEtags(lambda: Purge("test").run(feature_requests))
+
+    def test_if_modified_since(self):
+        feedback = self.feedback[0]
+        url = f"/app/api/feedback/{feedback.pk}/"
+        last_modified = self.client.get(url)["Last-Modified"]
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        self.set_updated(feedback, timezone.now() + datetime.timedelta(hours=1))
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["id"], feedback.pk)
+
+    def test_invalid_id_is_a_404(self):
+        response = self.client.get("/app/api/feedback/nope/")
+        self.assertEqual(response.status_code, 404)
+
+    def test_updated_since(self):
+        now = timezone.now()
+        f1, f2, f3 = self.feedback
+        self.set_updated(f1, now - datetime.timedelta(days=2))
+        self.set_updated(f2, now)
+        self.set_updated(f3, now - datetime.timedelta(hours=1))
+
+        since = now - datetime.timedelta(days=1)
+        response = self.client.get(
+            "/app/api/feedback/", {"updated_since": since.isoformat()}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        # Oldest change first so pollers can carry on from the last one.
+        self.assertEqual(
+            [result["id"] for result in response.json()["results"]], [f3.pk, f2.pk]
+        )
+
+    def test_invalid_updated_since(self):
+        response = self.client.get("/app/api/feedback/", {"updated_since": "today"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("updated_since", response.json())
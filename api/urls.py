@@ -37,6 +37,8 @@ urlpatterns = [
         name="chrome-get-user-from-token",
     ),
     path("auth/me/", views.check_user_auth, name="api-check-user-auth"),
+    # Before the router so "bulk" isn't taken for a feedback id.
+    path("feedback/bulk/", views.bulk_create_feedback, name="api-bulk-create-feedback"),
     re_path(r"^", include(router.urls)),
     path(
         "chrome-extension/create-feedback/",
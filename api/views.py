@@ -1,15 +1,25 @@
+import hashlib
+from functools import partial
+
+from django.db.models import Count, Max
 from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date, quote_etag
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework import filters, mixins, permissions, status, viewsets
 from rest_framework.decorators import api_view, parser_classes, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
 
 from appaccounts.models import AppUser
-from feedback.models import FeatureRequest, Feedback, FeedbackTemplate
+from feedback.models import FeatureRequest, Feedback, FeedbackIngestRules
 
 from .serializers import (
     AppUserSerializer,
+    BulkFeedbackSerializer,
     ChromeExtensionFeedbackSerializer,
     DetailedFeedbackSerializer,
     FeatureRequestSerializer,
@@ -18,7 +28,128 @@ from .serializers import (
 )
 
 
+class EagerLoadingViewSetMixin(object):
+    """
+    Applies the select_related/prefetch_related lookups the serializer
+    declares (see serializers.EagerLoadingMixin) to the queryset used for
+    list and retrieve so rendering a page doesn't query per row.
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        serializer = self.get_serializer()
+        if hasattr(serializer, "setup_eager_loading"):
+            queryset = serializer.setup_eager_loading(queryset)
+        return queryset
+
+
+class UpdatedSinceFilter(filters.BaseFilterBackend):
+    """
+    `?updated_since=2020-06-01T12:00:00Z` only returns rows changed after
+    that time so pollers can just fetch what's new. Backed by the
+    (customer, updated) indexes.
+    """
+
+    param = "updated_since"
+
+    def filter_queryset(self, request, queryset, view):
+        value = request.query_params.get(self.param)
+        if not value:
+            return queryset
+        try:
+            updated_since = parse_datetime(value)
+        except ValueError:
+            updated_since = None
+        if updated_since is None:
+            raise ValidationError(
+                {self.param: "Expected an ISO 8601 date time e.g. 2020-06-01T12:00:00Z"}
+            )
+        if timezone.is_naive(updated_since):
+            updated_since = timezone.make_aware(updated_since, timezone.utc)
+        return queryset.filter(updated__gt=updated_since).order_by("updated", "id")
+
+
+class ConditionalGetMixin(object):
+    """
+    Adds ETag and Last-Modified headers to list and retrieve responses and
+    answers a matching If-None-Match / If-Modified-Since with a 304 before
+    serializing anything.
+
+    The validators come from one aggregate over the filtered queryset: the
+    newest `updated` of each of `last_modified_fields` and the row count
+    (so deletes change the ETag too). The request's path and query string
+    are part of the ETag so every page, search and field set gets its own.
+    """
+
+    last_modified_fields = ("updated",)
+
+    def get_validators(self, queryset):
+        aggregates = {
+            f"last_modified_{index}": Max(field)
+            for index, field in enumerate(self.last_modified_fields)
+        }
+        result = queryset.order_by().aggregate(
+            total=Count("pk", distinct=True), **aggregates
+        )
+        timestamps = [
+            value
+            for name, value in result.items()
+            if name != "total" and value is not None
+        ]
+        last_modified = max(timestamps) if timestamps else None
+        marker = "|".join(
+            [
+                type(self).__name__,
+                str(self.request.user.customer_id),
+                self.request.get_full_path(),
+                last_modified.isoformat() if last_modified else "",
+                str(result["total"]),
+            ]
+        )
+        etag = quote_etag(hashlib.md5(marker.encode("utf-8")).hexdigest())
+        return etag, last_modified
+
+    def conditional_response(self, queryset, get_response):
+        etag, last_modified = self.get_validators(queryset)
+        last_modified_timestamp = (
+            int(last_modified.timestamp()) if last_modified else None
+        )
+        not_modified = get_conditional_response(
+            self.request._request, etag=etag, last_modified=last_modified_timestamp
+        )
+        if not_modified is not None:
+            not_modified["ETag"] = etag
+            return not_modified
+
+        response = get_response()
+        if response.status_code == status.HTTP_200_OK:
+            response["ETag"] = etag
+            if last_modified_timestamp is not None:
+                response["Last-Modified"] = http_date(last_modified_timestamp)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return self.conditional_response(
+            queryset, partial(super().list, request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        get_response = partial(super().retrieve, request, *args, **kwargs)
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            queryset = self.filter_queryset(self.get_queryset()).filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )
+        except (TypeError, ValueError):
+            # Not a valid id. Let get_object() turn it into a 404.
+            return get_response()
+        return self.conditional_response(queryset, get_response)
+
+
 class CreateListRetrieveViewSet(
+    ConditionalGetMixin,
+    EagerLoadingViewSetMixin,
     mixins.CreateModelMixin,
     mixins.ListModelMixin,
     mixins.RetrieveModelMixin,
@@ -35,7 +166,11 @@ class CreateListRetrieveViewSet(
 
 
 class ListRetrieveViewSet(
-    mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet,
+    ConditionalGetMixin,
+    EagerLoadingViewSetMixin,
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
+    viewsets.GenericViewSet,
 ):
     """
     A viewset that provides `retrieve`, `create`, and `list` actions.
@@ -70,7 +205,7 @@ class ListRetrieveViewSet(
 
 class AppUserViewSet(CreateListRetrieveViewSet):
     serializer_class = AppUserSerializer
-    filter_backends = (filters.SearchFilter,)
+    filter_backends = (filters.SearchFilter, UpdatedSinceFilter)
     search_fields = ("name", "email")
     permission_classes = (permissions.IsAuthenticated,)
 
@@ -80,7 +215,7 @@ class AppUserViewSet(CreateListRetrieveViewSet):
 
 class FeedbackViewSet(ListRetrieveViewSet):
     serializer_class = FeedbackSerializer
-    filter_backends = (filters.SearchFilter,)
+    filter_backends = (filters.SearchFilter, UpdatedSinceFilter)
     search_fields = ("problem", "solution", "user__company__name")
     permission_classes = (permissions.IsAuthenticated,)
 
@@ -90,7 +225,14 @@ class FeedbackViewSet(ListRetrieveViewSet):
 
 class DetailedFeedbackViewSet(ListRetrieveViewSet):
     serializer_class = DetailedFeedbackSerializer
-    filter_backends = (filters.SearchFilter,)
+    # The nested feature request and user are part of the response too.
+    last_modified_fields = (
+        "updated",
+        "feature_request__updated",
+        "user__updated",
+        "user__company__updated",
+    )
+    filter_backends = (filters.SearchFilter, UpdatedSinceFilter)
     search_fields = ("problem", "solution", "user__company__name")
     permission_classes = (permissions.IsAuthenticated,)
 
@@ -100,7 +242,7 @@ class DetailedFeedbackViewSet(ListRetrieveViewSet):
 
 class FeatureRequestViewSet(ListRetrieveViewSet):
     serializer_class = FeatureRequestSerializer
-    filter_backends = (filters.SearchFilter,)
+    filter_backends = (filters.SearchFilter, UpdatedSinceFilter)
     search_fields = (
         "title",
         "description",
@@ -142,6 +284,19 @@ def create_feedback(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@csrf_exempt
+@api_view(
+    ["POST",]
+)
+@parser_classes([JSONParser])
+@permission_classes((permissions.IsAuthenticated,))
+def bulk_create_feedback(request):
+    serializer = BulkFeedbackSerializer(data=request.data, context={"request": request})
+    if serializer.is_valid():
+        return Response(serializer.save(), status=status.HTTP_200_OK)
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
 @csrf_exempt
 @api_view(
     ["GET",]
@@ -178,10 +333,7 @@ def get_user_from_auth_token(request):
     # can be customized.  Examples: user permissions around being able to create feature
     # requests from the CE, and the problem template.
 
-    try:
-        ft = FeedbackTemplate.objects.get(customer_id=request.user.customer.id).template
-    except FeedbackTemplate.DoesNotExist:
-        ft = ""
+    ft = FeedbackIngestRules.for_customer(request.user.customer.id).template or ""
 
     data = {
         "id": request.user.id,
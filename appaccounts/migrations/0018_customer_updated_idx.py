@@ -0,0 +1,17 @@
+# Generated by Django 2.1.3 on 2026-10-19 13:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appaccounts', '0017_add_indexes_to_appuser_email_and_name'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appuser',
+            index=models.Index(fields=['customer', 'updated'], name='appuser_customer_updated'),
+        ),
+    ]
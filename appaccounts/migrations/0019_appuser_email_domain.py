@@ -0,0 +1,27 @@
+# Generated by Django 2.1.3 on 2026-10-19 13:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appaccounts', '0018_customer_updated_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appuser',
+            name='email_domain',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        # Same as get_email_domain().
+        migrations.RunSQL(
+            "UPDATE appaccounts_appuser SET email_domain = LOWER(TRIM(SUBSTRING(email FROM '@([^@]*)$'))) WHERE email LIKE '%@%';",
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='appuser',
+            index=models.Index(fields=['customer', 'email_domain'], name='appuser_email_domain'),
+        ),
+    ]
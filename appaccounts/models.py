@@ -1,9 +1,13 @@
 from django.contrib.postgres.fields import JSONField
 from django.contrib.postgres.indexes import GinIndex
 from django.core.cache import cache
-from django.db import IntegrityError, models
+from django.db import IntegrityError, connections, models
+from django.db.models import Q
+from django.utils import timezone
 
 from accounts.models import Customer
+from common.cache import get_customer_cache_key
+from common.utils import markdown_hash
 
 # NB: Dealing with uniqueness i.e. create vs. update for data sync cases
 # The scenario here look like this:
@@ -32,6 +36,23 @@ from accounts.models import Customer
 # as there are likely some edge caeses hiding in here.
 
 
+DOMAIN_COMPANY_CACHE_TIMEOUT = 24 * 60 * 60
+# Cached in place of a company id when a domain doesn't map to exactly one.
+NO_COMPANY = 0
+
+
+def get_email_domain(email):
+    if not email or "@" not in email:
+        return ""
+    return email.rsplit("@", 1)[1].strip().lower()
+
+
+def get_domain_company_cache_key(customer_id, domain):
+    return get_customer_cache_key(
+        customer_id, f"domain_company_{markdown_hash(domain)}"
+    )
+
+
 class FilterableAttributeManager(models.Manager):
     def get_mrr_lookup(self, customer):
         fa = self.get_mrr_attribute(customer)
@@ -191,10 +212,12 @@ class FilterableAttribute(models.Model):
             raise Exception(f"Invalid type: {self.attribute_type}.")
 
     def get_cache_key(self):
-        return f"filterable_attribute_choices_{self.id}"
+        return get_customer_cache_key(
+            self.customer_id, f"filterable_attribute_choices_{self.id}"
+        )
 
     def refresh_cache(self):
-        return cache.set(self.get_cache_key(), None)
+        return cache.delete(self.get_cache_key())
 
     def get_choices(self):
         cached_value = cache.get(self.get_cache_key())
@@ -241,28 +264,46 @@ class FilterableAttribute(models.Model):
 
 class AppCompanyManager(models.Manager):
     def guess_company(self, customer, email):
-        company = None
-        try:
-            # Just the domain if they've passed the whole thing
-            domain = email.split("@")[1]
-            domain = f"@{domain}"
-            candidate_company_ids = (
-                AppUser.objects.filter(
-                    customer=customer, email__icontains=domain, company__isnull=False
-                )
-                .values_list("company_id", flat=True)
-                .distinct()
-            )
-            if candidate_company_ids.count() == 1:
-                # All the AppUsers with a company with that email domain
-                # have the same company so it's safe to auto set the company
-                company = AppCompany.objects.get(
-                    customer=customer, id=candidate_company_ids[0]
-                )
-        except IndexError:
-            pass
+        """
+        Returns the company every AppUser with a company and the same email
+        domain belongs to, or None if there isn't exactly one.
+
+        The answer for each domain is cached. AppUser.save() and delete()
+        drop the entry for their domain when they might change it.
+        """
+        domain = get_email_domain(email)
+        if not domain:
+            return None
+
+        cache_key = get_domain_company_cache_key(customer.id, domain)
+        company_id = cache.get(cache_key)
+        if company_id is None:
+            company_id = self.get_company_id_for_domain(customer, domain)
+            cache.set(cache_key, company_id, DOMAIN_COMPANY_CACHE_TIMEOUT)
+        if company_id == NO_COMPANY:
+            return None
+
+        company = self.filter(customer=customer, id=company_id).first()
+        if company is None:
+            # Deleted since we cached it. Deleting a company cascades to its
+            # users without calling their delete().
+            cache.delete(cache_key)
         return company
 
+    def get_company_id_for_domain(self, customer, domain):
+        candidate_company_ids = list(
+            AppUser.objects.filter(
+                customer=customer, email_domain=domain, company__isnull=False
+            )
+            .values_list("company_id", flat=True)
+            .distinct()[:2]
+        )
+        if len(candidate_company_ids) == 1:
+            # All the AppUsers with a company with that email domain
+            # have the same company so it's safe to auto set the company
+            return candidate_company_ids[0]
+        return NO_COMPANY
+
 
 class AppCompany(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
@@ -299,31 +340,116 @@ class AppCompany(models.Model):
 
 
 class AppUserManager(models.Manager):
+    # The order we trust each id in when they point at different AppUsers.
+    # Remote ids come from the integration which handles uniqueness for us,
+    # see the note at the top of this file.
+    MATCH_PRECEDENCE = ("remote_id", "internal_id", "email")
+
+    def resolve_users(self, customer, identities, precedence=MATCH_PRECEDENCE):
+        """
+        Finds the existing AppUser for each identity in one query.
+        `identities` is a list of dicts with any of remote_id, internal_id
+        and email. Returns a list in the same order holding the AppUser
+        matched by the first id in `precedence` that matches anyone, or None.
+        """
+        values = {field: set() for field in precedence}
+        for identity in identities:
+            for field in precedence:
+                if identity.get(field):
+                    values[field].add(identity[field])
+
+        lookup = Q()
+        for field, field_values in values.items():
+            if field_values:
+                lookup |= Q(**{f"{field}__in": field_values})
+        if not lookup:
+            return [None] * len(identities)
+
+        users_by_id = {}
+        for user in self.get_queryset().filter(lookup, customer=customer):
+            for field in precedence:
+                if getattr(user, field):
+                    users_by_id[(field, getattr(user, field))] = user
+
+        resolved = []
+        for identity in identities:
+            user = None
+            for field in precedence:
+                if identity.get(field) and (field, identity[field]) in users_by_id:
+                    user = users_by_id[(field, identity[field])]
+                    break
+            resolved.append(user)
+        return resolved
+
     def get_best_match_user(self, customer, email, remote_id, internal_id):
-        users = self.get_queryset().filter(customer=customer)
-        found = False
-        user = None
-        if remote_id:
-            try:
-                user = users.get(remote_id=remote_id)
-            except AppUser.DoesNotExist:
-                pass
-
-        if not found and internal_id:
-            try:
-                user = users.get(internal_id=internal_id)
-            except AppUser.DoesNotExist:
-                pass
-
-        if not found and email:
-            try:
-                user = users.get(email=email)
-            except AppUser.DoesNotExist:
-                pass
-        return user
+        return self.resolve_users(
+            customer,
+            [{"remote_id": remote_id, "internal_id": internal_id, "email": email}],
+        )[0]
+
+    def insert_if_new(self, user):
+        """
+        Saves a new AppUser with INSERT ... ON CONFLICT DO NOTHING. Returns
+        False, leaving `user` unsaved, if one of its unique ids is already
+        taken.
+        """
+        user.email_domain = get_email_domain(user.email)
+        connection = connections[self.db]
+        quote_name = connection.ops.quote_name
+        fields = [
+            field
+            for field in self.model._meta.local_concrete_fields
+            if not isinstance(field, models.AutoField)
+        ]
+        values = [
+            field.get_db_prep_save(field.pre_save(user, True), connection)
+            for field in fields
+        ]
+        sql = "INSERT INTO {} ({}) VALUES ({}) ON CONFLICT DO NOTHING RETURNING {}".format(
+            quote_name(self.model._meta.db_table),
+            ", ".join(quote_name(field.column) for field in fields),
+            ", ".join(["%s"] * len(fields)),
+            quote_name(self.model._meta.pk.column),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, values)
+            row = cursor.fetchone()
+        if row is None:
+            return False
+
+        user.pk = row[0]
+        user._state.adding = False
+        user._state.db = self.db
+        # What save() would have done.
+        user.forget_domain_company(user.email_domain, user.company_id)
+        user._loaded_domain_company = (user.email_domain, user.company_id)
+        return True
+
+    def upsert(self, customer, lookups, values, precedence):
+        """
+        Updates the AppUser matching `lookups` (see resolve_users) with
+        `values` or creates one. A clash with someone else's ids raises
+        IntegrityError, e.g. when the email belongs to one AppUser and the
+        remote_id to another. Those need merging by hand.
+        """
+        user = self.resolve_users(customer, [lookups], precedence)[0]
+        if user is None:
+            user = self.model(customer=customer, **values)
+            if self.insert_if_new(user):
+                return user, True
+            # Either someone else just created them or they clash with an
+            # AppUser on an id we weren't looking up by.
+            user = self.resolve_users(customer, [lookups], precedence)[0]
+            if user is None:
+                raise IntegrityError(f"AppUser clashes with an existing one: {values}")
+
+        for name, value in values.items():
+            setattr(user, name, value)
+        user.save()
+        return user, False
 
     def update_or_create_by_email_or_remote_id(
-        self, customer, email, remote_id, defaults=dict()
+        self, customer, email, remote_id, defaults=None
     ):
         # First try and update the AppUser with the matching email otherwise try and
         # update by the remote_id. The main case we care about is if the user manually
@@ -333,41 +459,27 @@ class AppUserManager(models.Manager):
         # This code doesn't handle cases where the user manually created an AppUser with a
         # given email, a remote gets created w/o an email and then the email gets added
         # later. That case requires a merge and it's not clear that we want to be auto-merging.
-        # We aren't swallowing the error so the logs will start complaining if that happens.
+        # upsert() raises IntegrityError so the logs will start complaining if that happens.
         # We also have some weirdness with remote_id and internal_id. Right now Segment
         # uses internal_id and Intercom uses remote_id. It's not clear that's a great idea.
         assert remote_id
-        if email:
-            try:
-                defaults["remote_id"] = remote_id
-                return self.get_queryset().update_or_create(
-                    customer=customer, email=email, defaults=defaults,
-                )
-            except IntegrityError:
-                pass
-
-        defaults["email"] = email or None
-        return self.get_queryset().update_or_create(
-            customer=customer, remote_id=remote_id, defaults=defaults,
+        return self.upsert(
+            customer,
+            {"email": email, "remote_id": remote_id},
+            {**(defaults or {}), "email": email or None, "remote_id": remote_id},
+            ("email", "remote_id"),
         )
 
     def update_or_create_by_email_or_internal_id(
-        self, customer, email, internal_id, defaults=dict()
+        self, customer, email, internal_id, defaults=None
     ):
         # See update_or_create_by_email_or_remote_id
         assert internal_id
-        if email:
-            try:
-                defaults["internal_id"] = internal_id
-                return self.get_queryset().update_or_create(
-                    customer=customer, email=email, defaults=defaults,
-                )
-            except IntegrityError:
-                pass
-
-        defaults["email"] = email or None
-        return self.get_queryset().update_or_create(
-            customer=customer, internal_id=internal_id, defaults=defaults,
+        return self.upsert(
+            customer,
+            {"email": email, "internal_id": internal_id},
+            {**(defaults or {}), "email": email or None, "internal_id": internal_id},
+            ("email", "internal_id"),
         )
 
     def merge(self, to_keep, to_delete):
@@ -387,7 +499,7 @@ class AppUserManager(models.Manager):
             new_val = getattr(to_keep, attr_name) or getattr(to_delete, attr_name)
             setattr(to_keep, attr_name, new_val)
 
-        to_delete.feedback_set.update(user=to_keep)
+        to_delete.feedback_set.update(user=to_keep, updated=timezone.now())
         company = to_delete.company
         to_delete.delete()
         to_keep.save()
@@ -411,6 +523,8 @@ class AppUser(models.Model):
     email = models.EmailField(
         blank=True, null=True
     )  # AppUsers via importers might not have an email
+    # Lower cased, for guessing companies. Kept up to date by save().
+    email_domain = models.CharField(max_length=255, blank=True, editable=False)
     phone = models.CharField(max_length=30, blank=True)
     filterable_attributes = JSONField(default=dict)
     import_token = models.CharField(
@@ -436,8 +550,54 @@ class AppUser(models.Model):
         # for that in Django 2.1 and I don't want to take the time to write one.
         indexes = [
             GinIndex(fields=["filterable_attributes"], name="appuser_fa_gin",),
+            # API updated_since polling and conditional GETs.
+            models.Index(
+                fields=["customer", "updated"], name="appuser_customer_updated"
+            ),
+            # AppCompanyManager.guess_company
+            models.Index(
+                fields=["customer", "email_domain"], name="appuser_email_domain"
+            ),
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what we loaded so save() knows if the guessed company
+        # for the domain might have changed.
+        instance._loaded_domain_company = (
+            instance.__dict__.get("email_domain"),
+            instance.__dict__.get("company_id"),
+        )
+        return instance
+
+    def save(self, *args, **kwargs):
+        self.email_domain = get_email_domain(self.email)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "email" in update_fields:
+            kwargs["update_fields"] = list(update_fields) + ["email_domain"]
+        super().save(*args, **kwargs)
+
+        loaded = getattr(self, "_loaded_domain_company", (None, None))
+        current = (self.email_domain, self.company_id)
+        if current != loaded:
+            self.forget_domain_company(*loaded)
+            self.forget_domain_company(*current)
+        self._loaded_domain_company = current
+
+    def delete(self, *args, **kwargs):
+        self.forget_domain_company(
+            *getattr(
+                self, "_loaded_domain_company", (self.email_domain, self.company_id)
+            )
+        )
+        return super().delete(*args, **kwargs)
+
+    def forget_domain_company(self, domain, company_id):
+        # Only users with a company count towards the guess.
+        if domain and company_id:
+            cache.delete(get_domain_company_cache_key(self.customer_id, domain))
+
     def get_attribute_value_from_company_or_user(self, fa):
         if fa is None:
             value = None
@@ -1,3 +1,188 @@
+from django.db import IntegrityError, transaction
 from django.test import TestCase
 
-# Create your tests here.
+from accounts.models import Customer
+
+from .models import AppCompany, AppUser
+
+
+class AppUserTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = Customer.objects.create(name="Acme")
+
+    def create_user(self, **kwargs):
+        return AppUser.objects.create(customer=self.customer, name="Someone", **kwargs)
+
+
+class GuessCompanyTestCase(AppUserTestCase):
+    def setUp(self):
+        super().setUp()
+        self.acme = AppCompany.objects.create(customer=self.customer, name="Acme")
+        self.user = self.create_user(email="jane@acme.example.com", company=self.acme)
+
+    def guess(self, email="someone@ACME.example.com"):
+        return AppCompany.objects.guess_company(self.customer, email)
+
+    def test_guess(self):
+        self.assertEqual(self.guess(), self.acme)
+        self.assertIsNone(self.guess("someone@other.example.com"))
+        self.assertIsNone(self.guess("not an email"))
+
+    def test_guess_is_cached(self):
+        self.guess()
+        # Just loading the company.
+        with self.assertNumQueries(1):
+            self.assertEqual(self.guess(), self.acme)
+
+    def test_two_companies_on_a_domain(self):
+        self.assertEqual(self.guess(), self.acme)
+        other = AppCompany.objects.create(customer=self.customer, name="Acme EU")
+        self.create_user(email="bob@acme.example.com", company=other)
+
+        self.assertIsNone(self.guess())
+
+    def test_changing_email_drops_the_guess(self):
+        self.assertEqual(self.guess(), self.acme)
+        self.assertIsNone(self.guess("someone@new.example.com"))
+
+        user = AppUser.objects.get(pk=self.user.pk)
+        user.email = "jane@new.example.com"
+        user.save()
+
+        self.assertIsNone(self.guess())
+        self.assertEqual(self.guess("someone@new.example.com"), self.acme)
+
+    def test_changing_company_drops_the_guess(self):
+        self.assertEqual(self.guess(), self.acme)
+        other = AppCompany.objects.create(customer=self.customer, name="Acme Inc")
+
+        user = AppUser.objects.get(pk=self.user.pk)
+        user.company = other
+        user.save()
+
+        self.assertEqual(self.guess(), other)
+
+    def test_deleted_company_isnt_returned(self):
+        self.assertEqual(self.guess(), self.acme)
+
+        # Cascades to the user without calling AppUser.delete().
+        self.acme.delete()
+
+        self.assertIsNone(self.guess())
+        self.assertFalse(AppUser.objects.exists())
+
+
+class ResolveUsersTestCase(AppUserTestCase):
+    def resolve(self, *identities, **kwargs):
+        return AppUser.objects.resolve_users(self.customer, identities, **kwargs)
+
+    def test_remote_id_beats_email(self):
+        by_remote_id = self.create_user(remote_id="r1", email="old@example.com")
+        by_email = self.create_user(email="jane@example.com")
+
+        # The ids point at different users.
+        identity = {"remote_id": "r1", "email": "jane@example.com"}
+        self.assertEqual(self.resolve(identity), [by_remote_id])
+        self.assertEqual(
+            self.resolve(identity, precedence=("email", "remote_id")), [by_email]
+        )
+        self.assertEqual(
+            AppUser.objects.get_best_match_user(
+                self.customer, "jane@example.com", "r1", None
+            ),
+            by_remote_id,
+        )
+
+    def test_falls_back_to_the_next_id(self):
+        by_internal_id = self.create_user(internal_id="i1")
+        by_email = self.create_user(email="jane@example.com")
+
+        self.assertEqual(
+            self.resolve(
+                {"remote_id": "nope", "internal_id": "i1", "email": "jane@example.com"},
+                {"remote_id": "nope", "email": "jane@example.com"},
+            ),
+            [by_internal_id, by_email],
+        )
+
+    def test_batch_keeps_the_input_order(self):
+        jane = self.create_user(email="jane@example.com")
+        bob = self.create_user(remote_id="r2")
+        other_customer = Customer.objects.create(name="Other")
+        AppUser.objects.create(customer=other_customer, name="Sam", remote_id="r3")
+
+        with self.assertNumQueries(1):
+            resolved = self.resolve(
+                {"remote_id": "r2"},
+                {},
+                {"email": "jane@example.com"},
+                {"remote_id": "r3"},
+                {"remote_id": "r2", "email": None},
+            )
+
+        self.assertEqual(resolved, [bob, None, jane, None, bob])
+
+    def test_no_ids(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.resolve({}, {"email": ""}), [None, None])
+
+
+class InsertIfNewTestCase(AppUserTestCase):
+    def test_inserts(self):
+        user = AppUser(customer=self.customer, name="Jane", email="Jane@Example.com")
+
+        self.assertTrue(AppUser.objects.insert_if_new(user))
+
+        self.assertIsNotNone(user.pk)
+        saved = AppUser.objects.get()
+        self.assertEqual(saved, user)
+        self.assertEqual(saved.email_domain, "example.com")
+
+    def test_unique_clash(self):
+        existing = self.create_user(email="jane@example.com")
+        user = AppUser(customer=self.customer, name="Jane", email="jane@example.com")
+
+        with transaction.atomic():
+            self.assertFalse(AppUser.objects.insert_if_new(user))
+            # The transaction can carry on, nothing was raised inside it.
+            self.assertEqual(list(AppUser.objects.all()), [existing])
+
+        self.assertIsNone(user.pk)
+
+
+class UpdateOrCreateTestCase(AppUserTestCase):
+    def test_creates_then_updates(self):
+        user, created = AppUser.objects.update_or_create_by_email_or_remote_id(
+            self.customer, "jane@example.com", "r1", {"name": "Jane"}
+        )
+        self.assertTrue(created)
+
+        # Matched by email even though the remote id is new.
+        same, created = AppUser.objects.update_or_create_by_email_or_remote_id(
+            self.customer, "jane@example.com", "r2", {"name": "Jane Doe"}
+        )
+
+        self.assertFalse(created)
+        self.assertEqual(same, user)
+        user.refresh_from_db()
+        self.assertEqual((user.name, user.remote_id), ("Jane Doe", "r2"))
+
+    def test_clash_raises(self):
+        self.create_user(email="jane@example.com")
+        self.create_user(remote_id="r1")
+
+        # The email and the remote id belong to different users.
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            AppUser.objects.update_or_create_by_email_or_remote_id(
+                self.customer, "jane@example.com", "r1", {"name": "Jane"}
+            )
+
+    def test_clash_on_an_id_we_dont_look_up_by_raises(self):
+        self.create_user(remote_id="r1")
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            AppUser.objects.update_or_create_by_email_or_internal_id(
+                self.customer, "jane@example.com", "i1", {"remote_id": "r1"}
+            )
+        self.assertEqual(AppUser.objects.count(), 1)
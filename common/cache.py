@@ -0,0 +1,326 @@
+import logging
+import pickle
+import re
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+import redis
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Everything up to the first part of the key with a digit in it, e.g.
+# "markdownify_3f2a..." -> "markdownify", "dummy_data_c12v3" ->
+# "dummy_data".
+KEY_FAMILY_REGEX = re.compile(r"^(.*?)(?:_[^_]*\d.*)?$")
+
+logger = logging.getLogger(__name__)
+
+CUSTOMER_NAMESPACE_TIMEOUT = 30 * 24 * 60 * 60
+
+
+class LocalLRU(object):
+    """
+    A small thread safe in-process cache with a TTL per entry and least
+    recently used eviction once it holds `max_entries`.
+    """
+
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return False, None
+            self.entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, timeout=None):
+        if timeout is None or timeout > self.timeout:
+            timeout = self.timeout
+        with self.lock:
+            self.entries[key] = (time.monotonic() + timeout, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class TieredRedisCache(BaseCache):
+    """
+    A cache backend shared by every web and Celery process via Redis with a
+    small in-process LRU (L1) in front of it.
+
+    Reads check the L1 first. Writes and deletes go to Redis and drop the
+    local L1 copy. Other processes can keep serving their L1 copy for up to
+    L1_TIMEOUT seconds so keep that short.
+
+    Hits and misses are counted per key family (see get_family) in each
+    process, get_metrics() returns them.
+
+    Redis being down or slow doesn't take the site with it. Errors are
+    logged, reads count as misses and writes and deletes are best effort.
+    incr() raises ValueError as though the key were missing.
+
+    OPTIONS:
+        L1_MAX_ENTRIES: How many values each process keeps. 0 disables L1.
+        L1_TIMEOUT: The most seconds a value lives in L1.
+        SOCKET_TIMEOUT: Seconds to wait on Redis.
+    """
+
+    def __init__(self, server, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self.client = redis.StrictRedis.from_url(
+            server, socket_timeout=options.get("SOCKET_TIMEOUT", 1)
+        )
+        self.l1_max_entries = options.get("L1_MAX_ENTRIES", 1000)
+        self.l1 = LocalLRU(self.l1_max_entries, options.get("L1_TIMEOUT", 5))
+        self.metrics = defaultdict(lambda: {"l1_hits": 0, "hits": 0, "misses": 0})
+        self.metrics_lock = threading.Lock()
+
+    def get_family(self, key):
+        return KEY_FAMILY_REGEX.match(key).group(1)
+
+    def record(self, key, outcome):
+        with self.metrics_lock:
+            self.metrics[self.get_family(key)][outcome] += 1
+
+    def get_metrics(self):
+        with self.metrics_lock:
+            return {family: dict(counts) for family, counts in self.metrics.items()}
+
+    def log_error(self, operation, error):
+        logger.warning(f"Redis {operation} failed: {error!r}")
+
+    def encode(self, value):
+        # Ints are stored as plain numbers so incr()/decr() can use INCRBY.
+        if type(value) is int:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def decode(self, value):
+        try:
+            return int(value)
+        except (ValueError, UnicodeDecodeError):
+            return pickle.loads(value)
+
+    def get_redis_timeout(self, timeout):
+        # None for no expiry, or whole milliseconds for SET's PX. Unlike
+        # get_backend_timeout this stays relative.
+        if timeout == DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return None
+        return max(int(timeout * 1000), 1)
+
+    def get_l1(self, key):
+        if not self.l1_max_entries:
+            return False, None
+        return self.l1.get(key)
+
+    def set_l1(self, key, raw_value):
+        # The encoded value is kept so every hit gets its own copy, like it
+        # would from Redis.
+        if self.l1_max_entries:
+            self.l1.set(key, raw_value)
+
+    def get(self, key, default=None, version=None):
+        cache_key = self.make_key(key, version=version)
+        self.validate_key(cache_key)
+        found, raw_value = self.get_l1(cache_key)
+        if found:
+            self.record(key, "l1_hits")
+            return self.decode(raw_value)
+
+        try:
+            raw_value = self.client.get(cache_key)
+        except redis.RedisError as e:
+            self.log_error("get", e)
+            raw_value = None
+        if raw_value is None:
+            self.record(key, "misses")
+            return default
+        self.record(key, "hits")
+        self.set_l1(cache_key, raw_value)
+        return self.decode(raw_value)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        try:
+            self.client.set(key, self.encode(value), px=self.get_redis_timeout(timeout))
+        except redis.RedisError as e:
+            self.log_error("set", e)
+        self.l1.delete(key)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        try:
+            added = self.client.set(
+                key, self.encode(value), px=self.get_redis_timeout(timeout), nx=True
+            )
+        except redis.RedisError as e:
+            self.log_error("add", e)
+            added = False
+        # Another process may have replaced the value since we cached it.
+        self.l1.delete(key)
+        return bool(added)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        timeout = self.get_redis_timeout(timeout)
+        try:
+            if timeout is None:
+                return bool(self.client.persist(key))
+            return bool(self.client.pexpire(key, timeout))
+        except redis.RedisError as e:
+            self.log_error("touch", e)
+            return False
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        try:
+            self.client.delete(key)
+        except redis.RedisError as e:
+            self.log_error("delete", e)
+        self.l1.delete(key)
+
+    def get_many(self, keys, version=None):
+        keys_by_cache_key = {self.make_key(key, version=version): key for key in keys}
+        found = {}
+        missing = []
+        for cache_key, key in keys_by_cache_key.items():
+            self.validate_key(cache_key)
+            in_l1, raw_value = self.get_l1(cache_key)
+            if in_l1:
+                self.record(key, "l1_hits")
+                found[key] = self.decode(raw_value)
+            else:
+                missing.append(cache_key)
+
+        if missing:
+            try:
+                raw_values = self.client.mget(missing)
+            except redis.RedisError as e:
+                self.log_error("get_many", e)
+                raw_values = [None] * len(missing)
+            for cache_key, raw_value in zip(missing, raw_values):
+                key = keys_by_cache_key[cache_key]
+                if raw_value is None:
+                    self.record(key, "misses")
+                    continue
+                self.record(key, "hits")
+                self.set_l1(cache_key, raw_value)
+                found[key] = self.decode(raw_value)
+        return found
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self.get_redis_timeout(timeout)
+        pipeline = self.client.pipeline()
+        for key, value in data.items():
+            key = self.make_key(key, version=version)
+            self.validate_key(key)
+            pipeline.set(key, self.encode(value), px=timeout)
+            self.l1.delete(key)
+        try:
+            pipeline.execute()
+        except redis.RedisError as e:
+            self.log_error("set_many", e)
+            return list(data)
+        return []
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version=version) for key in keys]
+        if keys:
+            try:
+                self.client.delete(*keys)
+            except redis.RedisError as e:
+                self.log_error("delete_many", e)
+        for key in keys:
+            self.l1.delete(key)
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        try:
+            return bool(self.client.exists(key))
+        except redis.RedisError as e:
+            self.log_error("has_key", e)
+            return False
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        # INCRBY would create a missing key but Django expects a ValueError.
+        # The script keeps the check and the increment atomic.
+        try:
+            value = self.client.eval(
+                "if redis.call('exists', KEYS[1]) == 1 then "
+                "return redis.call('incrby', KEYS[1], ARGV[1]) end",
+                1,
+                key,
+                delta,
+            )
+        except redis.RedisError as e:
+            self.log_error("incr", e)
+            value = None
+        if value is None:
+            raise ValueError(f"Key '{key}' not found")
+        self.l1.delete(key)
+        return value
+
+    def clear(self):
+        # Only our keys, the same Redis might be shared with Celery.
+        try:
+            for key in self.client.scan_iter(match=f"{self.key_prefix}*"):
+                self.client.delete(key)
+        except redis.RedisError as e:
+            self.log_error("clear", e)
+        self.l1.clear()
+
+
+def get_customer_namespace_key(customer_id):
+    return f"customer_{customer_id}_namespace"
+
+
+def get_customer_cache_key(customer_id, key):
+    """
+    Suffixes `key` with the customer's current namespace version so
+    invalidate_customer_cache can drop every key for a customer at once.
+    """
+    namespace = cache.get_or_set(
+        get_customer_namespace_key(customer_id), 1, CUSTOMER_NAMESPACE_TIMEOUT
+    )
+    return f"{key}_c{customer_id}v{namespace}"
+
+
+def invalidate_customer_cache(customer_id):
+    """
+    Moves the customer onto a new namespace version. Their old keys are
+    never read again and just expire.
+    """
+    try:
+        cache.incr(get_customer_namespace_key(customer_id))
+    except ValueError:
+        cache.set(
+            get_customer_namespace_key(customer_id), 2, CUSTOMER_NAMESPACE_TIMEOUT
+        )
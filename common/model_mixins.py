@@ -1,32 +1,41 @@
-from django.forms import model_to_dict
-
-class InitialsMixin(object):
+class TrackedFieldsMixin(object):
     """
-    Saves all initial model field values in '._initial' dictionary.
-
-    Useful for doing comparison checks later (for example: in .save())
+    Remembers the values the fields named in `tracked_fields` had when the
+    instance was created or loaded so save() can tell what changed.
 
-    NB: This only handles simple cases. If you need fancy stuff like
-    support for m2m (which may not work with this?) or refreshing
-    you might want to use something else. On the plus side this
-    is super simple, easy to understand has minimal perf impact
-    and is unlikely to have upgrade issues.
+    Only the declared fields are recorded and it's just a dict lookup per
+    field so it costs next to nothing for the many rows that get loaded but
+    never saved. Fields deferred by .only()/.defer() aren't recorded (that
+    would query them), their original value is looked up the first time
+    it's asked for.
 
-    If you are looking for alternatives take a look at:
-    https://stackoverflow.com/questions/1355150/django-when-saving-how-can-you-check-if-a-field-has-changed
-    https://github.com/romgar/django-dirtyfields
-    https://github.com/jazzband/django-model-utils/blob/master/model_utils/tracker.py
+    NB: This only handles simple, concrete fields. Use attnames for foreign
+    keys e.g. 'customer_id'.
     """
+    tracked_fields = ()
+
     def __init__(self, *args, **kwargs):
-        super(InitialsMixin, self).__init__(*args, **kwargs)
-        self._initials = model_to_dict(self)
+        super(TrackedFieldsMixin, self).__init__(*args, **kwargs)
+        self.reset_tracked_fields()
 
-    def changed_fields(self):
-        """Returns list of the field names that changed since instantiation."""
-        diff = list()
-        current = model_to_dict(self)
-        for name in self._initials.keys():
-            if current[name] != self._initials[name]:
-                diff.append(name)
+    def reset_tracked_fields(self):
+        """Makes the current values the ones changes are compared with."""
+        values = self.__dict__
+        self._loaded_values = {name: values[name] for name in self.tracked_fields if name in values}
 
-        return diff
+    def get_loaded_value(self, name):
+        if name not in self._loaded_values:
+            # It was deferred when we were loaded.
+            self._loaded_values[name] = type(self)._default_manager.filter(
+                pk=self.pk).values_list(name, flat=True).first()
+        return self._loaded_values[name]
+
+    def has_changed(self, name):
+        if name not in self.__dict__:
+            # Still deferred so nobody has set it.
+            return False
+        return self.__dict__[name] != self.get_loaded_value(name)
+
+    def changed_fields(self):
+        """Returns list of the tracked field names that changed since instantiation."""
+        return [name for name in self.tracked_fields if self.has_changed(name)]
@@ -0,0 +1,165 @@
+import logging
+import time
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models.deletion import Collector, get_candidate_relations_to_delete
+from django.utils import timezone
+
+from .utils import markdown_hash
+
+logger = logging.getLogger(__name__)
+
+
+def order_for_deletion(related_models):
+    """
+    Sorts models so each one comes before the models it has foreign keys to,
+    e.g. Feedback before AppUser. Deleting in that order means we don't
+    bother nulling out references to rows that are about to go anyway.
+    Models in a cycle keep their original order.
+    """
+    remaining = list(related_models)
+    ordered = []
+    while remaining:
+        for model in remaining:
+            referenced_by_others = any(
+                field.related_model is model
+                for other in remaining
+                if other is not model
+                for field in other._meta.concrete_fields
+                if field.is_relation
+            )
+            if not referenced_by_others:
+                break
+        else:
+            model = remaining[0]
+        remaining.remove(model)
+        ordered.append(model)
+    return ordered
+
+
+class Purge(object):
+    """
+    Deletes the rows in some querysets and everything that depends on them
+    without loading them into memory.
+
+    Django's delete() collects every related object up front and deletes
+    them all in one transaction, which for a big customer means holding
+    locks for minutes. Instead we walk the foreign keys that point at the
+    model, deleting (CASCADE) or nulling out (SET_NULL) the dependent rows
+    first, BATCH_SIZE rows per transaction with plain DELETE and UPDATE
+    statements.
+
+    No signals are sent and delete() isn't called so anything that relies
+    on them (counters, caches) needs rebuilding afterwards.
+
+    Every batch commits on its own so if the purge dies part way through
+    running it again just carries on with what's left. Counts of what's
+    been deleted so far are kept in the cache under `name`, see
+    get_progress().
+    """
+
+    BATCH_SIZE = 1000
+    PROGRESS_TIMEOUT = 7 * 24 * 60 * 60
+
+    def __init__(self, name, batch_size=None):
+        self.name = name
+        self.batch_size = batch_size or self.BATCH_SIZE
+        progress = self.get_progress(name) or {}
+        # Carry on counting from a previous attempt.
+        self.deleted = Counter(progress.get("deleted", {}))
+
+    @classmethod
+    def get_progress_key(cls, name):
+        return f"purge_progress_{markdown_hash(name)}"
+
+    @classmethod
+    def get_progress(cls, name):
+        """
+        Returns a dict with the 'deleted' row counts by model and whether
+        the purge has 'finished', or None if it hasn't started.
+        """
+        return cache.get(cls.get_progress_key(name))
+
+    def save_progress(self, finished=False):
+        cache.set(
+            self.get_progress_key(self.name),
+            {"deleted": dict(self.deleted), "finished": finished, "at": time.time()},
+            self.PROGRESS_TIMEOUT,
+        )
+
+    def run(self, *querysets):
+        """
+        Purges each queryset in turn and returns the number of rows deleted
+        by model label.
+        """
+        self.save_progress()
+        for queryset in querysets:
+            self.purge(queryset)
+        self.save_progress(finished=True)
+        logger.info(f"Purge {self.name} finished: {dict(self.deleted)}")
+        return self.deleted
+
+    def purge(self, queryset):
+        model = queryset.model
+        queryset = queryset.order_by()
+        while True:
+            pks = list(queryset.values_list("pk", flat=True)[: self.batch_size])
+            if not pks:
+                break
+            self.purge_dependents(model, pks, queryset.db)
+            with transaction.atomic(using=queryset.db):
+                # Anything that snuck in since we purged the dependents.
+                self.purge_dependents(model, pks, queryset.db, cascade=False)
+                deleted = model._base_manager.using(queryset.db).filter(pk__in=pks)
+                self.deleted[model._meta.label] += deleted._raw_delete(queryset.db)
+            self.save_progress()
+
+    def purge_dependents(self, model, pks, using, cascade=True):
+        relations = {}
+        for related in get_candidate_relations_to_delete(model._meta):
+            relations.setdefault(related.related_model, []).append(related)
+
+        for related_model in order_for_deletion(relations):
+            for related in relations[related_model]:
+                field = related.field
+                on_delete = field.remote_field.on_delete
+                dependents = related_model._base_manager.using(using).filter(
+                    **{f"{field.name}__in": pks}
+                )
+                if on_delete == models.DO_NOTHING:
+                    continue
+                elif on_delete == models.SET_NULL:
+                    self.set_null(dependents, field)
+                elif on_delete == models.CASCADE:
+                    if cascade:
+                        self.purge(dependents)
+                    elif dependents.exists():
+                        self.collect_and_delete(dependents, using)
+                else:
+                    # PROTECT, SET_DEFAULT and friends. Let Django deal
+                    # with the rules, there aren't any in our models.
+                    self.collect_and_delete(dependents, using)
+
+    def set_null(self, queryset, field):
+        model = queryset.model
+        queryset = queryset.order_by()
+        while True:
+            pks = list(queryset.values_list("pk", flat=True)[: self.batch_size])
+            if not pks:
+                break
+            values = {field.name: None}
+            # Bump `updated` like save() would, the API's ETags and
+            # updated_since go by it.
+            now = timezone.now()
+            for auto_now_field in model._meta.concrete_fields:
+                if getattr(auto_now_field, "auto_now", False):
+                    values[auto_now_field.name] = now
+            model._base_manager.using(queryset.db).filter(pk__in=pks).update(**values)
+
+    def collect_and_delete(self, queryset, using):
+        collector = Collector(using=using)
+        collector.collect(queryset)
+        deleted, deleted_by_model = collector.delete()
+        self.deleted.update(deleted_by_model)
@@ -0,0 +1,459 @@
+import datetime
+import fnmatch
+import random
+import time
+from unittest import mock
+
+import redis
+from django.db import DatabaseError, connection
+from django.db.models import QuerySet
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from accounts.models import Customer
+from appaccounts.models import AppUser
+from feedback.models import FeatureRequest, Feedback, Theme
+
+from . import cache as cache_module
+from .cache import (
+    LocalLRU,
+    TieredRedisCache,
+    get_customer_cache_key,
+    invalidate_customer_cache,
+)
+from .purge import Purge
+from .utils import markdown, markdown_to_text, textify_html
+
+
+class MarkdownToTextTestCase(SimpleTestCase):
+    # Bits of markdown, HTML and whitespace that random inputs are made of.
+    TOKENS = [
+        "x",
+        "word",
+        " ",
+        "  ",
+        "    ",
+        "\t",
+        "\n",
+        "\n\n",
+        "\r\n",
+        "\xa0",
+        "*",
+        "**",
+        "_",
+        "#",
+        "> ",
+        "- ",
+        "1. ",
+        "`",
+        "```",
+        "---",
+        "\\",
+        "&",
+        "&amp;",
+        "&#42;",
+        "&nbsp;",
+        "<b>",
+        "</b>",
+        "[a](http://b)",
+        "![i](j)",
+        "<http://x.com>",
+    ]
+
+    def assertSameAsViaHtml(self, text, join_char="\n"):
+        self.assertEqual(
+            markdown_to_text(text, join_char),
+            textify_html(markdown(text), join_char),
+            repr(text),
+        )
+
+    def test_same_as_via_html(self):
+        for text in [
+            "",
+            "Plain text",
+            "x y    > **#**  ",
+            "*a*  \n\n**b**\t",
+            "    code\n    \n    block  ",
+            "A &amp; B &copy; <b>bold</b>",
+        ]:
+            self.assertSameAsViaHtml(text)
+            self.assertSameAsViaHtml(text, " ")
+
+    def test_same_as_via_html_for_random_markdown(self):
+        rnd = random.Random(0)
+        for i in range(2000):
+            text = "".join(rnd.choice(self.TOKENS) for _ in range(rnd.randint(1, 12)))
+            self.assertSameAsViaHtml(text)
+
+
+class FakeRedis(object):
+    """
+    Just enough of StrictRedis for TieredRedisCache, in memory. Set `down`
+    to have every command fail like Redis was unreachable.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.down = False
+
+    def check(self):
+        if self.down:
+            raise redis.ConnectionError("Connection refused")
+
+    def encode(self, value):
+        if isinstance(value, int):
+            return str(value).encode()
+        return value
+
+    def get_entry(self, key):
+        entry = self.data.get(key)
+        if entry is not None and entry[0] is not None and entry[0] < time.time():
+            del self.data[key]
+            return None
+        return entry
+
+    def get(self, key):
+        self.check()
+        entry = self.get_entry(key)
+        return entry and entry[1]
+
+    def mget(self, keys):
+        self.check()
+        return [self.get(key) for key in keys]
+
+    def set(self, key, value, px=None, nx=False):
+        self.check()
+        if nx and self.get_entry(key):
+            return None
+        expires_at = time.time() + px / 1000 if px else None
+        self.data[key] = (expires_at, self.encode(value))
+        return True
+
+    def delete(self, *keys):
+        self.check()
+        return len([self.data.pop(key) for key in keys if key in self.data])
+
+    def exists(self, key):
+        self.check()
+        return int(bool(self.get_entry(key)))
+
+    def eval(self, script, numkeys, key, delta):
+        # Only the incr script.
+        self.check()
+        entry = self.get_entry(key)
+        if entry is None:
+            return None
+        value = int(entry[1]) + delta
+        self.data[key] = (entry[0], self.encode(value))
+        return value
+
+    def scan_iter(self, match):
+        self.check()
+        return [key for key in list(self.data) if fnmatch.fnmatch(key, match)]
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline(object):
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def set(self, *args, **kwargs):
+        self.commands.append((args, kwargs))
+
+    def execute(self):
+        self.client.check()
+        return [self.client.set(*args, **kwargs) for args, kwargs in self.commands]
+
+
+class TieredRedisCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        self.cache = self.create_cache()
+        self.redis = self.cache.client
+
+    def create_cache(self, prefix="test", l1_max_entries=3):
+        backend = TieredRedisCache(
+            "redis://localhost:6379/0",
+            {
+                "KEY_PREFIX": prefix,
+                "OPTIONS": {"L1_MAX_ENTRIES": l1_max_entries, "L1_TIMEOUT": 5},
+            },
+        )
+        backend.client = FakeRedis()
+        return backend
+
+    def later(self, seconds):
+        return mock.patch(
+            "common.cache.time.monotonic", return_value=time.monotonic() + seconds
+        )
+
+    def change_in_redis(self, key, value):
+        # What another process writing the key looks like from here.
+        self.redis.data[self.cache.make_key(key)] = (None, self.cache.encode(value))
+
+    def test_get_and_set(self):
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.get("a", "default"), "default")
+
+        self.cache.set("a", {"x": 1})
+        self.cache.set("b", 2)
+
+        self.assertEqual(self.cache.get("a"), {"x": 1})
+        self.assertEqual(self.cache.get("b"), 2)
+
+    def test_l1_copy_expires(self):
+        self.cache.set("a", 1)
+        self.cache.get("a")
+        self.change_in_redis("a", 2)
+
+        self.assertEqual(self.cache.get("a"), 1)
+        with self.later(6):
+            self.assertEqual(self.cache.get("a"), 2)
+        self.assertEqual(
+            self.cache.get_metrics()["a"], {"l1_hits": 1, "hits": 2, "misses": 0}
+        )
+
+    def test_l1_evicts_the_least_recently_used(self):
+        for key in ("a", "b", "c"):
+            self.cache.set(key, 1)
+            self.cache.get(key)
+        # "a" is now the most recently used so "b" goes.
+        self.cache.get("a")
+        self.cache.set("d", 1)
+        self.cache.get("d")
+        for key in ("a", "b", "c", "d"):
+            self.change_in_redis(key, 2)
+
+        # Reading "b" puts it back in L1 so it has to come last.
+        self.assertEqual(
+            [self.cache.get(key) for key in ("a", "c", "d", "b")], [1, 1, 1, 2]
+        )
+
+    def test_local_lru_caps_the_timeout(self):
+        lru = LocalLRU(max_entries=10, timeout=5)
+        lru.set("a", 1, timeout=60)
+        with self.later(6):
+            self.assertEqual(lru.get("a"), (False, None))
+
+    def test_writes_and_deletes_drop_the_l1_copy(self):
+        for write, expected in (
+            (lambda: self.cache.set("a", 2), 2),
+            (lambda: self.cache.set_many({"a": 2}), 2),
+            (lambda: self.cache.incr("a"), 2),
+            (lambda: self.cache.delete("a"), None),
+            (lambda: self.cache.delete_many(["a"]), None),
+        ):
+            self.cache.set("a", 1)
+            self.cache.get("a")
+
+            write()
+
+            self.assertEqual(self.cache.get("a"), expected)
+
+    def test_add(self):
+        self.assertTrue(self.cache.add("a", 1))
+        self.assertFalse(self.cache.add("a", 2))
+        self.assertEqual(self.cache.get("a"), 1)
+
+    def test_add_drops_the_l1_copy(self):
+        self.cache.set("a", 1)
+        self.cache.get("a")
+        # Expired in Redis but still in our L1.
+        self.redis.data.pop(self.cache.make_key("a"))
+
+        self.assertTrue(self.cache.add("a", 2))
+        self.assertEqual(self.cache.get("a"), 2)
+
+    def test_incr(self):
+        self.cache.set("a", 1)
+        self.cache.get("a")
+
+        self.assertEqual(self.cache.incr("a", 2), 3)
+        self.assertEqual(self.cache.get("a"), 3)
+        self.assertEqual(self.cache.decr("a"), 2)
+
+    def test_incr_missing_key(self):
+        with self.assertRaises(ValueError):
+            self.cache.incr("a")
+        self.assertIsNone(self.cache.get("a"))
+
+    def test_get_many_and_set_many(self):
+        self.assertEqual(self.cache.set_many({"a": 1, "b": [2]}), [])
+        # One from L1, one from Redis and one missing.
+        self.cache.get("a")
+
+        self.assertEqual(self.cache.get_many(["a", "b", "c"]), {"a": 1, "b": [2]})
+        self.assertEqual(
+            self.cache.get_metrics(),
+            {
+                "a": {"l1_hits": 1, "hits": 1, "misses": 0},
+                "b": {"l1_hits": 0, "hits": 1, "misses": 0},
+                "c": {"l1_hits": 0, "hits": 0, "misses": 1},
+            },
+        )
+
+    def test_delete_many(self):
+        self.cache.set_many({"a": 1, "b": 2, "c": 3})
+        self.cache.get("a")
+
+        self.cache.delete_many(["a", "b"])
+
+        self.assertEqual(self.cache.get_many(["a", "b", "c"]), {"c": 3})
+
+    def test_clear_only_deletes_our_keys(self):
+        other = self.create_cache(prefix="other")
+        other.client = self.redis
+        self.cache.set("a", 1)
+        other.set("a", 2)
+        self.redis.set("celery-task-meta-1", b"result")
+
+        self.cache.clear()
+
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(other.get("a"), 2)
+        self.assertEqual(self.redis.get("celery-task-meta-1"), b"result")
+
+    def test_redis_errors_are_logged_not_raised(self):
+        self.cache.set("a", 1)
+        self.redis.down = True
+
+        with self.assertLogs("common.cache", "WARNING") as logs:
+            # Reads are misses.
+            self.assertIsNone(self.cache.get("a"))
+            self.assertEqual(self.cache.get_many(["a"]), {})
+            self.assertFalse(self.cache.has_key("a"))  # noqa: W601
+            with self.assertRaises(ValueError):
+                self.cache.incr("a")
+            # Writes and deletes are best effort.
+            self.cache.set("a", 2)
+            self.assertFalse(self.cache.add("b", 2))
+            self.assertEqual(self.cache.set_many({"a": 2}), ["a"])
+            self.cache.delete("a")
+            self.cache.delete_many(["a"])
+            self.cache.clear()
+
+        self.assertEqual(len(logs.output), 10)
+        self.assertIn("Redis get failed: ConnectionError", logs.output[0])
+
+    def test_customer_cache_key(self):
+        with mock.patch.object(cache_module, "cache", self.cache):
+            key = get_customer_cache_key(1, "stats")
+            self.assertEqual(key, "stats_c1v1")
+            self.assertEqual(get_customer_cache_key(2, "stats"), "stats_c2v1")
+
+            invalidate_customer_cache(1)
+
+            self.assertEqual(get_customer_cache_key(1, "stats"), "stats_c1v2")
+            self.assertEqual(get_customer_cache_key(2, "stats"), "stats_c2v1")
+
+    def test_invalidate_customer_cache_without_a_namespace(self):
+        with mock.patch.object(cache_module, "cache", self.cache):
+            invalidate_customer_cache(1)
+
+            self.assertEqual(get_customer_cache_key(1, "stats"), "stats_c1v2")
+
+
+class PurgeTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = Customer.objects.create(name="Acme")
+        self.theme = Theme.objects.create(customer=self.customer, title="Billing")
+        for i in range(5):
+            feedback = Feedback.objects.create(
+                customer=self.customer,
+                problem=f"Problem {i}",
+                feedback_type=Feedback.EXISTING,
+            )
+            feedback.themes.add(self.theme)
+
+    def purge(self, *querysets):
+        # Progress is kept in the cache, which outlives each test.
+        deleted = Purge(self.id(), batch_size=2).run(*querysets)
+        return {label: count for label, count in deleted.items() if count}
+
+    def count_deletes(self, queries, table):
+        return len(
+            [
+                query
+                for query in queries
+                if query["sql"].startswith(f'DELETE FROM "{table}"')
+            ]
+        )
+
+    def test_cascades_in_batches(self):
+        with CaptureQueriesContext(connection) as queries:
+            deleted = self.purge(Theme.objects.filter(customer=self.customer))
+
+        self.assertEqual(deleted, {"feedback.Feedback_themes": 5, "feedback.Theme": 1})
+        self.assertEqual(self.count_deletes(queries, "feedback_feedback_themes"), 3)
+        self.assertEqual(Feedback.objects.count(), 5)
+        self.assertFalse(Feedback.themes.through.objects.exists())
+
+    def test_m2m_rows_go_with_the_feedback(self):
+        with CaptureQueriesContext(connection) as queries:
+            deleted = self.purge(Feedback.objects.filter(customer=self.customer))
+
+        self.assertEqual(
+            deleted, {"feedback.Feedback": 5, "feedback.Feedback_themes": 5}
+        )
+        self.assertEqual(self.count_deletes(queries, "feedback_feedback"), 3)
+        self.assertEqual(self.count_deletes(queries, "feedback_feedback_themes"), 3)
+        self.assertFalse(Feedback.objects.exists())
+        self.assertEqual(list(Theme.objects.all()), [self.theme])
+
+    def test_set_null(self):
+        app_user = AppUser.objects.create(customer=self.customer, name="Jane")
+        feature_request = FeatureRequest.objects.create(
+            customer=self.customer, title="Exports"
+        )
+        long_ago = timezone.now() - datetime.timedelta(days=1)
+        Feedback.objects.update(
+            user=app_user, feature_request=feature_request, updated=long_ago
+        )
+
+        deleted = self.purge(
+            AppUser.objects.filter(pk=app_user.pk),
+            FeatureRequest.objects.filter(pk=feature_request.pk),
+        )
+
+        self.assertEqual(
+            deleted, {"appaccounts.AppUser": 1, "feedback.FeatureRequest": 1}
+        )
+        self.assertEqual(
+            set(Feedback.objects.values_list("user", "feature_request")),
+            {(None, None)},
+        )
+        self.assertFalse(Feedback.objects.filter(updated__lte=long_ago).exists())
+
+    def test_resumes_after_an_interruption(self):
+        raw_delete = QuerySet._raw_delete
+        calls = []
+
+        def die_on_the_third_batch(queryset, using):
+            calls.append(queryset.model)
+            if len(calls) == 3:
+                raise DatabaseError("Connection lost")
+            return raw_delete(queryset, using)
+
+        feedback = Feedback.objects.filter(customer=self.customer)
+        with mock.patch.object(
+            QuerySet, "_raw_delete", autospec=True, side_effect=die_on_the_third_batch
+        ):
+            with self.assertRaises(DatabaseError):
+                self.purge(feedback)
+
+        # The first two batches stay deleted.
+        self.assertEqual(feedback.count(), 3)
+        progress = Purge.get_progress(self.id())
+        self.assertFalse(progress["finished"])
+
+        deleted = self.purge(feedback)
+
+        self.assertFalse(feedback.exists())
+        self.assertTrue(Purge.get_progress(self.id())["finished"])
+        # Counting carries on from the first attempt.
+        self.assertEqual(deleted["feedback.Feedback"], 5)
+        self.assertEqual(deleted["feedback.Feedback_themes"], 5)
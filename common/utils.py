@@ -1,9 +1,124 @@
+import hashlib
+import html
 import re
+import threading
 from importlib import import_module
 
 from bs4 import BeautifulSoup
+from django.core.cache import cache
 from django.template.defaultfilters import truncatechars
-from markdown import markdown
+from markdown import Markdown
+from markdown.extensions import Extension
+from markdown.util import AMP_SUBSTITUTE
+
+# Rendered markdown is keyed on a hash of its source so it never goes stale.
+# It only expires to make room for other things.
+MARKDOWN_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+
+
+# The entities that survive serializing a markdown tree and so get decoded
+# when the HTML is parsed. Mirrors markdown.serializers.RE_AMP.
+ENTITY_REGEX = re.compile(r"&(?:\#[0-9]+|\#x[0-9a-f]+|[0-9a-z]+);", re.I)
+
+_markdown_converters = threading.local()
+
+SIMHASH_BITS = 64
+SIMHASH_WORD_REGEX = re.compile(r"\w+")
+
+
+class EscapeHtml(Extension):
+    def extendMarkdown(self, md, md_globals):
+        del md.preprocessors["html_block"]
+        del md.inlinePatterns["html"]
+
+
+class PlainTextSerializer(object):
+    """
+    A Markdown serializer that outputs the document's text instead of HTML.
+
+    It gives the same result as serializing to HTML and running textify_html
+    on it without building and parsing the HTML. It can't handle raw HTML in
+    the source so check htmlStash after converting.
+    """
+
+    def __init__(self):
+        self.join_char = "\n"
+
+    # Markdown strips whitespace from what the serializer returns but the
+    # text of the HTML would keep it. Wrapping the text in this preserves it.
+    BOUNDARY = "\x01"
+
+    # BeautifulSoup turns strings that are nothing but these into a single
+    # space or newline, except inside these tags. Mirrors
+    # BeautifulSoup.ASCII_SPACES and the HTML builder's
+    # preserve_whitespace_tags.
+    ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+    PRESERVE_WHITESPACE_TAGS = ("pre", "textarea")
+
+    def __call__(self, root):
+        # Like stripTopLevelTags we drop the whitespace just inside the root
+        # element.
+        strings = []
+        children = list(root)
+        text = (root.text or "").lstrip()
+        if not children:
+            text = text.rstrip()
+        self.add_string(text, strings)
+        for index, child in enumerate(children):
+            self.add_strings(child, strings)
+            tail = child.tail or ""
+            if index == len(children) - 1:
+                tail = tail.rstrip()
+            self.add_string(tail, strings)
+        return f"{self.BOUNDARY}{self.join_char.join(strings)}{self.BOUNDARY}"
+
+    def add_strings(self, element, strings, preserve_whitespace=False):
+        preserve_whitespace = (
+            preserve_whitespace or element.tag in self.PRESERVE_WHITESPACE_TAGS
+        )
+        self.add_string(element.text, strings, preserve_whitespace)
+        for child in element:
+            self.add_strings(child, strings, preserve_whitespace)
+            self.add_string(child.tail, strings, preserve_whitespace)
+
+    def add_string(self, text, strings, preserve_whitespace=False):
+        if text:
+            text = self.decode(text)
+            if not preserve_whitespace and not text.strip(self.ASCII_SPACES):
+                text = "\n" if "\n" in text else " "
+            strings.append(text)
+
+    def decode(self, text):
+        # This is what serializing and then parsing the HTML does to text.
+        text = text.replace(AMP_SUBSTITUTE, "&")
+        if "&" in text:
+            text = ENTITY_REGEX.sub(lambda m: html.unescape(m.group(0)), text)
+        return text
+
+
+def get_markdown_converter(name, build):
+    """
+    Returns this thread's Markdown instance called 'name', creating it with
+    build() the first time. Setting up a Markdown instance and its
+    extensions is a big chunk of the cost of converting short texts so we
+    reuse them. They aren't thread safe hence one per thread.
+    """
+    converters = _markdown_converters.__dict__
+    md = converters.get(name)
+    if md is None:
+        md = converters[name] = build()
+    return md.reset()
+
+
+def build_plain_text_converter():
+    md = Markdown()
+    md.serializer = PlainTextSerializer()
+    md.stripTopLevelTags = False
+    return md
+
+
+def markdown(markdown_text):
+    return get_markdown_converter("html", Markdown).convert(markdown_text)
 
 
 def get_class(fully_qualified_class_name):
@@ -28,9 +143,92 @@ def textify_html(html, join_char="\n"):
     return soup.get_text(join_char)
 
 
+def markdown_to_text(markdown_text, join_char="\n"):
+    md = get_markdown_converter("text", build_plain_text_converter)
+    md.serializer.join_char = join_char
+    clean_text = md.convert(markdown_text)[1:-1]
+    if md.htmlStash.html_counter:
+        # There was raw HTML in there which needs a real parser.
+        clean_text = textify_html(markdown(markdown_text), join_char)
+    return clean_text
+
+
 def remove_markdown(markdown_text, length=None, join_char="\n"):
-    html = markdown(markdown_text)
-    clean_text = textify_html(html, join_char)
+    clean_text = markdown_to_text(markdown_text, join_char)
+    if length:
+        clean_text = truncatechars(clean_text, length)
+    return clean_text
+
+
+def markdown_hash(markdown_text):
+    return hashlib.sha1(markdown_text.encode("utf-8")).hexdigest()
+
+
+def content_fingerprint(text):
+    """
+    A SHA-256 of `text` with runs of whitespace collapsed, so the same
+    message with different line endings or trailing spaces matches.
+    """
+    normalized = " ".join(text.split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def content_simhash(text):
+    """
+    A 64 bit SimHash of the words in `text`. Similar texts get hashes that
+    differ in only a few bits, see hamming_distance. Returned as a signed
+    int so it fits in a BigIntegerField.
+    """
+    weights = [0] * SIMHASH_BITS
+    for word in SIMHASH_WORD_REGEX.findall(text.lower()):
+        word_hash = int.from_bytes(
+            hashlib.md5(word.encode("utf-8")).digest()[:8], "big"
+        )
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if word_hash & (1 << bit) else -1
+
+    simhash = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            simhash |= 1 << bit
+    if simhash >= 1 << (SIMHASH_BITS - 1):
+        simhash -= 1 << SIMHASH_BITS
+    return simhash
+
+
+def hamming_distance(a, b):
+    return bin((a ^ b) & ((1 << SIMHASH_BITS) - 1)).count("1")
+
+
+def markdownify(markdown_text):
+    """
+    Turns user supplied markdown into HTML that's safe to dump onto the page.
+    See the markdownify template filter for why it's done this way.
+    """
+    md = get_markdown_converter(
+        "markdownify",
+        lambda: Markdown(extensions=[EscapeHtml(), "nl2br", "prependnewline"]),
+    )
+    text_as_html = md.convert(markdown_text)
+    return f'<div class="markdownified">{text_as_html}</div>'
+
+
+def cached_markdownify(markdown_text):
+    cache_key = f"markdownify_{markdown_hash(markdown_text)}"
+    html = cache.get(cache_key)
+    if html is None:
+        html = markdownify(markdown_text)
+        cache.set(cache_key, html, MARKDOWN_CACHE_TIMEOUT)
+    return html
+
+
+def cached_remove_markdown(markdown_text, length=None, join_char="\n"):
+    # The untruncated text is cached so every length can share it.
+    cache_key = f"remove_markdown_{markdown_hash(join_char + markdown_text)}"
+    clean_text = cache.get(cache_key)
+    if clean_text is None:
+        clean_text = remove_markdown(markdown_text, join_char=join_char)
+        cache.set(cache_key, clean_text, MARKDOWN_CACHE_TIMEOUT)
     if length:
         clean_text = truncatechars(clean_text, length)
     return clean_text
@@ -9,7 +9,13 @@ from accounts.tasks import (
     sync_feedback_counts_and_mrr_with_stripe,
 )
 from feedback.models import CustomerFeedbackImporterSettings
-from feedback.tasks import import_feedback, send_status_emails, unsnooze_feedback
+from feedback.tasks import (
+    import_feedback,
+    reconcile_customer_stats,
+    send_status_emails,
+    unsnooze_feedback,
+)
+from integrations.tasks import clean_up_inbound_emails
 from marketingmonitor.tasks import monitor_hn
 
 
@@ -39,6 +45,10 @@ def run_task(request):
             sync_feedback_counts_and_mrr_with_stripe.delay()
         elif task_name == "send_admin_subscription_summary_email":
             send_admin_subscription_summary_email.delay()
+        elif task_name == "reconcile_customer_stats":
+            reconcile_customer_stats.delay()
+        elif task_name == "clean_up_inbound_emails":
+            clean_up_inbound_emails.delay()
         elif task_name == "monitor_hn":
             monitor_hn.delay()
         else:
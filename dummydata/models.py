@@ -1,10 +1,18 @@
 import os
 import csv
-from django.db import models
+from collections import Counter
+from functools import lru_cache
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.conf import settings
-from accounts.models import Customer
-from appaccounts.models import AppUser, AppCompany, FilterableAttribute
-from feedback.models import Feedback, FeedbackImporter, FeatureRequest, Theme
+from django.core.cache import cache
+from accounts.models import Customer, OnboardingTask
+from common.cache import get_customer_cache_key, invalidate_customer_cache
+from common.purge import Purge
+from appaccounts.models import AppUser, AppCompany, FilterableAttribute, get_domain_company_cache_key, get_email_domain
+from feedback.models import (CustomerStats, Feedback, FeedbackImporter, FeedbackIngestRules, FeatureRequest, Theme,
+    invalidate_feature_request_search)
 from integrations.shared.importers import BaseImporter, AttributeMapper, AttributeMapping
 
 class DummyDataCompanyAttributeMapper(AttributeMapper):
@@ -21,120 +29,204 @@ class DummyDataCompanyAttributeMapper(AttributeMapper):
         filterable_attributes['plan'] = self.obj.get('plan', None)
         return filterable_attributes
 
+DUMMY_DATA_CSV = os.path.join(settings.BASE_DIR, 'dummydata/dummydata.csv')
+
+@lru_cache(maxsize=1)
+def read_dummy_data():
+    """
+    Returns the rows in dummydata.csv. They never change while we're running
+    so each process only reads and checks the file once.
+    """
+    with open(DUMMY_DATA_CSV) as f:
+        rows = tuple(csv.DictReader(f))
+
+    for item in rows:
+        if item['feature_request_state']:
+            assert(item['feature_request_state'] in FeatureRequest.STATE_KEYS)
+        if item['priority']:
+            assert(item['priority'] in FeatureRequest.PRIORITY_KEYS)
+        if item['effort']:
+            assert(item['effort'] in FeatureRequest.EFFORT_KEYS)
+        if item['feedback_state']:
+            assert(item['feedback_state'] in Feedback.STATE_KEYS)
+        if item['type']:
+            assert(item['type'] in Feedback.TYPE_KEYS)
+    return rows
+
 class DummyDataManager(models.Manager):
-    def load_data(self, customer):
-        f = open(os.path.join(settings.BASE_DIR, 'dummydata/dummydata.csv'))
-        reader = csv.DictReader(f)
+    def get_cache_key(self, customer_id):
+        return get_customer_cache_key(customer_id, "has_dummy_data")
 
-        # Need to make things in bottom up dependency order.
+    def refresh_cache(self, customer_id):
+        cache.delete(self.get_cache_key(customer_id))
 
-        # AppCompany
+    def customer_has_dummy_data(self, customer_id):
+        has_dummy_data = cache.get(self.get_cache_key(customer_id))
+        if has_dummy_data is None:
+            has_dummy_data = self.get_queryset().filter(customer_id=customer_id).exists()
+            cache.set(self.get_cache_key(customer_id), has_dummy_data, 24 * 60 * 60)
+        return has_dummy_data
+
+    def get_existing(self, model, customer, field, values):
+        # The customer's objects with one of the values, keyed by value.
+        existing = {}
+        for obj in model.objects.filter(customer=customer, **{f'{field}__in': values}).order_by('id'):
+            existing.setdefault(getattr(obj, field), obj)
+        return existing
+
+    def load_data(self, customer):
+        """
+        Creates the sample companies, users, themes, feature requests and
+        feedback in dummydata.csv, reusing any the customer already has.
+
+        This is on the signup path so each model is looked up with one query
+        and the missing objects are inserted with one bulk_create. That
+        skips save() and the signals so we do their bookkeeping here.
+        """
+        rows = read_dummy_data()
         # HACK: Lie and say these are from Intercom. Should create a DummyData importer type.
         source = FeedbackImporter.objects.get(name="Intercom")
-        for item in reader:
-            app_company, created = AppCompany.objects.get_or_create(
-                customer=customer,
-                name=item['AppCompany'],
-            )
-
-            if created:
-                DummyData.objects.create(customer=customer, app_company=app_company)
-                mapper = DummyDataCompanyAttributeMapper(customer, item, source)
-                mapper.create_filterable_attributes()
-                app_company.filterable_attributes = mapper.get_filterable_attributes_as_dict()
-                app_company.save()
-
-        # AppUser
-        f.seek(0)
-        reader = csv.DictReader(f)
-        for item in reader:
-            app_company = AppCompany.objects.get(customer=customer, name=item['AppCompany'])
-            app_user, created = AppUser.objects.get_or_create(
-                customer=customer,
-                company=app_company,
-                name=item['AppUser'],
-                email=item['email'])
-            if created:
-                DummyData.objects.create(customer=customer, app_user=app_user)
-
-        # Theme
-        f.seek(0)
-        reader = csv.DictReader(f)
-        for item in reader:
-            if item['Theme']:
-                theme, created = Theme.objects.get_or_create(
-                    customer=customer,
-                    title=item['Theme'])
-                if created:
-                    DummyData.objects.create(customer=customer, theme=theme)
-
-        # FeatureRequest
-        f.seek(0)
-        reader = csv.DictReader(f)
-        for item in reader:
-            if not item['FeatureRequest']:
-                continue
-
-            if item['Theme']:
-                theme = Theme.objects.get(customer=customer, title=item['Theme'])
-            else:
-                theme = None
-
-            if item['feature_request_state']:
-                assert(item['feature_request_state'] in FeatureRequest.STATE_KEYS)
-            if item['priority']:
-                assert(item['priority'] in FeatureRequest.PRIORITY_KEYS)
-            if item['effort']:
-                assert(item['effort'] in FeatureRequest.EFFORT_KEYS)
-
-            fr, created = FeatureRequest.objects.get_or_create(
-                customer=customer,
-                title=item['FeatureRequest'],
-                state=item['feature_request_state'],
-                priority=item['priority'],
-                effort=item['effort'])
-            if created:
-                if theme:
-                    fr.themes.add(theme)
-                DummyData.objects.create(customer=customer, feature_request=fr)
-
-        # Feedback
-        f.seek(0)
-        reader = csv.DictReader(f)
-        for item in reader:
-            if item['FeatureRequest']:
-                fr = FeatureRequest.objects.get(customer=customer, title=item['FeatureRequest'])
-            else:
-                fr = None
-            app_user = AppUser.objects.get(customer=customer, email=item['email'])
-
-            if item['feedback_state']:
-                assert(item['feedback_state'] in Feedback.STATE_KEYS)
-            if item['type']:
-                assert(item['type'] in Feedback.TYPE_KEYS)
-
-            feedback, created = Feedback.objects.get_or_create(
-                customer=customer,
-                feature_request=fr,
-                user=app_user,
-                problem=item['Feedback'],
-                state=item['feedback_state'],
-                feedback_type=item['type'])
-            if created:
-                DummyData.objects.create(customer=customer, feedback=feedback)
+        dummy_data = []
+
+        # Need to make things in bottom up dependency order.
+        with transaction.atomic():
+            # AppCompany
+            companies = self.get_existing(AppCompany, customer, 'name', {item['AppCompany'] for item in rows})
+            new_companies = []
+            for item in rows:
+                if item['AppCompany'] not in companies:
+                    mapper = DummyDataCompanyAttributeMapper(customer, item, source)
+                    company = AppCompany(
+                        customer=customer,
+                        name=item['AppCompany'],
+                        filterable_attributes=mapper.get_filterable_attributes_as_dict())
+                    companies[company.name] = company
+                    new_companies.append(company)
+            if new_companies:
+                # Every row maps the same attributes so once is enough.
+                DummyDataCompanyAttributeMapper(customer, rows[0], source).create_filterable_attributes()
+            AppCompany.objects.bulk_create(new_companies)
+            dummy_data.extend(DummyData(customer=customer, app_company=company) for company in new_companies)
+
+            # AppUser
+            app_users = self.get_existing(AppUser, customer, 'email', {item['email'] for item in rows})
+            new_app_users = []
+            for item in rows:
+                if item['email'] not in app_users:
+                    app_user = AppUser(
+                        customer=customer,
+                        company=companies[item['AppCompany']],
+                        name=item['AppUser'],
+                        email=item['email'],
+                        email_domain=get_email_domain(item['email']))
+                    app_users[app_user.email] = app_user
+                    new_app_users.append(app_user)
+            AppUser.objects.bulk_create(new_app_users)
+            dummy_data.extend(DummyData(customer=customer, app_user=app_user) for app_user in new_app_users)
+
+            # Theme
+            themes = self.get_existing(Theme, customer, 'title', {item['Theme'] for item in rows if item['Theme']})
+            new_themes = []
+            for item in rows:
+                if item['Theme'] and item['Theme'] not in themes:
+                    theme = Theme(customer=customer, title=item['Theme'])
+                    themes[theme.title] = theme
+                    new_themes.append(theme)
+            Theme.objects.bulk_create(new_themes)
+            dummy_data.extend(DummyData(customer=customer, theme=theme) for theme in new_themes)
+
+            # FeatureRequest
+            feature_requests = self.get_existing(
+                FeatureRequest, customer, 'title', {item['FeatureRequest'] for item in rows if item['FeatureRequest']})
+            new_feature_requests = []
+            new_feature_request_themes = []
+            for item in rows:
+                if item['FeatureRequest'] and item['FeatureRequest'] not in feature_requests:
+                    fr = FeatureRequest(
+                        customer=customer,
+                        title=item['FeatureRequest'],
+                        state=item['feature_request_state'],
+                        priority=item['priority'],
+                        effort=item['effort'])
+                    fr.render_markdown()
+                    feature_requests[fr.title] = fr
+                    new_feature_requests.append(fr)
+                    new_feature_request_themes.append((fr, themes.get(item['Theme'])))
+            FeatureRequest.objects.bulk_create(new_feature_requests)
+            dummy_data.extend(DummyData(customer=customer, feature_request=fr) for fr in new_feature_requests)
+
+            FeatureRequestThemes = FeatureRequest.themes.through
+            fr_themes = [
+                FeatureRequestThemes(featurerequest_id=fr.pk, theme_id=theme.pk)
+                for fr, theme in new_feature_request_themes if theme]
+            FeatureRequestThemes.objects.bulk_create(fr_themes)
+            Theme.objects.add_usage('total_feature_requests', Counter(fr_theme.theme_id for fr_theme in fr_themes))
 
+            # Feedback
+            feedbacks = self.get_existing(Feedback, customer, 'problem', {item['Feedback'] for item in rows})
+            new_feedback = []
+            for item in rows:
+                if item['Feedback'] not in feedbacks:
+                    feedback = Feedback(
+                        customer=customer,
+                        feature_request=feature_requests.get(item['FeatureRequest']),
+                        user=app_users[item['email']],
+                        problem=item['Feedback'],
+                        state=item['feedback_state'],
+                        feedback_type=item['type'])
+                    feedback.render_markdown()
+                    feedback.fingerprint_problem()
+                    feedbacks[feedback.problem] = feedback
+                    new_feedback.append(feedback)
+            FeedbackIngestRules.for_customer(customer.id).apply_to_batch(new_feedback)
+            Feedback.objects.bulk_create(new_feedback)
+            dummy_data.extend(DummyData(customer=customer, feedback=feedback) for feedback in new_feedback)
+
+            self.bulk_create(dummy_data)
+
+            # What save() would have done.
+            if new_feature_requests:
+                OnboardingTask.objects.complete_task(customer.id, OnboardingTask.TASK_CREATE_FEATURE_REQUEST)
+                CustomerStats.objects.increment(
+                    customer.id,
+                    shipped_feature_requests=sum(fr.state == FeatureRequest.SHIPPED for fr in new_feature_requests))
+            if new_feedback:
+                OnboardingTask.objects.complete_task(customer.id, OnboardingTask.TASK_CREATE_FEEDBACK)
+                CustomerStats.objects.feedback_bulk_created(customer.id, new_feedback)
+
+        # What the signals would have done.
+        for domain in {app_user.email_domain for app_user in new_app_users}:
+            cache.delete(get_domain_company_cache_key(customer.id, domain))
+        invalidate_feature_request_search(customer.id)
+        self.refresh_cache(customer.id)
 
     def delete_data(self, customer):
-        to_delete = self.get_queryset().filter(customer=customer)
-        for item in to_delete:
-            try:
-                item.reference.delete()
-            except (AppUser.DoesNotExist, AppCompany.DoesNotExist, Feedback.DoesNotExist,
-                FeatureRequest.DoesNotExist, Theme.DoesNotExist):
-                # Cacades mean that deleting something like an AppCompany might also
-                # delete an AppUser. We can savely ignore that.
-                pass
-            item.delete()
+        """
+        Deletes everything load_data created. Like delete() anything that
+        cascades from it goes too and anything that's SET_NULL, like the
+        customer's own feedback on a sample feature request, is kept. See
+        common.purge.Purge.
+        """
+        # In the order they're purged. Purging an object purges the DummyData
+        # rows pointing at it so we read them all up front.
+        fields = {
+            Feedback: 'feedback_id',
+            FeatureRequest: 'feature_request_id',
+            Theme: 'theme_id',
+            AppUser: 'app_user_id',
+            AppCompany: 'app_company_id',
+        }
+        references = list(self.get_queryset().filter(customer=customer).values(*fields.values()))
+        Purge(f"dummy_data_{customer.id}").run(*(
+            model.objects.filter(customer=customer, pk__in=[row[field] for row in references if row[field]])
+            for model, field in fields.items()))
+        self.get_queryset().filter(customer=customer).delete()
+
+        # The purge skips save(), delete() and signals.
+        CustomerStats.objects.rebuild(customer.id)
+        Theme.objects.rebuild_usage(customer.id)
+        invalidate_customer_cache(customer.id)
+        invalidate_feature_request_search(customer.id)
 
 class DummyData(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
@@ -163,4 +255,9 @@ class DummyData(models.Model):
         if self.theme is not None:
             return self.theme
 
-        raise AssertionError("No item referenced in dummy data row")
\ No newline at end of file
+        raise AssertionError("No item referenced in dummy data row")
+
+@receiver(post_save, sender=DummyData)
+@receiver(post_delete, sender=DummyData)
+def refresh_has_dummy_data_cache(sender, instance, **kwargs):
+    DummyData.objects.refresh_cache(instance.customer_id)
@@ -1,3 +1,196 @@
 from django.test import TestCase
 
-# Create your tests here.
+from accounts.models import Customer
+from appaccounts.models import AppCompany, AppUser, FilterableAttribute
+from feedback.models import (
+    CustomerStats,
+    FeatureRequest,
+    Feedback,
+    FeedbackImporter,
+    Theme,
+)
+
+from .models import DummyData, DummyDataCompanyAttributeMapper, read_dummy_data
+
+
+def load_data_one_at_a_time(customer):
+    # How load_data used to work: get_or_create per row and per model, with
+    # save() and the signals doing the bookkeeping.
+    source = FeedbackImporter.objects.get(name="Intercom")
+    rows = read_dummy_data()
+    for item in rows:
+        app_company, created = AppCompany.objects.get_or_create(
+            customer=customer, name=item["AppCompany"]
+        )
+        if created:
+            DummyData.objects.create(customer=customer, app_company=app_company)
+            mapper = DummyDataCompanyAttributeMapper(customer, item, source)
+            mapper.create_filterable_attributes()
+            app_company.filterable_attributes = (
+                mapper.get_filterable_attributes_as_dict()
+            )
+            app_company.save()
+    for item in rows:
+        app_user, created = AppUser.objects.get_or_create(
+            customer=customer,
+            company=AppCompany.objects.get(customer=customer, name=item["AppCompany"]),
+            name=item["AppUser"],
+            email=item["email"],
+        )
+        if created:
+            DummyData.objects.create(customer=customer, app_user=app_user)
+    for item in rows:
+        if item["Theme"]:
+            theme, created = Theme.objects.get_or_create(
+                customer=customer, title=item["Theme"]
+            )
+            if created:
+                DummyData.objects.create(customer=customer, theme=theme)
+    for item in rows:
+        if item["FeatureRequest"]:
+            fr, created = FeatureRequest.objects.get_or_create(
+                customer=customer,
+                title=item["FeatureRequest"],
+                state=item["feature_request_state"],
+                priority=item["priority"],
+                effort=item["effort"],
+            )
+            if created:
+                if item["Theme"]:
+                    fr.themes.add(
+                        Theme.objects.get(customer=customer, title=item["Theme"])
+                    )
+                DummyData.objects.create(customer=customer, feature_request=fr)
+    for item in rows:
+        fr = None
+        if item["FeatureRequest"]:
+            fr = FeatureRequest.objects.get(
+                customer=customer, title=item["FeatureRequest"]
+            )
+        feedback, created = Feedback.objects.get_or_create(
+            customer=customer,
+            feature_request=fr,
+            user=AppUser.objects.get(customer=customer, email=item["email"]),
+            problem=item["Feedback"],
+            state=item["feedback_state"],
+            feedback_type=item["type"],
+        )
+        if created:
+            DummyData.objects.create(customer=customer, feedback=feedback)
+
+
+class DummyDataTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = self.create_customer("Acme")
+
+    def create_customer(self, name):
+        customer = Customer.objects.create(name=name)
+        CustomerStats.objects.rebuild(customer.id)
+        return customer
+
+    def get_snapshot(self, customer):
+        stats = CustomerStats.objects.get(customer=customer)
+        dummy_data = DummyData.objects.filter(customer=customer)
+        return {
+            "stats": (
+                stats.total_feedback,
+                stats.active_feedback,
+                stats.pending_feedback,
+                stats.shipped_feature_requests,
+            ),
+            "themes": sorted(
+                Theme.objects.filter(customer=customer).values_list(
+                    "title", "total_feedback", "total_feature_requests"
+                )
+            ),
+            "dummy_data": {
+                field: dummy_data.filter(**{f"{field}__isnull": False}).count()
+                for field in (
+                    "app_company",
+                    "app_user",
+                    "theme",
+                    "feature_request",
+                    "feedback",
+                )
+            },
+            "companies": sorted(
+                (company.name, sorted(company.filterable_attributes.items()))
+                for company in AppCompany.objects.filter(customer=customer)
+            ),
+            "app_users": sorted(
+                AppUser.objects.filter(customer=customer).values_list(
+                    "name", "email", "company__name"
+                )
+            ),
+            "feature_requests": sorted(
+                FeatureRequest.objects.filter(customer=customer).values_list(
+                    "title", "state", "priority", "effort", "themes__title"
+                ),
+                key=str,
+            ),
+            "feedback": sorted(
+                Feedback.objects.filter(customer=customer).values_list(
+                    "problem",
+                    "state",
+                    "feedback_type",
+                    "feature_request__title",
+                    "user__email",
+                ),
+                key=str,
+            ),
+            "filterable_attributes": sorted(
+                FilterableAttribute.objects.filter(customer=customer).values_list(
+                    "name", "related_object_type"
+                )
+            ),
+        }
+
+    def test_load_data_matches_loading_one_at_a_time(self):
+        other_customer = self.create_customer("Other")
+
+        DummyData.objects.load_data(self.customer)
+        load_data_one_at_a_time(other_customer)
+
+        snapshot = self.get_snapshot(self.customer)
+        self.assertEqual(snapshot, self.get_snapshot(other_customer))
+        self.assertEqual(snapshot["stats"][0], len(read_dummy_data()))
+        self.assertTrue(DummyData.objects.customer_has_dummy_data(self.customer.id))
+
+    def test_loading_twice_creates_nothing_new(self):
+        DummyData.objects.load_data(self.customer)
+        snapshot = self.get_snapshot(self.customer)
+
+        DummyData.objects.load_data(self.customer)
+
+        self.assertEqual(self.get_snapshot(self.customer), snapshot)
+
+    def test_delete_data(self):
+        # The customer's own feedback on a sample feature request stays.
+        DummyData.objects.load_data(self.customer)
+        feature_request = FeatureRequest.objects.filter(customer=self.customer).first()
+        theme = Theme.objects.create(customer=self.customer, title="Mine")
+        feedback = Feedback.objects.create(
+            customer=self.customer,
+            feature_request=feature_request,
+            problem="My own feedback",
+            feedback_type=Feedback.EXISTING,
+        )
+        feedback.themes.add(theme)
+
+        DummyData.objects.delete_data(self.customer)
+
+        snapshot = self.get_snapshot(self.customer)
+        self.assertEqual(snapshot["stats"], (1, 1, 0, 0))
+        self.assertEqual(snapshot["themes"], [("Mine", 1, 0)])
+        self.assertEqual(
+            snapshot["dummy_data"], dict.fromkeys(snapshot["dummy_data"], 0)
+        )
+        self.assertEqual(snapshot["companies"], [])
+        self.assertEqual(snapshot["app_users"], [])
+        self.assertEqual(snapshot["feature_requests"], [])
+        self.assertEqual(
+            snapshot["feedback"],
+            [("My own feedback", Feedback.ACTIVE, Feedback.EXISTING, None, None)],
+        )
+        self.assertFalse(DummyData.objects.customer_has_dummy_data(self.customer.id))
@@ -1,4 +1,4 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 
 from .models import (
     CustomerFeedbackImporterSettings,
@@ -7,6 +7,24 @@ from .models import (
     FeedbackImporter,
     Theme,
 )
+from .tasks import undo_import
+
+
+def undo_imports(modeladmin, request, queryset):
+    imports = set(
+        queryset.exclude(import_token="")
+        .values_list("customer_id", "import_token")
+        .distinct()
+    )
+    for customer_id, import_token in imports:
+        undo_import.delay(customer_id, import_token)
+    messages.success(
+        request,
+        f"Deleting everything from {len(imports)} import(s) in the background.",
+    )
+
+
+undo_imports.short_description = "Undo the imports these came from"
 
 
 class FeedbackImporterAdmin(admin.ModelAdmin):
@@ -33,6 +51,8 @@ class FeedbackAdmin(admin.ModelAdmin):
     list_display = ("short_problem", "feature_request", "state", "user", "created_by")
     list_filter = ("updated", "source_updated", "customer", "source", "state")
     readonly_fields = ("user", "feature_request", "themes", "feedback_type")
+    search_fields = ("import_token",)
+    actions = (undo_imports,)
 
     def short_problem(self, obj):
         return obj.get_problem_snippet()
@@ -48,6 +68,7 @@ class FeatureRequestAdmin(admin.ModelAdmin):
         "description",
         "import_token",
     )
+    actions = (undo_imports,)
 
 
 class ThemeAdmin(admin.ModelAdmin):
@@ -4,8 +4,9 @@ import datetime
 from django.core.mail import mail_admins
 from html2text import html2text
 from appaccounts.models import AppUser, AppCompany
+from common.cache import invalidate_customer_cache
 from common.utils import textify_html
-from feedback.models import FeatureRequest, Feedback, Theme
+from feedback.models import CustomerStats, FeatureRequest, Feedback, Theme
 from .admin_forms import UploadFeedbackForm
 
 class AdminCsvFeedbackImport(object):
@@ -44,6 +45,10 @@ class AdminCsvFeedbackImport(object):
                         feedback = self.create_feedback(row, fr, user)
                         self.create_feedback_themes(row, feedback)
                 self.fix_feature_request_created()
+                # Feedback created dates are backdated with update() which
+                # the incremental counters don't see.
+                CustomerStats.objects.rebuild(self.customer.id)
+                invalidate_customer_cache(self.customer.id)
         self.send_results_email()
 
     def send_results_email(self):
@@ -263,7 +268,7 @@ Invalid rows:
                 defaults['source_url'] = row['feedback_source_url']
 
             feedback_state = row.get('feedback_state', Feedback.ARCHIVED)
-            feedback, created = Feedback.objects.get_or_create(
+            feedback, created = Feedback.objects.get_or_create_by_problem(
                 customer=self.customer,
                 problem=html2text(row['feedback_problem'].strip()),
                 feature_request=feature_request,
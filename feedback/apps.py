@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class FeedbackConfig(AppConfig):
     name = 'feedback'
+
+    def ready(self):
+        import feedback.signals  # noqa: F401
@@ -113,10 +113,9 @@ class FeedbackCreateForm(forms.ModelForm):
             self.save_m2m()
 
             if feedback.state == Feedback.ARCHIVED:
-                OnboardingTask.objects.filter(
-                    customer=feedback.customer,
-                    task_type=OnboardingTask.TASK_TRIAGE_FEEDBACK,
-                ).update(completed=True, updated=timezone.now())
+                OnboardingTask.objects.complete_task(
+                    feedback.customer_id, OnboardingTask.TASK_TRIAGE_FEEDBACK
+                )
 
             tracking.feedback_created(
                 self.request.user.id,
@@ -343,10 +342,9 @@ class FeedbackTriageEditForm(forms.ModelForm):
             self.save_m2m()
 
             if feedback.state == Feedback.ARCHIVED:
-                OnboardingTask.objects.filter(
-                    customer=feedback.customer,
-                    task_type=OnboardingTask.TASK_TRIAGE_FEEDBACK,
-                ).update(completed=True, updated=timezone.now())
+                OnboardingTask.objects.complete_task(
+                    feedback.customer_id, OnboardingTask.TASK_TRIAGE_FEEDBACK
+                )
         return feedback
 
     class Meta:
@@ -692,7 +690,9 @@ class FeatureRequestMergeForm(forms.Form):
                 id=self.cleaned_data["feature_request_to_merge"],
             )
 
-            fr_to_merge.feedback_set.all().update(feature_request=fr_to_keep)
+            fr_to_merge.feedback_set.all().update(
+                feature_request=fr_to_keep, updated=timezone.now()
+            )
 
             to_keep_title = truncatechars(fr_to_keep.title, 100)
             to_merge_title = truncatechars(fr_to_merge.title, 100)
@@ -1432,7 +1432,7 @@ class CloseLoopForm(forms.Form):
     def send_feedback_emails(self):
         users_emailed = {}
         total_emails_sent = 0
-        for feedback in self.feedback_to_notify:
+        for feedback in self.feedback_to_notify.select_related("user__company"):
             if feedback.user and feedback.user.email:
                 # Don't email the user multiple times if they've submitted
                 # feedback for this feature multiple times.
@@ -1454,14 +1454,14 @@ class CloseLoopForm(forms.Form):
         return total_emails_sent
 
     def set_feedback_notified(self):
+        now = timezone.now()
         self.feedback_to_notify.update(
-            notified_at=timezone.now(), notified_by=self.request.user
+            notified_at=now, notified_by=self.request.user, updated=now
         )
 
-        OnboardingTask.objects.filter(
-            customer=self.request.user.customer,
-            task_type=OnboardingTask.TASK_CLOSE_THE_LOOP,
-        ).update(completed=True, updated=timezone.now())
+        OnboardingTask.objects.complete_task(
+            self.request.user.customer_id, OnboardingTask.TASK_CLOSE_THE_LOOP
+        )
 
     def set_feature_request_notified(self):
         self.feature_request.state = FeatureRequest.CUSTOMER_NOTIFIED
@@ -0,0 +1,78 @@
+import timeit
+from django.core.management.base import BaseCommand
+from common import utils
+from feedback.models import Feedback
+from feedback.templatetags.filters import (
+    headless_markdownify,
+    markdownify,
+    render_headless_markdown,
+)
+
+FORWARDED_EMAIL = """**From**: Abbey Weber <abbey.weber@example.com>
+**Date**: 2020-02-10
+
+Hi team,
+
+Forwarding this along from one of our biggest accounts. They **really** want
+to be able to export their reports to CSV. See the thread below.
+
+> From: Sam Jones <sam@customer.example.com>
+> Sent: Monday, February 10, 2020 9:14 AM
+> To: Support <support@example.com>
+> Subject: Re: Exporting reports
+>
+> Thanks for getting back to me. To be clear what we need is:
+>
+> * CSV export of the *monthly* report
+> * The same for the weekly report
+> * Ideally scheduled so it lands in our inbox
+>
+> We're currently copying and pasting into a spreadsheet & it takes
+> forever. Let me know if a call would help, my number is in my signature.
+>
+> Sam Jones
+> Head of Operations | Customer Inc.
+> [www.customer.example.com](https://www.customer.example.com)
+"""
+
+
+class Command(BaseCommand):
+    help = "Times the markdown rendering used for feedback and the CMS"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--number", dest="number", type=int, default=200)
+        parser.add_argument(
+            "--repeat",
+            dest="repeat",
+            type=int,
+            default=1,
+            help="Number of times the forwarded email is repeated in each text",
+        )
+
+    def handle(self, *args, **options):
+        text = "\n\n".join([FORWARDED_EMAIL] * options["repeat"])
+        feedback = Feedback(problem=text)
+
+        benchmarks = (
+            ("markdownify", lambda: utils.markdownify(text)),
+            ("markdownify filter (cached)", lambda: markdownify(text)),
+            ("headless_markdownify", lambda: render_headless_markdown(text, True, [])),
+            ("headless_markdownify (cached)", lambda: headless_markdownify(text)),
+            ("remove_markdown", lambda: utils.remove_markdown(text)),
+            (
+                "remove_markdown (via HTML)",
+                lambda: utils.textify_html(utils.markdown(text)),
+            ),
+            ("get_problem_snippet (cached)", lambda: feedback.get_problem_snippet()),
+            ("get_problem_snippet (stored)", self.stored_snippet(feedback)),
+        )
+
+        print(f"{len(text)} chars, {options['number']} runs each")
+        for name, func in benchmarks:
+            seconds = timeit.timeit(func, number=options["number"])
+            print(f"{name:30} {seconds * 1000 / options['number']:8.3f} ms")
+
+    def stored_snippet(self, feedback):
+        stored = Feedback(problem=feedback.problem)
+        stored.render_markdown()
+        return lambda: stored.get_problem_snippet()
@@ -0,0 +1,65 @@
+import timeit
+from django.core.management.base import BaseCommand
+from django.forms import model_to_dict
+from django.utils import timezone
+from feedback.models import FeatureRequest
+
+
+class Command(BaseCommand):
+    help = "Times instantiating feature requests with and without dirty field tracking"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--number", dest="number", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        field_names = [field.attname for field in FeatureRequest._meta.concrete_fields]
+        row = {
+            "id": 1,
+            "customer_id": 1,
+            "title": "Export reports to CSV",
+            "description": "We need CSV exports " * 20,
+            "state": FeatureRequest.PLANNED,
+            "created": now,
+            "updated": now,
+        }
+        values = [row.get(name, "") for name in field_names]
+        # The old mixin would have queried every deferred field here.
+        only_names = ["id", "title"]
+        only_values = [1, row["title"]]
+
+        def tracked_fields_mixin():
+            return FeatureRequest.from_db("default", field_names, values)
+
+        def initials_mixin():
+            # What the old InitialsMixin did for every row. It also read the
+            # themes m2m, a query per row, which isn't counted here.
+            instance = FeatureRequest.from_db("default", field_names, values)
+            model_to_dict(instance, exclude=["themes"])
+            return instance
+
+        def changed_fields_initials_mixin():
+            instance = initials_mixin()
+            for _ in range(2):
+                model_to_dict(instance, exclude=["themes"])
+
+        def changed_fields_tracked():
+            instance = tracked_fields_mixin()
+            instance.has_changed("state")
+            instance.has_changed("state")
+
+        benchmarks = (
+            ("from_db (TrackedFieldsMixin)", tracked_fields_mixin),
+            ("from_db + model_to_dict (old)", initials_mixin),
+            (
+                ".only(id, title) (TrackedFieldsMixin)",
+                lambda: FeatureRequest.from_db("default", only_names, only_values),
+            ),
+            ("set_shipped_at checks (TrackedFieldsMixin)", changed_fields_tracked),
+            ("set_shipped_at checks (old)", changed_fields_initials_mixin),
+        )
+
+        print(f"{options['number']} instances each")
+        for name, func in benchmarks:
+            seconds = timeit.timeit(func, number=options["number"])
+            print(f"{name:45} {seconds * 1000000 / options['number']:8.2f} µs")
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from accounts.models import Customer
+from feedback.models import Feedback
+
+
+class Command(BaseCommand):
+    help = "Lists a customer's feedback with the same or very similar problems"
+
+    def add_arguments(self, parser):
+        parser.add_argument("customer_name", type=str)
+        parser.add_argument(
+            "--distance",
+            dest="distance",
+            type=int,
+            default=3,
+            help="Most SimHash bits near duplicates can differ by. 0 for exact duplicates only.",
+        )
+
+    def handle(self, *args, **options):
+        customer = Customer.objects.get(name=options["customer_name"])
+
+        duplicates = (
+            Feedback.objects.filter(customer=customer)
+            .exclude(problem_fingerprint="")
+            .values("problem_fingerprint")
+            .annotate(total=Count("id"))
+            .filter(total__gt=1)
+        )
+        exact_ids = set()
+        for duplicate in duplicates:
+            ids = sorted(
+                Feedback.objects.filter(
+                    customer=customer,
+                    problem_fingerprint=duplicate["problem_fingerprint"],
+                ).values_list("id", flat=True)
+            )
+            exact_ids.update((a, b) for a in ids for b in ids if a < b)
+            print(f"Exact duplicates: {', '.join(str(id) for id in ids)}")
+
+        if options["distance"]:
+            for (
+                feedback_id,
+                other_id,
+                distance,
+            ) in Feedback.objects.find_near_duplicates(
+                customer.id, options["distance"]
+            ):
+                if (feedback_id, other_id) not in exact_ids:
+                    print(
+                        f"Near duplicates ({distance} bits apart): {feedback_id}, {other_id}"
+                    )
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from feedback.models import Feedback
+
+
+class Command(BaseCommand):
+    help = "Stores the duplicate detection fingerprints for feedback problems"
+
+    def add_arguments(self, parser):
+        parser.add_argument("customer_names", nargs="?", type=str)
+        parser.add_argument(
+            "--force",
+            dest="force",
+            action="store_true",
+            default=False,
+            help="Fingerprint everything, not just rows without one",
+        )
+
+    def handle(self, *args, **options):
+        feedback = Feedback.objects.all()
+        if options["customer_names"]:
+            feedback = feedback.filter(
+                customer__name__in=options["customer_names"].split(",")
+            )
+        if not options["force"]:
+            feedback = feedback.filter(problem_fingerprint="")
+
+        total = 0
+        for obj in (
+            feedback.order_by("pk")
+            .only("pk", "problem", "problem_fingerprint", "problem_simhash")
+            .iterator(chunk_size=500)
+        ):
+            if options["force"]:
+                obj.problem_fingerprint = ""
+            if obj.fingerprint_problem():
+                # Write just the fingerprints. save() would bump updated and
+                # run all the counters and onboarding checks.
+                Feedback.objects.filter(pk=obj.pk).update(
+                    problem_fingerprint=obj.problem_fingerprint,
+                    problem_simhash=obj.problem_simhash,
+                )
+                total += 1
+        print(f"Fingerprinted {total} feedback")
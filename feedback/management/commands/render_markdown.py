@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from feedback.models import FeatureRequest, Feedback
+
+
+class Command(BaseCommand):
+    help = "Stores rendered HTML and text for feedback problems and feature request descriptions"
+
+    def add_arguments(self, parser):
+        parser.add_argument("customer_names", nargs="?", type=str)
+        parser.add_argument(
+            "--force",
+            dest="force",
+            action="store_true",
+            default=False,
+            help="Re-render everything, not just stale rows",
+        )
+
+    def handle(self, *args, **options):
+        feedback = Feedback.objects.all()
+        feature_requests = FeatureRequest.objects.all()
+        if options["customer_names"]:
+            customer_names = options["customer_names"].split(",")
+            feedback = feedback.filter(customer__name__in=customer_names)
+            feature_requests = feature_requests.filter(
+                customer__name__in=customer_names
+            )
+
+        total = self.render(
+            feedback,
+            ("problem_html", "problem_snippet", "problem_hash"),
+            options["force"],
+        )
+        print(f"Rendered {total} feedback")
+        total = self.render(
+            feature_requests,
+            ("description_html", "description_text", "description_hash"),
+            options["force"],
+        )
+        print(f"Rendered {total} feature requests")
+
+    def render(self, qs, rendered_fields, force):
+        total = 0
+        for obj in qs.order_by("pk").iterator(chunk_size=500):
+            if force:
+                setattr(obj, rendered_fields[-1], "")
+            if obj.render_markdown():
+                # Write just the rendered fields. save() would bump updated
+                # and run all the counters and onboarding checks.
+                type(obj).objects.filter(pk=obj.pk).update(
+                    **{name: getattr(obj, name) for name in rendered_fields}
+                )
+                total += 1
+        return total
@@ -0,0 +1,43 @@
+# Generated by Django 2.1.3 on 2026-10-19 13:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0040_subscription_reported_feedback_count'),
+        ('feedback', '0035_auto_20200210_1919'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_feedback', models.IntegerField(default=0)),
+                ('active_feedback', models.IntegerField(default=0)),
+                ('pending_feedback', models.IntegerField(default=0)),
+                ('shipped_feature_requests', models.IntegerField(default=0)),
+                ('newest_feedback_created', models.DateTimeField(blank=True, null=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='accounts.Customer')),
+                ('newest_feedback', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='feedback.Feedback')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FeedbackCountBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('count', models.IntegerField(default=0)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='accounts.Customer')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='feedbackcountbucket',
+            unique_together={('customer', 'hour')},
+        ),
+    ]
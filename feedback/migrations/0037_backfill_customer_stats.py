@@ -0,0 +1,71 @@
+# Generated by Django 2.1.3 on 2026-10-19 13:25
+from datetime import timedelta
+from django.db import migrations
+from django.db.models import Count, Q
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+
+def backfill_customer_stats(apps, schema_editor):
+    Customer = apps.get_model('accounts', 'Customer')
+    CustomerStats = apps.get_model('feedback', 'CustomerStats')
+    FeedbackCountBucket = apps.get_model('feedback', 'FeedbackCountBucket')
+    Feedback = apps.get_model('feedback', 'Feedback')
+    FeatureRequest = apps.get_model('feedback', 'FeatureRequest')
+
+    # One grouped query per counter rather than one per customer.
+    feedback_counts = {
+        row['customer_id']: row for row in Feedback.objects.values('customer_id').annotate(
+            total=Count('id'),
+            active=Count('id', filter=Q(state='ACTIVE')),
+            pending=Count('id', filter=Q(state='PENDING'))).order_by()
+    }
+    shipped_counts = dict(
+        FeatureRequest.objects.filter(state='SHIPPED')
+        .values_list('customer_id').annotate(total=Count('id')).order_by())
+    newest_feedback = {
+        feedback.customer_id: feedback for feedback in
+        Feedback.objects.order_by('customer_id', '-created', '-id').distinct('customer_id')
+    }
+
+    stats = []
+    for customer_id in Customer.objects.values_list('id', flat=True):
+        counts = feedback_counts.get(customer_id, {})
+        newest = newest_feedback.get(customer_id)
+        stats.append(CustomerStats(
+            customer_id=customer_id,
+            total_feedback=counts.get('total', 0),
+            active_feedback=counts.get('active', 0),
+            pending_feedback=counts.get('pending', 0),
+            shipped_feature_requests=shipped_counts.get(customer_id, 0),
+            newest_feedback=newest,
+            newest_feedback_created=newest.created if newest else None))
+    CustomerStats.objects.bulk_create(stats, batch_size=500)
+
+    cutoff = timezone.now() - timedelta(days=8)
+    hourly_counts = (
+        Feedback.objects.filter(created__gte=cutoff)
+        .annotate(hour=TruncHour('created'))
+        .values_list('customer_id', 'hour')
+        .annotate(count=Count('id'))
+        .order_by())
+    FeedbackCountBucket.objects.bulk_create([
+        FeedbackCountBucket(customer_id=customer_id, hour=hour, count=count)
+        for customer_id, hour, count in hourly_counts
+    ], batch_size=500)
+
+
+def remove_customer_stats(apps, schema_editor):
+    apps.get_model('feedback', 'CustomerStats').objects.all().delete()
+    apps.get_model('feedback', 'FeedbackCountBucket').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback', '0036_customerstats'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_customer_stats, remove_customer_stats),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 2.1.3 on 2026-10-19 13:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback', '0037_backfill_customer_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='featurerequest',
+            name='description_hash',
+            field=models.CharField(blank=True, editable=False, max_length=40),
+        ),
+        migrations.AddField(
+            model_name='featurerequest',
+            name='description_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='featurerequest',
+            name='description_text',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='feedback',
+            name='problem_hash',
+            field=models.CharField(blank=True, editable=False, max_length=40),
+        ),
+        migrations.AddField(
+            model_name='feedback',
+            name='problem_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='feedback',
+            name='problem_snippet',
+            field=models.TextField(blank=True, editable=False),
+        ),
+    ]
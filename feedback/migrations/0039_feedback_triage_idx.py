@@ -0,0 +1,17 @@
+# Generated by Django 2.1.3 on 2026-10-19 13:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback', '0038_rendered_markdown'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['customer', 'state', 'created', 'id'], name='feedback_triage_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 2.1.3 on 2026-10-19 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback', '0039_feedback_triage_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feedback',
+            name='idempotency_key',
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name='feedback',
+            unique_together={('customer', 'idempotency_key')},
+        ),
+    ]
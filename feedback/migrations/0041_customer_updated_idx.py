@@ -0,0 +1,21 @@
+# Generated by Django 2.1.3 on 2026-10-19 13:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback', '0040_feedback_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='featurerequest',
+            index=models.Index(fields=['customer', 'updated'], name='fr_customer_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['customer', 'updated'], name='feedback_customer_updated'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.1.3 on 2026-10-19 13:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback', '0041_customer_updated_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feedback',
+            name='problem_fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='feedback',
+            name='problem_simhash',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['customer', 'problem_fingerprint'], name='feedback_fingerprint_idx'),
+        ),
+    ]
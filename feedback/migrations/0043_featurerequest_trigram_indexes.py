@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("feedback", "0042_feedback_problem_fingerprint"),
+        # Creates the pg_trgm extension.
+        ("appaccounts", "0017_add_indexes_to_appuser_email_and_name"),
+    ]
+
+    # Index the expressions Django's icontains uses so the feature request
+    # autocomplete doesn't scan every row. See
+    # appaccounts/migrations/0017_add_indexes_to_appuser_email_and_name.py.
+    operations = [
+        migrations.RunSQL(
+            "CREATE INDEX feedback_featurerequest_title_trigram ON feedback_featurerequest USING gin (UPPER(title) gin_trgm_ops);",
+            "DROP INDEX feedback_featurerequest_title_trigram",
+        ),
+        migrations.RunSQL(
+            "CREATE INDEX feedback_featurerequest_description_trigram ON feedback_featurerequest USING gin (UPPER(description) gin_trgm_ops);",
+            "DROP INDEX feedback_featurerequest_description_trigram",
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 2.1.3 on 2026-10-19 13:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback', '0043_featurerequest_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='theme',
+            name='total_feature_requests',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='theme',
+            name='total_feedback',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        # Same as ThemeManager.rebuild_usage() for everyone.
+        migrations.RunSQL(
+            """
+            UPDATE feedback_theme SET
+                total_feedback = (SELECT COUNT(*) FROM feedback_feedback_themes WHERE theme_id = feedback_theme.id),
+                total_feature_requests = (SELECT COUNT(*) FROM feedback_featurerequest_themes WHERE theme_id = feedback_theme.id);
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -1,20 +1,36 @@
 import uuid
-from django.db import models
-from django.db.models import Count, Sum, FloatField
-from django.db.models.functions import Cast
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum, FloatField
+from django.db.models.functions import Cast, Coalesce, TruncHour
 from django.conf import settings
+from django.core.cache import cache
 from django.contrib.postgres.fields.jsonb import KeyTextTransform
 from django.urls import reverse
+from django.template.defaultfilters import truncatechars
 from django.utils import timezone
-from datetime import datetime
-from common.utils import get_class, remove_markdown
-from common.model_mixins import InitialsMixin
-from accounts.models import Customer, User, OnboardingTask
+from django.utils.safestring import mark_safe
+from datetime import datetime, timedelta
+from common.utils import cached_markdownify, cached_remove_markdown, content_fingerprint, content_simhash, get_class, hamming_distance, markdown_hash, markdownify, remove_markdown
+from common.cache import get_customer_cache_key, invalidate_customer_cache
+from common.model_mixins import TrackedFieldsMixin
+from accounts.models import Customer, FeedbackTriageSettings, User, OnboardingTask
 from appaccounts.models import AppUser, FilterableAttribute
 
 def generate_webhook_secret():
     return str(uuid.uuid4())
 
+def render_markdown_for_save(instance, save_kwargs, source_field, rendered_fields, render=None):
+    # Brings the instance's rendered markdown (or whatever else `render`
+    # derives from the source field) up to date before a save. If save() was
+    # only asked to save some fields the rendered ones need to go along with
+    # the source field.
+    update_fields = save_kwargs.get('update_fields')
+    if update_fields is not None and source_field not in update_fields:
+        return
+    render = render or instance.render_markdown
+    if render() and update_fields is not None:
+        save_kwargs['update_fields'] = list(update_fields) + list(rendered_fields)
+
 class FeedbackImporter(models.Model):
     name = models.CharField(max_length=255)
     module = models.CharField(max_length=255)
@@ -55,6 +71,9 @@ class CustomerFeedbackImporterSettings(models.Model):
 
     def do_import(self, all_data=False):
         self.get_importer().execute(all_data=all_data)
+        # Imports bring in new attribute values so cached filter choices
+        # and the like are out of date.
+        invalidate_customer_cache(self.customer_id)
 
     def get_importer(self):
         importer_class = get_class(self.importer.module)
@@ -65,6 +84,35 @@ class CustomerFeedbackImporterSettings(models.Model):
         self.refresh_token = new_refresh_token
         self.save()
 
+class ThemeManager(models.Manager):
+    def add_usage(self, counter, deltas_by_theme_id):
+        """
+        Adds to `counter` ('total_feedback' or 'total_feature_requests') for
+        each theme id. Themes with the same delta share an UPDATE.
+        """
+        theme_ids_by_delta = {}
+        for theme_id, delta in deltas_by_theme_id.items():
+            if delta:
+                theme_ids_by_delta.setdefault(delta, []).append(theme_id)
+        for delta, theme_ids in theme_ids_by_delta.items():
+            self.get_queryset().filter(pk__in=theme_ids).update(**{counter: F(counter) + delta})
+
+    def rebuild_usage(self, customer_id):
+        """
+        Recounts the customer's theme usage from scratch. The counters are
+        kept up to date by the m2m_changed and pre_delete handlers in
+        feedback/signals.py but anything that skips them (raw SQL,
+        bulk_create of the through rows) makes them drift.
+        """
+        def count(through):
+            return Coalesce(Subquery(
+                through.objects.filter(theme_id=OuterRef('pk')).order_by()
+                .values('theme_id').annotate(total=Count('*')).values('total')), 0)
+
+        return self.get_queryset().filter(customer_id=customer_id).update(
+            total_feedback=count(Feedback.themes.through),
+            total_feature_requests=count(FeatureRequest.themes.through))
+
 class Theme(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
 
@@ -72,9 +120,16 @@ class Theme(models.Model):
     color = models.CharField(max_length=30, blank=True)
     import_token = models.CharField(blank=True, max_length=36, help_text="Used to keep track of all of the items created in a single admin import for easy deletion in case of disaster.")
 
+    # How many feedback and feature requests have this theme. See
+    # ThemeManager.
+    total_feedback = models.IntegerField(default=0, editable=False)
+    total_feature_requests = models.IntegerField(default=0, editable=False)
+
     created = models.DateTimeField(auto_now_add=True, editable=False)
     updated = models.DateTimeField(auto_now=True, editable=False)
 
+    objects = ThemeManager()
+
     class Meta:
         unique_together = [['customer', 'title']]
         ordering = ['title']
@@ -104,7 +159,7 @@ class FeatureRequestQuerySet(models.QuerySet):
             qs = qs.annotate(total_mrr=Sum(Cast(None, FloatField())))
         return qs
 
-class FeatureRequest(InitialsMixin, models.Model):
+class FeatureRequest(TrackedFieldsMixin, models.Model):
     UNTRIAGED = 'UNTRIAGED'
     UNDER_CONSIDERATION = 'UNDER_CONSIDERATION'
     PLANNED = 'PLANNED'
@@ -176,37 +231,183 @@ class FeatureRequest(InitialsMixin, models.Model):
     import_token = models.CharField(blank=True, max_length=36, help_text="Used to keep track of all of the items created in a single admin import for easy deletion in case of disaster.")
 
     shipped_at = models.DateTimeField(null=True, blank=True)
+
+    # Rendered versions of description. See render_markdown().
+    description_html = models.TextField(blank=True, editable=False)
+    description_text = models.TextField(blank=True, editable=False)
+    description_hash = models.CharField(blank=True, max_length=40, editable=False)
+
     created = models.DateTimeField(auto_now_add=True, editable=False)
     updated = models.DateTimeField(auto_now=True, editable=False)
 
     objects = FeatureRequestQuerySet().as_manager()
 
+    # See TrackedFieldsMixin.
+    tracked_fields = ('state',)
+
+    class Meta:
+        indexes = [
+            # API updated_since polling and conditional GETs.
+            models.Index(fields=['customer', 'updated'], name='fr_customer_updated'),
+        ]
+
     def __str__(self):
         return f"{self.title}"
 
     def set_shipped_at(self):
         # If this FR was just set to shipped, set shipped_at
-        if "state" in self.changed_fields() and self.state == FeatureRequest.SHIPPED:
+        if self.has_changed('state') and self.state == FeatureRequest.SHIPPED:
             self.shipped_at = timezone.now()
 
         # If this FR was shipped, but now isn't, null out shipped_at
-        if "state" in self.changed_fields() and self.state != FeatureRequest.SHIPPED:
+        if self.has_changed('state') and self.state != FeatureRequest.SHIPPED:
             self.shipped_at = None
 
+    def render_markdown(self):
+        """
+        Renders description to HTML and plain text if it's changed since we
+        last did. Returns True if anything changed.
+        """
+        description_hash = markdown_hash(self.description)
+        if description_hash == self.description_hash:
+            return False
+        self.description_html = markdownify(self.description)
+        self.description_text = remove_markdown(self.description)
+        self.description_hash = description_hash
+        return True
+
+    def has_rendered_markdown(self):
+        # Queryset updates and old rows won't have rendered the current
+        # description.
+        return self.description_hash == markdown_hash(self.description)
+
+    def get_description_html(self):
+        if self.has_rendered_markdown():
+            html = self.description_html
+        else:
+            html = cached_markdownify(self.description)
+        return mark_safe(html)
+
+    def get_description_text(self):
+        if self.has_rendered_markdown():
+            return self.description_text
+        return cached_remove_markdown(self.description)
+
     def save(self, *args, **kwargs):
         self.set_shipped_at()
+        render_markdown_for_save(self, kwargs, 'description', ('description_html', 'description_text', 'description_hash'))
 
-        if not self.id:
-            OnboardingTask.objects.filter(customer=self.customer, task_type=OnboardingTask.TASK_CREATE_FEATURE_REQUEST).update(completed=True, updated=timezone.now())
-        super(FeatureRequest, self).save(*args, **kwargs)
+        created = not self.id
+        if created:
+            previous_state = None
+            OnboardingTask.objects.complete_task(self.customer_id, OnboardingTask.TASK_CREATE_FEATURE_REQUEST)
+        else:
+            previous_state = self.get_loaded_value('state')
+
+        with transaction.atomic():
+            super(FeatureRequest, self).save(*args, **kwargs)
+            CustomerStats.objects.feature_request_saved(self, previous_state)
+
+        # We've now saved the state so it's no longer a change.
+        self.reset_tracked_fields()
 
 
+def get_feature_request_search_generation(customer_id):
+    # Part of the feature request autocomplete's cache keys. Bumped by
+    # invalidate_feature_request_search.
+    return cache.get_or_set(get_customer_cache_key(customer_id, 'fr_search_generation'), 1, None)
+
+def invalidate_feature_request_search(customer_id):
+    try:
+        cache.incr(get_customer_cache_key(customer_id, 'fr_search_generation'))
+    except ValueError:
+        pass
+
 class FeedbackManager(models.Manager):
     def unsnooze_feedback(self):
-        return Feedback.objects.filter(snooze_till__lte=timezone.now()).update(
-            snooze_till=None, state=Feedback.ACTIVE)
-
-class Feedback(models.Model):
+        to_unsnooze = Feedback.objects.filter(snooze_till__lte=timezone.now())
+        with transaction.atomic():
+            customer_ids = set(to_unsnooze.values_list('customer_id', flat=True))
+            # Bump updated so API pollers see the state change.
+            total = to_unsnooze.update(snooze_till=None, state=Feedback.ACTIVE, updated=timezone.now())
+            # update() skips save() so the state counters need a refresh.
+            for customer_id in customer_ids:
+                CustomerStats.objects.rebuild(customer_id)
+        return total
+
+    def filter_by_problem(self, customer, problem, **kwargs):
+        # Matches on the indexed fingerprint rather than the problem text.
+        # Rows saved before fingerprints existed have a blank one until the
+        # fingerprint_feedback command backfills them.
+        return self.filter(
+            Q(problem_fingerprint=content_fingerprint(problem)) | Q(problem_fingerprint='', problem=problem),
+            customer=customer, **kwargs).order_by('pk')
+
+    def get_or_create_by_problem(self, customer, problem, defaults=None, **kwargs):
+        """
+        Like get_or_create(customer=customer, problem=problem, ...) but the
+        lookup uses the (customer, problem_fingerprint) index so it stays
+        fast however much feedback the customer has. Problems that only
+        differ in whitespace count as the same.
+        """
+        feedback = self.filter_by_problem(customer, problem, **kwargs).first()
+        if feedback:
+            return feedback, False
+        params = {**kwargs, **(defaults or {})}
+        return self.create(customer=customer, problem=problem, **params), True
+
+    def update_or_create_by_problem(self, customer, problem, defaults=None, create_defaults=None, **kwargs):
+        """
+        Like update_or_create(customer=customer, problem=problem, ...), see
+        get_or_create_by_problem. `create_defaults` are only set when the
+        feedback is created, e.g. an import_token so undo_import doesn't
+        delete feedback the import merely updated.
+        """
+        defaults = defaults or {}
+        with transaction.atomic():
+            feedback = self.filter_by_problem(customer, problem, **kwargs).select_for_update().first()
+            if feedback is None:
+                params = {**kwargs, **defaults, **(create_defaults or {})}
+                return self.create(customer=customer, problem=problem, **params), True
+            for name, value in defaults.items():
+                setattr(feedback, name, value)
+            feedback.save()
+        return feedback, False
+
+    def find_near_duplicates(self, customer_id, max_distance=3):
+        """
+        Returns (feedback_id, other_feedback_id, distance) for each pair of
+        the customer's feedback whose problem SimHashes differ in at most
+        `max_distance` bits, closest first.
+
+        The hashes are split into max_distance + 1 bands. Two hashes that
+        close must match exactly on at least one band so only feedback
+        sharing a band is ever compared.
+        """
+        hashes = dict(self.filter(customer_id=customer_id, problem_simhash__isnull=False)
+                      .values_list('id', 'problem_simhash'))
+        band_count = max_distance + 1
+        band_bits = -(-64 // band_count)
+        band_mask = (1 << band_bits) - 1
+        buckets = {}
+        for feedback_id, simhash in hashes.items():
+            for band in range(band_count):
+                key = (band, (simhash >> (band * band_bits)) & band_mask)
+                buckets.setdefault(key, []).append(feedback_id)
+
+        pairs = {}
+        for ids in buckets.values():
+            for i, feedback_id in enumerate(ids):
+                for other_id in ids[i + 1:]:
+                    pair = (min(feedback_id, other_id), max(feedback_id, other_id))
+                    if pair in pairs:
+                        continue
+                    distance = hamming_distance(hashes[feedback_id], hashes[other_id])
+                    if distance <= max_distance:
+                        pairs[pair] = distance
+        return sorted((a, b, distance) for (a, b), distance in pairs.items())
+
+class Feedback(TrackedFieldsMixin, models.Model):
     ACTIVE = 'ACTIVE'
     PENDING = 'PENDING'
     ARCHIVED = 'ARCHIVED'
@@ -263,6 +464,10 @@ class Feedback(models.Model):
     feedback_type = models.CharField(blank=False, choices=TYPE_CHOICES, max_length=30)
     snooze_till = models.DateTimeField(null=True, blank=True)
     import_token = models.CharField(blank=True, max_length=36, help_text="Used to keep track of all of the items created in a single admin import for easy deletion in case of disaster.")
+    # Client supplied key that makes retried bulk API requests safe. NULL
+    # rather than blank when there isn't one so the unique constraint
+    # ignores it.
+    idempotency_key = models.CharField(null=True, blank=True, max_length=255, editable=False)
 
     notified_by = models.ForeignKey(User, null=True, blank=True, related_name='notified_users', on_delete=models.SET_NULL)
     notified_at = models.DateTimeField(null=True, blank=True)
@@ -270,57 +475,74 @@ class Feedback(models.Model):
     source_created = models.DateTimeField(null=True, blank=True)
     source_updated = models.DateTimeField(null=True, blank=True)
 
+    # Rendered versions of problem. See render_markdown().
+    problem_html = models.TextField(blank=True, editable=False)
+    problem_snippet = models.TextField(blank=True, editable=False)
+    problem_hash = models.CharField(blank=True, max_length=40, editable=False)
+    # Used to find duplicate problems without comparing the text. See
+    # fingerprint_problem().
+    problem_fingerprint = models.CharField(blank=True, max_length=64, editable=False)
+    problem_simhash = models.BigIntegerField(null=True, blank=True, editable=False)
+
     created = models.DateTimeField(auto_now_add=True, editable=False)
     updated = models.DateTimeField(auto_now=True, editable=False)
 
     objects = FeedbackManager()
 
+    # See TrackedFieldsMixin. save() keeps CustomerStats up to date when the
+    # state changes.
+    tracked_fields = ('state',)
+
+    # We store the snippet truncated to this. Anything longer gets rendered
+    # on the fly.
+    MAX_STORED_SNIPPET_LENGTH = 1000
+
+    class Meta:
+        unique_together = (('customer', 'idempotency_key'),)
+        indexes = [
+            # Triage inbox ordering and prev/next navigation.
+            models.Index(fields=['customer', 'state', 'created', 'id'], name='feedback_triage_idx'),
+            # API updated_since polling and conditional GETs.
+            models.Index(fields=['customer', 'updated'], name='feedback_customer_updated'),
+            # Deduping on problem when importing.
+            models.Index(fields=['customer', 'problem_fingerprint'], name='feedback_fingerprint_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         override_auto_triage = kwargs.pop('override_auto_triage', False)
 
         if self.state != Feedback.PENDING: # If we aren't pending clear snooze_til
             self.snooze_till = None
 
-        # If this is a new piece of feedback and the feedback_type isn't already
-        # set then set it to the user configured default.
-        if not self.id and not self.feedback_type:
-            self.feedback_type = self.get_default_feedback_type()
+        # New feedback gets the user configured default feedback_type and
+        # auto-triage.
+        if not self.id:
+            FeedbackIngestRules.for_customer(self.customer_id).apply(self, override_auto_triage)
 
-        # Auto-triage if required
-        if not self.id and not override_auto_triage and self.skip_inbox():
-            self.state = Feedback.ARCHIVED
+        render_markdown_for_save(self, kwargs, 'problem', ('problem_html', 'problem_snippet', 'problem_hash'))
+        render_markdown_for_save(self, kwargs, 'problem', ('problem_fingerprint', 'problem_simhash'), self.fingerprint_problem)
 
         # Checkoff onboarding task
-        if not self.id:
-            OnboardingTask.objects.filter(customer=self.customer, task_type=OnboardingTask.TASK_CREATE_FEEDBACK).update(completed=True, updated=timezone.now())
-        super(Feedback, self).save(*args, **kwargs)
+        created = not self.id
+        if created:
+            previous_state = None
+            OnboardingTask.objects.complete_task(self.customer_id, OnboardingTask.TASK_CREATE_FEEDBACK)
+        else:
+            previous_state = self.get_loaded_value('state')
+
+        with transaction.atomic():
+            super(Feedback, self).save(*args, **kwargs)
+            CustomerStats.objects.feedback_saved(self, created, previous_state)
+
+        # We've now saved the state so it's no longer a change.
+        self.reset_tracked_fields()
 
     def skip_inbox(self):
-        triage_settings = self.customer.feedbacktriagesettings_set.first()
-        if triage_settings:
-            skip = triage_settings.skip_inbox_if_feature_request_set and self.feature_request
-        else:
-            skip = False
-        return skip
+        return FeedbackIngestRules.for_customer(self.customer_id).skip_inbox(self)
 
     def get_default_feedback_type(self):
         # Returns the user configured default feedback_type
-        default_choice = ""
-        if self.user:
-            try:
-                rule = FeedbackFromRule.objects.get(customer=self.customer)
-                if rule.filterable_attribute:
-                    if rule.filterable_attribute.related_object_type == FilterableAttribute.OBJECT_TYPE_APPUSER:
-                        value = self.user.filterable_attributes.get(rule.filterable_attribute.name, "")
-                        if rule.get_coerced_trigger_value() == value:
-                            default_choice = rule.default_feedback_type
-                    elif rule.filterable_attribute.related_object_type == FilterableAttribute.OBJECT_TYPE_APPCOMPANY and self.user.company:
-                        value = self.user.company.filterable_attributes.get(rule.filterable_attribute.name, "")
-                        if rule.get_coerced_trigger_value() == value:
-                            default_choice = rule.default_feedback_type
-            except (FeedbackFromRule.DoesNotExist, ValueError):
-                pass
-        return default_choice
+        return FeedbackIngestRules.for_customer(self.customer_id).get_default_feedback_type(self)
 
     def has_structured_content(self):
         return self.title or self.problem or self.solution
@@ -334,9 +556,45 @@ class Feedback(models.Model):
     def __repr__(self):
         return f"{self.title}"
 
-    # Problem can be markdown and displaying markdown is lists and messages
-    # looks like ass. Use this method to get nice snippet for display.
-    def get_problem_snippet(self, snippet_length=100, join_char="\n"):
+    def render_markdown(self):
+        """
+        Renders problem to HTML and a plain text snippet if it's changed since
+        we last did. Returns True if anything changed.
+        """
+        problem_hash = markdown_hash(self.problem)
+        if problem_hash == self.problem_hash:
+            return False
+        self.problem_html = markdownify(self.problem or "N/A")
+        self.problem_snippet = remove_markdown(
+            self.get_problem_markdown_for_snippet(), length=Feedback.MAX_STORED_SNIPPET_LENGTH)
+        self.problem_hash = problem_hash
+        return True
+
+    def fingerprint_problem(self):
+        """
+        Stores an exact (SHA-256) and a near duplicate (SimHash) fingerprint
+        of problem. Returns True if either changed.
+        """
+        problem_fingerprint = content_fingerprint(self.problem)
+        if problem_fingerprint == self.problem_fingerprint and self.problem_simhash is not None:
+            return False
+        self.problem_fingerprint = problem_fingerprint
+        self.problem_simhash = content_simhash(self.problem)
+        return True
+
+    def has_rendered_markdown(self):
+        # Queryset updates and old rows won't have rendered the current
+        # problem.
+        return self.problem_hash == markdown_hash(self.problem)
+
+    def get_problem_html(self):
+        if self.has_rendered_markdown():
+            html = self.problem_html
+        else:
+            html = cached_markdownify(self.problem or "N/A")
+        return mark_safe(html)
+
+    def get_problem_markdown_for_snippet(self):
         # Sometimes we are forced to turn converstation threads into
         # one big lump. When we do that we prefix the individual convos
         # like this:
@@ -349,8 +607,21 @@ class Feedback(models.Model):
                 lines = lines[2:]
         except IndexError:
             pass
-        problem_markdown = "\n".join(lines)
-        markdown_less = remove_markdown(problem_markdown, length=snippet_length, join_char=join_char)
+        return "\n".join(lines)
+
+    # Problem can be markdown and displaying markdown is lists and messages
+    # looks like ass. Use this method to get nice snippet for display.
+    def get_problem_snippet(self, snippet_length=100, join_char="\n"):
+        use_stored_snippet = (
+            join_char == "\n" and
+            snippet_length and
+            snippet_length <= Feedback.MAX_STORED_SNIPPET_LENGTH and
+            self.has_rendered_markdown())
+        if use_stored_snippet:
+            markdown_less = truncatechars(self.problem_snippet, snippet_length)
+        else:
+            markdown_less = cached_remove_markdown(
+                self.get_problem_markdown_for_snippet(), length=snippet_length, join_char=join_char)
         if markdown_less:
             snippet = markdown_less
         else:
@@ -391,3 +662,313 @@ class FeedbackTemplate(models.Model):
 
     created = models.DateTimeField(auto_now_add=True, editable=False)
     updated = models.DateTimeField(auto_now=True, editable=False)
+
+
+class FeedbackIngestRules(object):
+    """
+    A customer's settings that apply to feedback as it comes in: auto-triage
+    (FeedbackTriageSettings), the default feedback type (FeedbackFromRule)
+    and the problem template (FeedbackTemplate).
+
+    They're read on every new piece of feedback so they're cached per
+    customer. feedback/signals.py invalidates the cache when any of them
+    change.
+    """
+
+    CACHE_TIMEOUT = 24 * 60 * 60
+
+    def __init__(self, skip_inbox_if_feature_request_set=False, type_rule=None, template=None):
+        self.skip_inbox_if_feature_request_set = skip_inbox_if_feature_request_set
+        # None or (related_object_type, attribute name, trigger value, feedback type)
+        self.type_rule = type_rule
+        # None if the customer doesn't have one.
+        self.template = template
+
+    @classmethod
+    def get_cache_key(cls, customer_id):
+        return get_customer_cache_key(customer_id, 'feedback_ingest_rules')
+
+    @classmethod
+    def for_customer(cls, customer_id):
+        rules = cache.get(cls.get_cache_key(customer_id))
+        if rules is None:
+            rules = cls.load(customer_id)
+            cache.set(cls.get_cache_key(customer_id), rules, cls.CACHE_TIMEOUT)
+        return rules
+
+    @classmethod
+    def refresh_cache(cls, customer_id):
+        cache.delete(cls.get_cache_key(customer_id))
+
+    @classmethod
+    def load(cls, customer_id):
+        triage_settings = FeedbackTriageSettings.objects.filter(customer_id=customer_id).order_by('id').first()
+
+        type_rule = None
+        rule = FeedbackFromRule.objects.filter(customer_id=customer_id).select_related('filterable_attribute').order_by('id').first()
+        if rule and rule.filterable_attribute:
+            try:
+                type_rule = (
+                    rule.filterable_attribute.related_object_type,
+                    rule.filterable_attribute.name,
+                    rule.get_coerced_trigger_value(),
+                    rule.default_feedback_type,
+                )
+            except ValueError:
+                # The trigger value doesn't fit the attribute's type so it
+                # can never match.
+                pass
+
+        template = FeedbackTemplate.objects.filter(customer_id=customer_id).order_by('id').first()
+        return cls(
+            skip_inbox_if_feature_request_set=bool(triage_settings and triage_settings.skip_inbox_if_feature_request_set),
+            type_rule=type_rule,
+            template=template.template if template else None,
+        )
+
+    def skip_inbox(self, feedback):
+        return bool(self.skip_inbox_if_feature_request_set and feedback.feature_request_id)
+
+    def get_default_feedback_type(self, feedback):
+        if not self.type_rule or not feedback.user_id:
+            return ""
+        related_object_type, name, trigger_value, feedback_type = self.type_rule
+        if related_object_type == FilterableAttribute.OBJECT_TYPE_APPUSER:
+            attributes = feedback.user.filterable_attributes
+        elif related_object_type == FilterableAttribute.OBJECT_TYPE_APPCOMPANY and feedback.user.company_id:
+            attributes = feedback.user.company.filterable_attributes
+        else:
+            return ""
+        return feedback_type if attributes.get(name, "") == trigger_value else ""
+
+    def apply(self, feedback, override_auto_triage=False):
+        """
+        Sets the default feedback_type and auto-triages new, unsaved
+        feedback.
+        """
+        if not feedback.feedback_type:
+            feedback.feedback_type = self.get_default_feedback_type(feedback)
+        if not override_auto_triage and self.skip_inbox(feedback):
+            feedback.state = Feedback.ARCHIVED
+
+    def apply_to_batch(self, feedbacks, override_auto_triage=False):
+        """
+        apply() for a batch of feedback that's about to be bulk created.
+        The users and companies the default type rule needs are loaded in
+        one query rather than one per feedback.
+        """
+        if self.type_rule:
+            user_ids = {feedback.user_id for feedback in feedbacks if feedback.user_id and not feedback.feedback_type}
+            users = AppUser.objects.select_related('company').in_bulk(user_ids)
+            for feedback in feedbacks:
+                if feedback.user_id in users:
+                    feedback.user = users[feedback.user_id]
+        for feedback in feedbacks:
+            self.apply(feedback, override_auto_triage)
+
+
+class CustomerStatsManager(models.Manager):
+    def for_customer(self, customer):
+        try:
+            return customer.stats
+        except CustomerStats.DoesNotExist:
+            stats = self.rebuild(customer.id)
+            customer.stats = stats
+            return stats
+
+    def rebuild(self, customer_id):
+        """
+        Recomputes all of the counters for a customer from scratch. Used to
+        create missing rows, after bulk changes that skip save() and by the
+        nightly reconciliation.
+        """
+        feedback = Feedback.objects.filter(customer_id=customer_id)
+        counts = feedback.aggregate(
+            total=Count('id'),
+            active=Count('id', filter=Q(state=Feedback.ACTIVE)),
+            pending=Count('id', filter=Q(state=Feedback.PENDING)))
+        newest = feedback.order_by('-created', '-id').first()
+        shipped = FeatureRequest.objects.filter(
+            customer_id=customer_id, state=FeatureRequest.SHIPPED).count()
+
+        with transaction.atomic():
+            stats, created = self.get_queryset().update_or_create(
+                customer_id=customer_id,
+                defaults={
+                    'total_feedback': counts['total'],
+                    'active_feedback': counts['active'],
+                    'pending_feedback': counts['pending'],
+                    'shipped_feature_requests': shipped,
+                    'newest_feedback': newest,
+                    'newest_feedback_created': newest.created if newest else None,
+                })
+            FeedbackCountBucket.objects.rebuild(customer_id)
+        return stats
+
+    def increment(self, customer_id, **deltas):
+        # Atomic in the DB so concurrent writers can't lose updates. If the
+        # customer doesn't have a row yet this is a no-op and the row gets
+        # built from scratch the first time it's read.
+        updates = {name: F(name) + delta for name, delta in deltas.items() if delta}
+        if updates:
+            self.get_queryset().filter(customer_id=customer_id).update(
+                updated=timezone.now(), **updates)
+
+    def get_state_deltas(self, state, delta):
+        if state == Feedback.ACTIVE:
+            return {'active_feedback': delta}
+        elif state == Feedback.PENDING:
+            return {'pending_feedback': delta}
+        return {}
+
+    def feedback_saved(self, feedback, created, previous_state):
+        if created:
+            deltas = self.get_state_deltas(feedback.state, 1)
+            self.increment(feedback.customer_id, total_feedback=1, **deltas)
+            self.get_queryset().filter(
+                Q(newest_feedback_created__isnull=True) | Q(newest_feedback_created__lte=feedback.created),
+                customer_id=feedback.customer_id,
+            ).update(newest_feedback=feedback, newest_feedback_created=feedback.created)
+            FeedbackCountBucket.objects.add(feedback.customer_id, feedback.created, 1)
+        elif previous_state != feedback.state:
+            deltas = self.get_state_deltas(previous_state, -1)
+            for name, delta in self.get_state_deltas(feedback.state, 1).items():
+                deltas[name] = deltas.get(name, 0) + delta
+            self.increment(feedback.customer_id, **deltas)
+
+    def feedback_bulk_created(self, customer_id, feedbacks):
+        # The same bookkeeping as feedback_saved for feedback that was
+        # inserted with bulk_create, with one update per counter rather than
+        # one per row.
+        if not feedbacks:
+            return
+        deltas = {'total_feedback': len(feedbacks)}
+        for feedback in feedbacks:
+            for name, delta in self.get_state_deltas(feedback.state, 1).items():
+                deltas[name] = deltas.get(name, 0) + delta
+        self.increment(customer_id, **deltas)
+
+        newest = max(feedbacks, key=lambda f: (f.created, f.id))
+        self.get_queryset().filter(
+            Q(newest_feedback_created__isnull=True) | Q(newest_feedback_created__lte=newest.created),
+            customer_id=customer_id,
+        ).update(newest_feedback=newest, newest_feedback_created=newest.created)
+
+        hourly_counts = {}
+        for feedback in feedbacks:
+            hour = feedback.created.replace(minute=0, second=0, microsecond=0)
+            hourly_counts[hour] = hourly_counts.get(hour, 0) + 1
+        for hour, count in hourly_counts.items():
+            FeedbackCountBucket.objects.add(customer_id, hour, count)
+
+    def feedback_deleted(self, feedback):
+        deltas = self.get_state_deltas(feedback.state, -1)
+        self.increment(feedback.customer_id, total_feedback=-1, **deltas)
+        FeedbackCountBucket.objects.add(feedback.customer_id, feedback.created, -1)
+
+        # Deleting the newest feedback nulls out newest_feedback so we need
+        # to go and find the new newest one.
+        stats = self.get_queryset().filter(
+            customer_id=feedback.customer_id,
+            newest_feedback__isnull=True,
+            total_feedback__gt=0)
+        if stats.exists():
+            newest = Feedback.objects.filter(
+                customer_id=feedback.customer_id).order_by('-created', '-id').first()
+            stats.update(
+                newest_feedback=newest,
+                newest_feedback_created=newest.created if newest else None)
+
+    def feature_request_saved(self, feature_request, previous_state):
+        was_shipped = previous_state == FeatureRequest.SHIPPED
+        is_shipped = feature_request.state == FeatureRequest.SHIPPED
+        if was_shipped != is_shipped:
+            self.increment(
+                feature_request.customer_id,
+                shipped_feature_requests=1 if is_shipped else -1)
+
+    def feature_request_deleted(self, feature_request):
+        if feature_request.state == FeatureRequest.SHIPPED:
+            self.increment(feature_request.customer_id, shipped_feature_requests=-1)
+
+
+class CustomerStats(models.Model):
+    """
+    Per customer counters kept up to date as Feedback and FeatureRequests are
+    created, change state and are deleted so the sidenav, billing and
+    onboarding code don't have to COUNT(*) the customer's feedback on every
+    request. See CustomerStatsManager.rebuild for fixing them up after changes
+    that bypass save().
+    """
+    customer = models.OneToOneField(Customer, on_delete=models.CASCADE, related_name='stats')
+
+    total_feedback = models.IntegerField(default=0)
+    active_feedback = models.IntegerField(default=0)
+    pending_feedback = models.IntegerField(default=0)
+    shipped_feature_requests = models.IntegerField(default=0)
+    newest_feedback = models.ForeignKey(Feedback, null=True, blank=True, related_name='+', on_delete=models.SET_NULL)
+    newest_feedback_created = models.DateTimeField(null=True, blank=True)
+
+    created = models.DateTimeField(auto_now_add=True, editable=False)
+    updated = models.DateTimeField(auto_now=True, editable=False)
+
+    objects = CustomerStatsManager()
+
+
+class FeedbackCountBucketManager(models.Manager):
+    # We only need enough history to answer the rolling windows we show.
+    RETENTION = timedelta(days=8)
+
+    def add(self, customer_id, when, delta):
+        hour = when.replace(minute=0, second=0, microsecond=0)
+        buckets = self.get_queryset().filter(customer_id=customer_id, hour=hour)
+        if buckets.update(count=F('count') + delta) or delta < 0:
+            return
+        if hour < timezone.now() - self.RETENTION:
+            return
+        try:
+            with transaction.atomic():
+                self.get_queryset().create(customer_id=customer_id, hour=hour, count=delta)
+        except IntegrityError:
+            # Someone else created the bucket first.
+            buckets.update(count=F('count') + delta)
+
+    def total_since(self, customer_id, since):
+        since = since.replace(minute=0, second=0, microsecond=0)
+        total = self.get_queryset().filter(
+            customer_id=customer_id, hour__gte=since).aggregate(total=Sum('count'))['total']
+        return total or 0
+
+    def rebuild(self, customer_id):
+        cutoff = timezone.now() - self.RETENTION
+        self.get_queryset().filter(customer_id=customer_id).delete()
+        hourly_counts = (
+            Feedback.objects.filter(customer_id=customer_id, created__gte=cutoff)
+            .annotate(hour=TruncHour('created'))
+            .values_list('hour')
+            .annotate(count=Count('id'))
+            .order_by())
+        self.get_queryset().bulk_create([
+            FeedbackCountBucket(customer_id=customer_id, hour=hour, count=count)
+            for hour, count in hourly_counts
+        ])
+
+    def prune(self):
+        cutoff = timezone.now() - self.RETENTION
+        return self.get_queryset().filter(hour__lt=cutoff).delete()
+
+
+class FeedbackCountBucket(models.Model):
+    """
+    How much feedback a customer created in a given hour. Summing the last
+    168 of these answers "feedback in the last 7 days" without scanning the
+    customer's feedback.
+    """
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
+    hour = models.DateTimeField()
+    count = models.IntegerField(default=0)
+
+    objects = FeedbackCountBucketManager()
+
+    class Meta:
+        unique_together = (('customer', 'hour'),)
@@ -0,0 +1,126 @@
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from accounts.models import FeedbackTriageSettings
+from appaccounts.models import AppUser, FilterableAttribute
+from feedback.models import (
+    CustomerStats,
+    Feedback,
+    FeatureRequest,
+    FeedbackFromRule,
+    FeedbackIngestRules,
+    FeedbackTemplate,
+    Theme,
+    invalidate_feature_request_search,
+)
+
+
+@receiver(post_delete, sender=Feedback)
+def update_stats_for_deleted_feedback(sender, instance, **kwargs):
+    CustomerStats.objects.feedback_deleted(instance)
+
+
+@receiver(post_delete, sender=FeatureRequest)
+def update_stats_for_deleted_feature_request(sender, instance, **kwargs):
+    CustomerStats.objects.feature_request_deleted(instance)
+
+
+@receiver(post_save, sender=FeedbackTriageSettings)
+@receiver(post_delete, sender=FeedbackTriageSettings)
+@receiver(post_save, sender=FeedbackFromRule)
+@receiver(post_delete, sender=FeedbackFromRule)
+@receiver(post_save, sender=FeedbackTemplate)
+@receiver(post_delete, sender=FeedbackTemplate)
+@receiver(post_save, sender=FilterableAttribute)
+@receiver(post_delete, sender=FilterableAttribute)
+def refresh_feedback_ingest_rules(sender, instance, **kwargs):
+    FeedbackIngestRules.refresh_cache(instance.customer_id)
+
+
+@receiver(post_save, sender=FeatureRequest)
+@receiver(post_delete, sender=FeatureRequest)
+@receiver(post_save, sender=Theme)
+@receiver(post_delete, sender=Theme)
+def refresh_feature_request_search(sender, instance, **kwargs):
+    invalidate_feature_request_search(instance.customer_id)
+
+
+@receiver(m2m_changed, sender=FeatureRequest.themes.through)
+def refresh_feature_request_search_for_themes(sender, instance, action, **kwargs):
+    if action.startswith("post_"):
+        invalidate_feature_request_search(instance.customer_id)
+
+
+def count_theme_changes(counter, instance, action, reverse, model, pk_set):
+    if action == "pre_remove":
+        # remove() sends every id it was given, linked or not, so note the
+        # ones that are actually linked and only uncount those.
+        if reverse:
+            linked = model.objects.filter(themes=instance, pk__in=pk_set)
+        else:
+            linked = instance.themes.filter(pk__in=pk_set)
+        instance._linked_ids_before_remove = list(linked.values_list("id", flat=True))
+        return
+    if action == "post_remove":
+        pk_set = instance.__dict__.pop("_linked_ids_before_remove", pk_set)
+
+    if not reverse:
+        # Some themes added to or removed from one feedback/feature request.
+        if action == "pre_clear":
+            instance._theme_ids_before_clear = list(
+                instance.themes.values_list("id", flat=True)
+            )
+        elif action in ("post_add", "post_remove", "post_clear"):
+            if action == "post_clear":
+                pk_set = instance.__dict__.pop("_theme_ids_before_clear", [])
+            delta = 1 if action == "post_add" else -1
+            Theme.objects.add_usage(counter, {theme_id: delta for theme_id in pk_set})
+    elif action in ("post_add", "post_remove"):
+        # Some feedback/feature requests added to or removed from one theme.
+        delta = len(pk_set) if action == "post_add" else -len(pk_set)
+        Theme.objects.add_usage(counter, {instance.pk: delta})
+    elif action == "post_clear":
+        Theme.objects.filter(pk=instance.pk).update(**{counter: 0})
+
+
+@receiver(m2m_changed, sender=Feedback.themes.through)
+def count_feedback_themes(sender, instance, action, reverse, model, pk_set, **kwargs):
+    count_theme_changes("total_feedback", instance, action, reverse, model, pk_set)
+
+
+@receiver(m2m_changed, sender=FeatureRequest.themes.through)
+def count_feature_request_themes(
+    sender, instance, action, reverse, model, pk_set, **kwargs
+):
+    count_theme_changes(
+        "total_feature_requests", instance, action, reverse, model, pk_set
+    )
+
+
+# Deletes cascade to the m2m rows without an m2m_changed signal.
+@receiver(pre_delete, sender=Feedback)
+def uncount_deleted_feedback_themes(sender, instance, **kwargs):
+    Theme.objects.filter(feedback=instance).update(
+        total_feedback=F("total_feedback") - 1
+    )
+
+
+@receiver(pre_delete, sender=FeatureRequest)
+def uncount_deleted_feature_request_themes(sender, instance, **kwargs):
+    Theme.objects.filter(featurerequest=instance).update(
+        total_feature_requests=F("total_feature_requests") - 1
+    )
+
+
+# Deleting these nulls out Feedback's foreign key without saving the
+# feedback, so bump `updated` ourselves for the API's ETags and
+# updated_since.
+@receiver(pre_delete, sender=FeatureRequest)
+def touch_feedback_for_deleted_feature_request(sender, instance, **kwargs):
+    Feedback.objects.filter(feature_request=instance).update(updated=timezone.now())
+
+
+@receiver(pre_delete, sender=AppUser)
+def touch_feedback_for_deleted_app_user(sender, instance, **kwargs):
+    Feedback.objects.filter(user=instance).update(updated=timezone.now())
@@ -7,8 +7,10 @@ from django.template import loader
 from django.utils import timezone
 from io import StringIO
 from accounts.models import Customer, User, StatusEmailSettings
-from appaccounts.models import FilterableAttribute
-from .models import CustomerFeedbackImporterSettings, FeatureRequest, Feedback
+from appaccounts.models import AppCompany, AppUser, FilterableAttribute
+from common.cache import invalidate_customer_cache
+from common.purge import Purge
+from .models import CustomerFeedbackImporterSettings, CustomerStats, FeatureRequest, Feedback, FeedbackCountBucket, Theme, invalidate_feature_request_search
 from .admin_csv_importer import AdminCsvFeedbackImport
 
 @shared_task
@@ -30,6 +32,41 @@ def import_feedback(cfis_id, notify_user_id):
 def unsnooze_feedback():
     Feedback.objects.unsnooze_feedback()
 
+@shared_task
+def reconcile_customer_stats():
+    """
+    CustomerStats and theme usage counts are kept up to date incrementally
+    but anything that bypasses save() and signals (queryset updates, raw
+    SQL, manual fixes) can make them drift. Rebuild them all from scratch
+    and drop expired hourly buckets.
+    """
+    for customer in Customer.objects.all():
+        CustomerStats.objects.rebuild(customer.id)
+        Theme.objects.rebuild_usage(customer.id)
+    FeedbackCountBucket.objects.prune()
+
+def get_import_purge_name(customer_id, import_token):
+    return f"import_{customer_id}_{import_token}"
+
+@shared_task(acks_late=True)
+def undo_import(customer_id, import_token):
+    """
+    Deletes everything an import created, found by its import_token, in
+    small batches. See common.purge.Purge. Importers only set the token on
+    the rows they create.
+    """
+    assert import_token
+    deleted = Purge(get_import_purge_name(customer_id, import_token)).run(*(
+        model.objects.filter(customer_id=customer_id, import_token=import_token)
+        for model in (Feedback, FeatureRequest, Theme, AppUser, AppCompany)))
+
+    # The purge skips save(), delete() and signals.
+    CustomerStats.objects.rebuild(customer_id)
+    Theme.objects.rebuild_usage(customer_id)
+    invalidate_customer_cache(customer_id)
+    invalidate_feature_request_search(customer_id)
+    return dict(deleted)
+
 @shared_task
 def admin_csv_feedback_import(customer_id, filename, import_type):
     try:
@@ -1,13 +1,14 @@
 from bs4 import BeautifulSoup
 from django import template
 from django.contrib.messages import constants as DEFAULT_MESSAGE_LEVELS
+from django.core.cache import cache
 from django.http.request import QueryDict
 from django.template import Context
 from django.template.defaultfilters import pluralize
 from django.template.loader import get_template
 from django.utils import timezone
 from django.utils.safestring import mark_safe
-from markdown import markdown
+from markdown import Markdown
 from markdown.extensions import Extension
 from markdown.treeprocessors import Treeprocessor
 
@@ -22,12 +23,6 @@ class InlineImageProcessor(Treeprocessor):
             element.set("class", "img-border img-fluid")
 
 
-class EscapeHtml(Extension):
-    def extendMarkdown(self, md, md_globals):
-        del md.preprocessors["html_block"]
-        del md.inlinePatterns["html"]
-
-
 class ImageStyling(Extension):
     def extendMarkdown(self, md):
         # Register the new treeprocessor
@@ -51,8 +46,7 @@ def markdownify(text):
     # When using the editor users can add linebreaks and the WYSIWYG
     # is borked if we don't respect them. This is what Stack and GitHub
     # do we're in good company.
-    text_as_html = markdown(text, extensions=[EscapeHtml(), "nl2br", "prependnewline"])
-    return mark_safe(f'<div class="markdownified">{text_as_html}</div>')
+    return mark_safe(utils.cached_markdownify(text))
 
 
 @register.simple_tag(takes_context=False)
@@ -74,12 +68,32 @@ def headless_markdownify(text, prependnewline=True, parent_element_classes=[]):
     # To call this in your template use e.g.
     # {% headless_markdownify item.list False 'list-unstyled feature-list' %}
 
+    # CMS content only changes when it's published so the rendered fragment
+    # is cached against the text and arguments that produced it.
+    cache_key = "headless_markdownify_{}".format(
+        utils.markdown_hash(f"{prependnewline}|{parent_element_classes}|{text}")
+    )
+    text_as_html = cache.get(cache_key)
+    if text_as_html is None:
+        text_as_html = render_headless_markdown(
+            text, prependnewline, parent_element_classes
+        )
+        cache.set(cache_key, text_as_html, utils.MARKDOWN_CACHE_TIMEOUT)
+    return mark_safe(text_as_html)
+
+
+def render_headless_markdown(text, prependnewline, parent_element_classes):
     if prependnewline:
-        extensions = [ImageStyling(), "nl2br", "prependnewline"]
+        md = utils.get_markdown_converter(
+            "headless_prependnewline",
+            lambda: Markdown(extensions=[ImageStyling(), "nl2br", "prependnewline"]),
+        )
     else:
-        extensions = [ImageStyling(), "nl2br"]
+        md = utils.get_markdown_converter(
+            "headless", lambda: Markdown(extensions=[ImageStyling(), "nl2br"])
+        )
 
-    text_as_html = markdown(text, extensions=extensions)
+    text_as_html = md.convert(text)
 
     if parent_element_classes:
         soup = BeautifulSoup(text_as_html)
@@ -91,12 +105,12 @@ def headless_markdownify(text, prependnewline=True, parent_element_classes=[]):
         except IndexError:
             pass
 
-    return mark_safe(f"{text_as_html}")
+    return f"{text_as_html}"
 
 
 @register.filter
 def remove_markdown(text):
-    return utils.remove_markdown(text)
+    return utils.cached_remove_markdown(text)
 
 
 @register.filter
@@ -1,3 +1,295 @@
+import datetime
+
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import Customer, User
+from appaccounts.models import AppCompany, AppUser
+
+from .models import (
+    CustomerStats,
+    FeatureRequest,
+    Feedback,
+    FeedbackCountBucket,
+    Theme,
+)
+from .tasks import undo_import
+from .triage import TriageNavigator
+
+
+class FeedbackTestMixin(object):
+    def setUp(self):
+        super().setUp()
+        self.customer = Customer.objects.create(name="Acme")
+        self.user = User.objects.create_user(
+            "owner@example.com",
+            "password",
+            customer=self.customer,
+            role=User.ROLE_OWNER,
+        )
+
+    def create_feedback(self, **kwargs):
+        kwargs.setdefault("problem", "It's broken")
+        kwargs.setdefault("feedback_type", Feedback.EXISTING)
+        return Feedback.objects.create(customer=self.customer, **kwargs)
+
+
+class TriageNavigatorTestCase(FeedbackTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        # The inbox lists newest first: 4, 3, 2, 1.
+        now = timezone.now()
+        self.feedback = []
+        for age in range(4, 0, -1):
+            feedback = self.create_feedback()
+            created = now - datetime.timedelta(hours=age)
+            Feedback.objects.filter(pk=feedback.pk).update(created=created)
+            feedback.created = created
+            self.feedback.append(feedback)
+        cache.delete(self.get_navigator(self.feedback[0]).get_session_cache_key())
+
+    def get_navigator(self, feedback):
+        return TriageNavigator(self.user, feedback, session_size=10)
+
+    def triage(self, feedback):
+        feedback.state = Feedback.ARCHIVED
+        feedback.save()
+
+    def test_next_and_previous(self):
+        f1, f2, f3, f4 = self.feedback
+
+        self.assertEqual(self.get_navigator(f3).get_next_id(), f2.pk)
+        self.assertEqual(self.get_navigator(f2).get_next_id(), f1.pk)
+        self.assertEqual(self.get_navigator(f2).get_previous_id(), f3.pk)
+        # Wrapping around.
+        self.assertEqual(self.get_navigator(f1).get_next_id(), f4.pk)
+        self.assertEqual(self.get_navigator(f4).get_previous_id(), f1.pk)
+
+    def test_next_uses_the_session(self):
+        f1, f2, f3, f4 = self.feedback
+        self.get_navigator(f4).get_next_id()
+
+        # Just checking the cached ids are still active.
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_navigator(f3).get_next_id(), f2.pk)
+
+    def test_previous_skips_triaged_feedback_in_the_session(self):
+        f1, f2, f3, f4 = self.feedback
+        self.assertEqual(self.get_navigator(f3).get_next_id(), f2.pk)
+
+        self.triage(f3)
+
+        self.assertEqual(self.get_navigator(f2).get_previous_id(), f4.pk)
+
+    def test_next_skips_feedback_a_teammate_triaged(self):
+        f1, f2, f3, f4 = self.feedback
+        self.assertEqual(self.get_navigator(f4).get_next_id(), f3.pk)
+
+        self.triage(f2)
+
+        self.assertEqual(self.get_navigator(f3).get_next_id(), f1.pk)
+        self.triage(f1)
+        # Nothing left in the session so back to the queries, which wrap.
+        self.assertEqual(self.get_navigator(f3).get_next_id(), f4.pk)
+
+
+class FeatureRequestFeedbackDetailsViewTestCase(FeedbackTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.feature_request = FeatureRequest.objects.create(
+            customer=self.customer, title="Export to CSV"
+        )
+        self.url = reverse(
+            "feature-request-feedback-details", kwargs={"pk": self.feature_request.pk}
+        )
+
+    def add_feedback(self, count):
+        start = Feedback.objects.count()
+        for i in range(start, start + count):
+            company = AppCompany.objects.create(customer=self.customer, name=f"Co {i}")
+            app_user = AppUser.objects.create(
+                customer=self.customer,
+                company=company,
+                name=f"User {i}",
+                email=f"user{i}@co{i}.example.com",
+            )
+            self.create_feedback(
+                feature_request=self.feature_request,
+                user=app_user,
+                problem=f"I need CSV exports #{i}",
+            )
+
+    def get_details(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_query_count_doesnt_grow_with_feedback(self):
+        self.add_feedback(1)
+        # The first request fills the per customer caches.
+        self.get_details()
+        with CaptureQueriesContext(connection) as queries:
+            self.get_details()
+        # Read now, the next request resets the query log.
+        one_feedback_queries = len(queries)
+
+        self.add_feedback(20)
+        self.get_details()
+        with self.assertNumQueries(one_feedback_queries):
+            response = self.get_details()
+        self.assertEqual(len(response.context["feature_feedback"]), 21)
+
+
+class ThemeUsageCountTestCase(FeedbackTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.billing = Theme.objects.create(customer=self.customer, title="Billing")
+        self.search = Theme.objects.create(customer=self.customer, title="Search")
+
+    def get_counts(self):
+        return dict(Theme.objects.values_list("title", "total_feedback"))
+
+    def test_removing_unlinked_themes_doesnt_uncount_them(self):
+        feedback = self.create_feedback()
+        feedback.themes.add(self.billing)
+        other = self.create_feedback()
+        other.themes.add(self.billing, self.search)
+
+        feedback.themes.remove(self.billing, self.search)
+
+        self.assertEqual(self.get_counts(), {"Billing": 1, "Search": 1})
+
+    def test_removing_unlinked_feedback_from_a_theme(self):
+        linked = self.create_feedback()
+        unlinked = self.create_feedback()
+        self.billing.feedback_set.add(linked)
+
+        self.billing.feedback_set.remove(linked, unlinked)
+
+        self.assertEqual(self.get_counts(), {"Billing": 0, "Search": 0})
+
+
+class FeedbackStateCountTestCase(FeedbackTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        CustomerStats.objects.rebuild(self.customer.id)
+        self.feedback = self.create_feedback(state=Feedback.ACTIVE)
+
+    def get_counts(self):
+        stats = CustomerStats.objects.get(customer=self.customer)
+        return stats.active_feedback, stats.pending_feedback
+
+    def test_saving_with_state_deferred(self):
+        feedback = Feedback.objects.only("id", "customer", "problem").get()
+        feedback.problem = "Still broken"
+        feedback.save()
+
+        self.assertEqual(self.get_counts(), (1, 0))
+
+    def test_changing_a_deferred_state(self):
+        feedback = Feedback.objects.defer("state").get()
+        feedback.state = Feedback.PENDING
+        feedback.save()
+        self.assertEqual(self.get_counts(), (0, 1))
+
+        # Saving again isn't another change.
+        feedback.save()
+        self.assertEqual(self.get_counts(), (0, 1))
+
+
+class UndoImportTestCase(FeedbackTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        CustomerStats.objects.rebuild(self.customer.id)
+        self.billing = Theme.objects.create(customer=self.customer, title="Billing")
+        self.kept = self.create_feedback(problem="Already here")
+        self.kept.themes.add(self.billing)
+
+    def run_import(self):
+        # Roughly what the importers do.
+        company = AppCompany.objects.create(
+            customer=self.customer, name="Imported", import_token="token"
+        )
+        app_user = AppUser.objects.create(
+            customer=self.customer,
+            company=company,
+            name="Jane",
+            email="jane@example.com",
+            import_token="token",
+        )
+        theme = Theme.objects.create(
+            customer=self.customer, title="Imported", import_token="token"
+        )
+        feature_request = FeatureRequest.objects.create(
+            customer=self.customer, title="Exports", import_token="token"
+        )
+        feature_request.themes.add(self.billing, theme)
+        for problem in ("Already here", "I need exports", "Exports please"):
+            feedback, created = Feedback.objects.update_or_create_by_problem(
+                self.customer,
+                problem,
+                defaults={
+                    "user": app_user,
+                    "feature_request": feature_request,
+                    "state": Feedback.PENDING,
+                },
+                create_defaults={"import_token": "token"},
+                feedback_type=Feedback.EXISTING,
+            )
+            feedback.themes.add(self.billing, theme)
+
+    def test_undo_import(self):
+        self.run_import()
+        self.kept.refresh_from_db()
+        self.assertEqual(self.kept.import_token, "")
+
+        deleted = undo_import(self.customer.id, "token")
+
+        self.assertEqual(deleted["feedback.Feedback"], 2)
+        # Both themes on the imported feedback and the imported theme on
+        # the feedback that was already here.
+        self.assertEqual(deleted["feedback.Feedback_themes"], 5)
+        self.assertEqual(deleted["feedback.FeatureRequest_themes"], 2)
+        # Only what the import created goes. The feedback it updated loses
+        # the imported user and feature request.
+        self.kept.refresh_from_db()
+        self.assertEqual(Feedback.objects.get(), self.kept)
+        self.assertIsNone(self.kept.user)
+        self.assertIsNone(self.kept.feature_request)
+        self.assertEqual(list(self.kept.themes.all()), [self.billing])
+        self.assertEqual(list(Theme.objects.all()), [self.billing])
+        self.assertFalse(FeatureRequest.objects.exists())
+        self.assertFalse(AppUser.objects.exists())
+        self.assertFalse(AppCompany.objects.exists())
+
+    def test_counters_are_rebuilt(self):
+        self.run_import()
+
+        undo_import(self.customer.id, "token")
 
-# Create your tests here.
+        stats = CustomerStats.objects.get(customer=self.customer)
+        self.assertEqual(
+            (
+                stats.total_feedback,
+                stats.active_feedback,
+                stats.pending_feedback,
+                stats.newest_feedback,
+            ),
+            (1, 0, 1, self.kept),
+        )
+        self.assertEqual(
+            list(
+                Theme.objects.values_list(
+                    "title", "total_feedback", "total_feature_requests"
+                )
+            ),
+            [("Billing", 1, 0)],
+        )
+        self.assertEqual(
+            sum(FeedbackCountBucket.objects.values_list("count", flat=True)), 1
+        )
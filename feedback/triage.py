@@ -0,0 +1,126 @@
+from django.core.cache import cache
+from django.db.models import Q
+
+from .models import Feedback
+
+
+class TriageNavigator(object):
+    """
+    Works out the previous and next feedback to triage from a given piece of
+    feedback.
+
+    The inbox lists ACTIVE feedback newest first (ties broken by id) so
+    "next" is the next oldest item and "previous" the next newest, both
+    wrapping around at the ends. Each direction is a keyset query on the
+    (customer, state, created, id) index.
+
+    If `session_size` is set the next `session_size` ids are also cached for
+    the user so working through the inbox with the keyboard doesn't need a
+    query per item. The session is only ever a shortcut; anything that isn't
+    in it falls back to the queries. It can also be out of date, we or a
+    teammate might have triaged some of it since, so cached ids are only
+    used if they're still ACTIVE.
+    """
+
+    SESSION_TIMEOUT = 5 * 60
+
+    def __init__(self, user, feedback, session_size=0):
+        self.user = user
+        self.feedback = feedback
+        self.session_size = session_size
+
+    def get_active_queryset(self):
+        return Feedback.objects.filter(
+            customer_id=self.user.customer_id, state=Feedback.ACTIVE
+        )
+
+    def get_older_queryset(self):
+        return (
+            self.get_active_queryset()
+            .filter(
+                Q(created__lt=self.feedback.created)
+                | Q(created=self.feedback.created, id__lt=self.feedback.id)
+            )
+            .order_by("-created", "-id")
+        )
+
+    def get_newer_queryset(self):
+        return (
+            self.get_active_queryset()
+            .filter(
+                Q(created__gt=self.feedback.created)
+                | Q(created=self.feedback.created, id__gt=self.feedback.id)
+            )
+            .order_by("created", "id")
+        )
+
+    def get_next_id(self):
+        session = self.get_session()
+        if self.feedback.id in session:
+            index = session.index(self.feedback.id)
+            next_id = self.get_first_active_id(session[index + 1 :])
+            if next_id is not None:
+                return next_id
+
+        if self.session_size:
+            window = list(
+                self.get_older_queryset().values_list("id", flat=True)[
+                    : self.session_size
+                ]
+            )
+            self.set_session([self.feedback.id] + window)
+            if window:
+                return window[0]
+        else:
+            next_id = self.get_older_queryset().values_list("id", flat=True).first()
+            if next_id is not None:
+                return next_id
+
+        # Wrap back around to the newest.
+        return (
+            self.get_active_queryset()
+            .order_by("-created", "-id")
+            .values_list("id", flat=True)
+            .first()
+        )
+
+    def get_previous_id(self):
+        session = self.get_session()
+        if self.feedback.id in session:
+            index = session.index(self.feedback.id)
+            previous_id = self.get_first_active_id(session[:index][::-1])
+            if previous_id is not None:
+                return previous_id
+
+        previous_id = self.get_newer_queryset().values_list("id", flat=True).first()
+        if previous_id is not None:
+            return previous_id
+
+        # Wrap back around to the oldest.
+        return (
+            self.get_active_queryset()
+            .order_by("created", "id")
+            .values_list("id", flat=True)
+            .first()
+        )
+
+    def get_first_active_id(self, ids):
+        # Skips anything in the session that's been triaged since we cached
+        # it. One query however many are stale.
+        if not ids:
+            return None
+        active_ids = set(
+            self.get_active_queryset().filter(id__in=ids).values_list("id", flat=True)
+        )
+        return next((id for id in ids if id in active_ids), None)
+
+    def get_session_cache_key(self):
+        return f"triage_session_{self.user.id}"
+
+    def get_session(self):
+        if not self.session_size:
+            return []
+        return cache.get(self.get_session_cache_key(), [])
+
+    def set_session(self, ids):
+        cache.set(self.get_session_cache_key(), ids, self.SESSION_TIMEOUT)
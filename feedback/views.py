@@ -5,8 +5,9 @@ import re
 
 from django.contrib import messages
 from django.contrib.messages.views import SuccessMessageMixin
-from django.db.models import Count, Max, Min, Q
-from django.http import JsonResponse
+from django.core.cache import cache
+from django.db.models import Count, Max, Min, Prefetch, Q
+from django.http import HttpResponse, JsonResponse
 from django.http.request import QueryDict
 from django.shortcuts import get_object_or_404, redirect
 from django.template.defaultfilters import pluralize, truncatechars
@@ -28,9 +29,9 @@ from ratelimit.decorators import ratelimit
 from accounts.decorators import role_required
 from accounts.models import FeatureRequestNotificationSettings, OnboardingTask, User
 from appaccounts.models import FilterableAttribute
-from common.utils import remove_markdown
+from common.utils import markdown_hash, remove_markdown
 from internal_analytics import tracking
-from prodtool.views import RequestContextMixin, ReturnUrlMixin
+from prodtool.views import CachedObjectMixin, RequestContextMixin, ReturnUrlMixin
 from sharedwidgets.headers import SortHeaders
 from sharedwidgets.widgets import SavioAutocomplete
 
@@ -57,8 +58,10 @@ from .models import (
     FeedbackFromRule,
     FeedbackTemplate,
     Theme,
+    get_feature_request_search_generation,
 )
 from .tasks import export_feature_requests_to_csv, export_feedback_to_csv
+from .triage import TriageNavigator
 
 
 class FilterFormMixin(object):
@@ -231,10 +234,15 @@ class FeedbackInboxListView(ListView):
 
 
 @method_decorator(role_required(User.ROLE_OWNER_OR_ADMIN), name="dispatch")
-class FeedbackInboxItemView(RequestContextMixin, SuccessMessageMixin, UpdateView):
+class FeedbackInboxItemView(
+    CachedObjectMixin, RequestContextMixin, SuccessMessageMixin, UpdateView
+):
     model = Feedback
     form_class = FeedbackTriageEditForm
     template_name = "feedback_update_linked_feature_requeset.html"
+    # How many upcoming items to cache for keyboard driven triage. 0 turns
+    # it off.
+    triage_session_size = 25
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -254,8 +262,9 @@ class FeedbackInboxItemView(RequestContextMixin, SuccessMessageMixin, UpdateView
         ] = FilterableAttribute.objects.get_user_display_attributes(
             self.request.user.customer
         )
-        context["previous_feedback"] = self.get_previous_item_to_triage()
-        context["next_feedback"] = self.get_next_item_to_triage()
+        navigator = self.get_triage_navigator()
+        context["previous_feedback_id"] = navigator.get_previous_id()
+        context["next_feedback_id"] = navigator.get_next_id()
         context["onboarding"] = self.request.GET.get("onboarding", "no") == "yes"
         return context
 
@@ -293,49 +302,16 @@ class FeedbackInboxItemView(RequestContextMixin, SuccessMessageMixin, UpdateView
             if self.request.GET.get("return", None) is not None:
                 return self.request.GET.get("return")
 
-            next_item = self.get_next_item_to_triage()
-            if next_item:
-                return reverse_lazy("feedback-inbox-item", kwargs={"pk": next_item.pk})
+            next_id = self.get_triage_navigator().get_next_id()
+            if next_id:
+                return reverse_lazy("feedback-inbox-item", kwargs={"pk": next_id})
             else:
                 return reverse_lazy("feedback-inbox-list", kwargs={"state": "active"})
 
-    def get_previous_item_to_triage(self):
-        # See comment at get_next_item_to_triage
-        active_qs = (
-            self.get_queryset().filter(state=Feedback.ACTIVE).order_by("-created")
+    def get_triage_navigator(self):
+        return TriageNavigator(
+            self.request.user, self.object, session_size=self.triage_session_size
         )
-        active_and_newer_qs = active_qs.filter(
-            created__gte=self.get_object().created
-        ).exclude(id=self.get_object().id)
-        if active_and_newer_qs.exists():
-            previous_item = active_and_newer_qs.last()
-        elif active_qs.exists():
-            previous_item = active_qs.last()
-        else:
-            previous_item = None
-        return previous_item
-
-    def get_next_item_to_triage(self):
-        # Right now the triage list is sorted by created desc and
-        # we don't let you change that. If we change that then
-        # this will need to change.
-
-        # Effectively we are getting the next oldest item if there
-        # is one. Otherwise we're getting the newest one so we wrap
-        # back around to the first one in the list.
-        active_qs = (
-            self.get_queryset().filter(state=Feedback.ACTIVE).order_by("-created")
-        )
-        active_and_older_qs = active_qs.filter(
-            created__lte=self.get_object().created
-        ).exclude(id=self.get_object().id)
-        if active_and_older_qs.exists():
-            next_item = active_and_older_qs[0]
-        elif active_qs.exists():
-            next_item = active_qs.first()
-        else:
-            next_item = None
-        return next_item
 
     def get_action_past_tence(self):
         action = self.request.POST.get("action")
@@ -472,7 +448,9 @@ class FeedbackCreateItemView(ReturnUrlMixin, SuccessMessageMixin, CreateView):
 
 
 @method_decorator(role_required(User.ROLE_OWNER_OR_ADMIN), name="dispatch")
-class FeedbackInboxUpdateItemView(ReturnUrlMixin, SuccessMessageMixin, UpdateView):
+class FeedbackInboxUpdateItemView(
+    CachedObjectMixin, ReturnUrlMixin, SuccessMessageMixin, UpdateView
+):
     model = Feedback
     template_name = "feedback_update_feedback.html"
     form_class = FeedbackEditForm
@@ -510,7 +488,7 @@ class FeedbackUpdateItemView(FeedbackInboxUpdateItemView):
 
 
 @method_decorator(role_required(User.ROLE_OWNER_OR_ADMIN), name="dispatch")
-class FeedbackDeleteItemView(ReturnUrlMixin, DeleteView):
+class FeedbackDeleteItemView(CachedObjectMixin, ReturnUrlMixin, DeleteView):
     model = Feedback
     template_name = "generic_confirm_delete.html"
 
@@ -540,6 +518,33 @@ class FeedbackDeleteItemView(ReturnUrlMixin, DeleteView):
 @method_decorator(role_required(User.ROLE_OWNER_OR_ADMIN), name="dispatch")
 class FeatureRequestAutocomplete(SavioAutocomplete):
     QUERY_REGEX = re.compile(r"(?P<query>.*)\s*tags?:(?P<tags>.*)")
+    # It fires on every keystroke so only send what fits in the dropdown.
+    paginate_by = 20
+    # The trigram indexes only help with queries this long. Shorter ones
+    # only search titles.
+    MIN_DESCRIPTION_QUERY_LENGTH = 3
+    RESULTS_CACHE_TIMEOUT = 60
+
+    def get(self, request, *args, **kwargs):
+        # People type, backspace and retype the same prefixes so the JSON
+        # is cached briefly per user. Saving a feature request or theme
+        # moves the customer onto a new generation of keys.
+        if not request.user.is_authenticated:
+            return super().get(request, *args, **kwargs)
+
+        cache_key = "fr_autocomplete_{}_{}_{}".format(
+            request.user.id,
+            get_feature_request_search_generation(request.user.customer_id),
+            markdown_hash(f"{type(self).__name__}?{request.GET.urlencode()}"),
+        )
+        content = cache.get(cache_key)
+        if content is not None:
+            return HttpResponse(content, content_type="application/json")
+
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(cache_key, response.content, self.RESULTS_CACHE_TIMEOUT)
+        return response
 
     def get_create_option(self, context, q):
         matches = self.QUERY_REGEX.match(q or "")
@@ -598,7 +603,12 @@ class FeatureRequestAutocomplete(SavioAutocomplete):
             else:
                 themes = None
                 query = self.q.strip()
-            qs = qs.filter(Q(title__icontains=query) | Q(description__icontains=query))
+            if len(query) < self.MIN_DESCRIPTION_QUERY_LENGTH:
+                qs = qs.filter(title__icontains=query)
+            else:
+                qs = qs.filter(
+                    Q(title__icontains=query) | Q(description__icontains=query)
+                )
             if themes:
                 # We've got one or more themes limit the results
                 # to only those results that have one of those themes.
@@ -611,10 +621,17 @@ class FeatureRequestAutocomplete(SavioAutocomplete):
                 # Since we're limiting the results based on themes, group
                 # results by theme as well.
                 order_by = ("themes__title", "title")
-        return qs.order_by(*order_by)
+        # Just what the labels need, and every result's themes in one query.
+        return (
+            qs.only("id", "title")
+            .prefetch_related(
+                Prefetch("themes", queryset=Theme.objects.only("id", "title"))
+            )
+            .order_by(*order_by)
+        )
 
     def get_result_label(self, fr):
-        theme_names = fr.themes.all().values_list("title", flat=True)
+        theme_names = [theme.title for theme in fr.themes.all()]
         if theme_names:
             themes_html = ""
             for name in theme_names:
@@ -892,7 +909,7 @@ def feature_request_ajax_create(request):
 
 
 @method_decorator(role_required(User.ROLE_OWNER_OR_ADMIN), name="dispatch")
-class FeatureRequestDeleteItemView(ReturnUrlMixin, DeleteView):
+class FeatureRequestDeleteItemView(CachedObjectMixin, ReturnUrlMixin, DeleteView):
     model = FeatureRequest
     template_name = "generic_confirm_delete.html"
 
@@ -964,7 +981,9 @@ class FeatureRequestMergeItemView(ReturnUrlMixin, FormView):
 
 
 @method_decorator(role_required(User.ROLE_OWNER_OR_ADMIN), name="dispatch")
-class FeatureRequestFeedbackDetailsView(ReturnUrlMixin, FilterFormMixin, DetailView):
+class FeatureRequestFeedbackDetailsView(
+    CachedObjectMixin, ReturnUrlMixin, FilterFormMixin, DetailView
+):
     model = FeatureRequest
     context_object_name = "feature_request"
     template_name = "feature_request_feedback_details.html"
@@ -977,22 +996,17 @@ class FeatureRequestFeedbackDetailsView(ReturnUrlMixin, FilterFormMixin, DetailV
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["days_open"] = max(1, (timezone.now() - self.get_object().created).days)
+        context["days_open"] = max(1, (timezone.now() - self.object.created).days)
         context["onboarding"] = self.request.GET.get("onboarding", "no") == "yes"
 
+        stats = self.get_feedback_stats()
+
         # feedback_duration doesn't seem to be used anywhere.
-        if self.get_object().newest and self.get_object().oldest:
-            context["feedback_duration"] = (
-                self.get_object().newest - self.get_object().oldest
-            ).days
-
-        if self.get_object().feedback_set.all().exists():
-            most_recent_feedback = (
-                self.get_object().feedback_set.all().order_by("-created")[0]
-            )
-            context["last_seen"] = max(
-                1, (timezone.now() - most_recent_feedback.created).days
-            )
+        if stats["newest"] and stats["oldest"]:
+            context["feedback_duration"] = (stats["newest"] - stats["oldest"]).days
+
+        if stats["newest"]:
+            context["last_seen"] = max(1, (timezone.now() - stats["newest"]).days)
             context["requested"] = True
         else:
             context["last_seen"] = "No requests"
@@ -1018,17 +1032,25 @@ class FeatureRequestFeedbackDetailsView(ReturnUrlMixin, FilterFormMixin, DetailV
         context["feature_feedback"] = (
             self.get_feedback_filter_form()
             .get_filtered_queryset(self.request)
-            .filter(feature_request=self.get_object())
+            .filter(feature_request=self.object)
             .select_related("user", "user__company")
         )
 
-        context["feedback_count_difference"] = (
-            self.get_object().feedback_set.all().count()
-            - context["feature_feedback"].count()
+        # The template lists all of feature_feedback anyway so counting it
+        # with len() saves a COUNT query.
+        context["feedback_count_difference"] = stats["total"] - len(
+            context["feature_feedback"]
         )
 
         return context
 
+    def get_feedback_stats(self):
+        # Everything the page needs to know about the feature request's
+        # feedback in one query.
+        return self.object.feedback_set.aggregate(
+            total=Count("id"), oldest=Min("created"), newest=Max("created")
+        )
+
     def get_filter_form_class(self):
         return FeatureListFilterForm
 
@@ -1045,17 +1067,14 @@ class FeatureRequestFeedbackDetailsView(ReturnUrlMixin, FilterFormMixin, DetailV
         return self.feedback_filter_form_instance
 
     def get_queryset(self):
-        OnboardingTask.objects.filter(
-            customer=self.request.user.customer,
-            task_type=OnboardingTask.TASK_VIEW_FEATURE_REQUEST_DETAILS,
-        ).update(completed=True, updated=timezone.now())
+        OnboardingTask.objects.complete_task(
+            self.request.user.customer_id,
+            OnboardingTask.TASK_VIEW_FEATURE_REQUEST_DETAILS,
+        )
 
         tracking.feature_request_feedback_details_viewed(self.request.user)
         qs = self.get_filter_form().get_filtered_queryset(self.request)
         qs = qs.with_counts(self.request.user.customer)
-        qs = qs.annotate(
-            oldest=Min("feedback__created"), newest=Max("feedback__created")
-        )
         qs = qs.order_by("-created")
         return qs
 
@@ -1071,7 +1090,11 @@ class ThemeListView(ListView):
 
     LIST_HEADERS = (
         ("Name", "title", {}),
-        ("Feature Requests", "total_features", {"style": "text-align: center"}),
+        (
+            "Feature Requests",
+            "total_feature_requests",
+            {"style": "text-align: center"},
+        ),
         ("Feedback", "total_feedback", {"style": "text-align: center"}),
     )
 
@@ -1091,13 +1114,9 @@ class ThemeListView(ListView):
     def get_queryset(self):
         order_by = self.get_sort_headers().get_order_by()
 
-        return (
-            Theme.objects.filter(customer=self.request.user.customer)
-            .annotate(
-                total_features=Count("featurerequest__id", distinct=True),
-                total_feedback=Count("feedback__id", distinct=True),
-            )
-            .order_by(order_by)
+        # The totals are counters on Theme, see ThemeManager.
+        return Theme.objects.filter(customer=self.request.user.customer).order_by(
+            order_by
         )
 
 
@@ -1143,7 +1162,7 @@ class ThemeUpdateItemView(ReturnUrlMixin, SuccessMessageMixin, UpdateView):
 
 
 @method_decorator(role_required(User.ROLE_OWNER_OR_ADMIN), name="dispatch")
-class ThemeDeleteItemView(DeleteView):
+class ThemeDeleteItemView(CachedObjectMixin, DeleteView):
     model = Theme
     template_name = "theme_confirm_delete.html"
     success_url = reverse_lazy("theme-list")
@@ -1168,7 +1187,7 @@ class ThemeDeleteItemView(DeleteView):
 
 
 @method_decorator(role_required(User.ROLE_OWNER_OR_ADMIN), name="dispatch")
-class CustomerFeedbackImporterSettingsDeleteItemView(DeleteView):
+class CustomerFeedbackImporterSettingsDeleteItemView(CachedObjectMixin, DeleteView):
     model = CustomerFeedbackImporterSettings
     context_object_name = "cfis"
     template_name = "cfis_confirm_delete.html"
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import SlackSettings
+from .models import InboundEmail, SlackSettings
+from .tasks import process_inbound_email
 
 class SlackSettingsAdmin(admin.ModelAdmin):
     list_display = ('customer_id', 'customer', 'user', 'slack_bot_user_id', 'slack_team_name', 
@@ -7,3 +8,18 @@ class SlackSettingsAdmin(admin.ModelAdmin):
                     'slack_feedback_channel_id', 'slack_user_id')
     
 admin.site.register(SlackSettings, SlackSettingsAdmin)
+
+
+class InboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('id', 'recipient', 'state', 'feedback', 'created', 'processed_at')
+    list_filter = ('state',)
+    search_fields = ('recipient', 'message_id')
+    raw_id_fields = ('feedback',)
+    actions = ['reprocess']
+
+    def reprocess(self, request, queryset):
+        for inbound_email in queryset.filter(state=InboundEmail.STATE_FAILED):
+            process_inbound_email.delay(inbound_email.pk)
+    reprocess.short_description = "Reprocess failed emails"
+
+admin.site.register(InboundEmail, InboundEmailAdmin)
@@ -0,0 +1,182 @@
+from datetime import timedelta
+
+from django.contrib.postgres.fields import JSONField
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+from accounts.models import User
+from feedback.models import Feedback
+
+from .utils import get_feedback_submitter_from_body
+
+
+class InboundEmailManager(models.Manager):
+    def create_from_post(self, post):
+        # Mailgun sends the whole message as form fields. We keep all of them
+        # so we can reprocess an email later if the parsing logic changes.
+        payload = post.dict()
+        return self.get_queryset().create(
+            recipient=payload.get("recipient", "").lower(),
+            message_id=payload.get("Message-Id", "")[:255],
+            payload=payload,
+        )
+
+    def get_stuck(self):
+        """
+        Emails no worker is going to finish: never picked up, or claimed by
+        a worker that died before finishing.
+        """
+        cutoff = timezone.now() - InboundEmail.PROCESSING_TIMEOUT
+        return self.get_queryset().filter(
+            Q(state=InboundEmail.STATE_RECEIVED)
+            | Q(state=InboundEmail.STATE_PROCESSING),
+            updated__lt=cutoff,
+        )
+
+    def prune(self):
+        # Mail to unknown recipients (mostly spam) is kept for a short while
+        # so it can be looked into, everything else we've finished with for
+        # long enough to reprocess it if the parsing logic changes.
+        now = timezone.now()
+        return (
+            self.get_queryset()
+            .filter(
+                Q(
+                    state=InboundEmail.STATE_IGNORED,
+                    created__lt=now - InboundEmail.IGNORED_RETENTION,
+                )
+                | Q(
+                    state__in=(InboundEmail.STATE_PROCESSED, InboundEmail.STATE_FAILED),
+                    created__lt=now - InboundEmail.RETENTION,
+                )
+            )
+            .delete()
+        )
+
+
+class InboundEmail(models.Model):
+    """
+    A raw email posted to us by Mailgun's 'Routes' feature.
+
+    The webhook only validates the signature and saves one of these so it can
+    ack Mailgun immediately. The parsing, AppUser resolution and Feedback
+    creation happen in `integrations.tasks.process_inbound_email`.
+    """
+
+    STATE_RECEIVED = "RECEIVED"
+    STATE_PROCESSING = "PROCESSING"
+    STATE_PROCESSED = "PROCESSED"
+    STATE_IGNORED = "IGNORED"
+    STATE_FAILED = "FAILED"
+
+    STATE_CHOICES = (
+        (STATE_RECEIVED, "Received"),
+        (STATE_PROCESSING, "Processing"),
+        (STATE_PROCESSED, "Processed"),
+        (STATE_IGNORED, "Ignored"),
+        (STATE_FAILED, "Failed"),
+    )
+
+    # A worker that has had an email this long without finishing it has
+    # died, the email can be claimed again.
+    PROCESSING_TIMEOUT = timedelta(minutes=15)
+    RETENTION = timedelta(days=30)
+    IGNORED_RETENTION = timedelta(days=7)
+
+    recipient = models.CharField(max_length=255)
+    message_id = models.CharField(max_length=255, blank=True)
+    payload = JSONField(default=dict)
+    state = models.CharField(
+        choices=STATE_CHOICES, default=STATE_RECEIVED, max_length=30
+    )
+    error = models.TextField(blank=True)
+    feedback = models.ForeignKey(
+        Feedback, null=True, blank=True, on_delete=models.SET_NULL
+    )
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    created = models.DateTimeField(auto_now_add=True, editable=False)
+    updated = models.DateTimeField(auto_now=True, editable=False)
+
+    objects = InboundEmailManager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["recipient", "message_id"], name="inboundemail_message_id"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.recipient} ({self.state})"
+
+    def claim(self):
+        """
+        Atomically moves this email from RECEIVED (or FAILED) to PROCESSING.
+        An email stuck in PROCESSING for longer than PROCESSING_TIMEOUT can
+        be claimed again. Returns False if another worker has it (e.g. a
+        retried task).
+        """
+        claimable_states = (InboundEmail.STATE_RECEIVED, InboundEmail.STATE_FAILED)
+        stale = timezone.now() - InboundEmail.PROCESSING_TIMEOUT
+        claimed = (
+            InboundEmail.objects.filter(pk=self.pk)
+            .filter(
+                Q(state__in=claimable_states)
+                | Q(state=InboundEmail.STATE_PROCESSING, updated__lt=stale)
+            )
+            .update(state=InboundEmail.STATE_PROCESSING, updated=timezone.now())
+        )
+        return claimed == 1
+
+    def is_duplicate(self):
+        # Mailgun retries deliveries it thinks failed so we can see the same
+        # message more than once.
+        if not self.message_id:
+            return False
+        return (
+            InboundEmail.objects.filter(
+                recipient=self.recipient,
+                message_id=self.message_id,
+                state=InboundEmail.STATE_PROCESSED,
+            )
+            .exclude(pk=self.pk)
+            .exists()
+        )
+
+    def process(self):
+        if not self.claim():
+            return
+
+        try:
+            if self.is_duplicate():
+                self.finish(InboundEmail.STATE_IGNORED, error="Duplicate message")
+                return
+
+            try:
+                user = User.objects.get_by_create_feedback_email(self.recipient)
+            except User.DoesNotExist:
+                self.finish(InboundEmail.STATE_IGNORED, error="Unknown recipient")
+                return
+
+            subject = self.payload.get("subject", "")
+            body = self.payload.get("body-plain", "")
+            source_appuser = get_feedback_submitter_from_body(body, user)
+            feedback, created = Feedback.objects.get_or_create_by_problem(
+                customer=user.customer,
+                created_by=user,
+                problem=f"{subject}\n\n{body}",
+                defaults={"user": source_appuser,},
+            )
+            self.feedback = feedback
+            self.finish(InboundEmail.STATE_PROCESSED)
+        except Exception as e:
+            self.finish(InboundEmail.STATE_FAILED, error=repr(e))
+            raise
+
+    def finish(self, state, error=""):
+        self.state = state
+        self.error = error
+        self.processed_at = timezone.now()
+        self.save()
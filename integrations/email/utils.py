@@ -0,0 +1,84 @@
+import re
+
+from django.db import IntegrityError
+from django.db.models.functions import Lower
+
+from appaccounts.models import AppUser
+
+# Long threaded emails can quote dozens of addresses in their headers and
+# signatures. The submitter is almost always near the top so there is no
+# point resolving every address we find.
+MAX_CANDIDATE_EMAILS = 50
+
+# There are a lot of email regexs you could dream up but
+# we just want something simple that won't inadvertanly
+# include stuff like '<' or spaces.
+# E.g. given '> From: Abbey Weber <abbey.weber@housecallpro.com>\r'
+# it will return just abbey.weber@housecallpro.com.
+EMAIL_REGEX = re.compile(r"[^\s<>:]+@[^\s<>:]+\.[^\s<>:]+")
+
+
+def get_feedback_submitter_from_body(body, user):
+    """
+    Gets our best guess of who the AppUser is that submitted this
+    feedback.
+
+    We've got a hint a couple of hints:
+    1. It's probably not the direct sender.
+    2. It's probably not an email from the same domain as the sender.
+
+    We assume the first email from a domain different than the User
+    that has an existing AppUser is the 'real' submitter. If none of them
+    have an AppUser we create one for the first candidate.
+
+    All of the candidates are looked up in a single query.
+    """
+    users_domain = user.email.split("@")[1].lower()
+    candidate_emails = [
+        email
+        for email in get_email_addresses(body)
+        if email.split("@")[1] != users_domain
+    ][:MAX_CANDIDATE_EMAILS]
+    if not candidate_emails:
+        return None
+
+    existing = {
+        appuser.email_lower: appuser
+        for appuser in AppUser.objects.annotate(email_lower=Lower("email")).filter(
+            customer=user.customer, email_lower__in=candidate_emails
+        )
+    }
+    for email in candidate_emails:
+        if email in existing:
+            return existing[email]
+
+    try:
+        appuser = AppUser.objects.create(
+            customer=user.customer, email=candidate_emails[0]
+        )
+    except IntegrityError:
+        # Someone else made it between our lookup and the create.
+        appuser = AppUser.objects.get(
+            customer=user.customer, email__iexact=candidate_emails[0]
+        )
+    return appuser
+
+
+def get_email_addresses(text):
+    """
+    Returns a list of the unique, lowercased email addresses found in 'text'
+    in the order they first appear.
+
+    There are a lot of differnet ways we might try and do this.
+    We could probably use a library like:
+    https://github.com/zapier/email-reply-parser
+    https://github.com/mailgun/talon/tree/master/talon/signature
+    """
+    emails = []
+    seen = set()
+    for match in EMAIL_REGEX.finditer(text):
+        email = match.group(0).lower()
+        if email not in seen:
+            seen.add(email)
+            emails.append(email)
+    return emails
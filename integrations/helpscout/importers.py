@@ -103,13 +103,12 @@ class HelpScoutFeedbackImporter(BaseImporter):
                 'source_url': source_url,
                 'source_username': 'Savio Help Scout Bot',
             }
-            feedback, created = Feedback.objects.get_or_create(customer=self.customer, problem=message, defaults=defaults)
+            feedback, created = Feedback.objects.get_or_create_by_problem(customer=self.customer, problem=message, defaults=defaults)
             if created:
                 # We don't know who tagged the thread so...
                 self.create_ack_note(json['id'], feedback, None, status)
-                OnboardingTask.objects.filter(
-                    customer=self.customer,
-                    task_type=OnboardingTask.TASK_SUBMIT_FEEDBACK_VIA_HELP_DESK).update(completed=True, updated=datetime.now(timezone.utc))
+                OnboardingTask.objects.complete_task(
+                    self.customer.id, OnboardingTask.TASK_SUBMIT_FEEDBACK_VIA_HELP_DESK)
 
         return created
 
@@ -143,12 +142,11 @@ class HelpScoutFeedbackImporter(BaseImporter):
                 'source_url': source_url,
                 'source_username': 'Savio Help Scout Bot',
             }
-            feedback, created = Feedback.objects.get_or_create(customer=self.customer, problem=note_text, defaults=defaults)
+            feedback, created = Feedback.objects.get_or_create_by_problem(customer=self.customer, problem=note_text, defaults=defaults)
             if created:
                 self.create_ack_note(json['id'], feedback, remote_id, status)
-                OnboardingTask.objects.filter(
-                    customer=self.customer,
-                    task_type=OnboardingTask.TASK_SUBMIT_FEEDBACK_VIA_HELP_DESK).update(completed=True, updated=datetime.now(timezone.utc))
+                OnboardingTask.objects.complete_task(
+                    self.customer.id, OnboardingTask.TASK_SUBMIT_FEEDBACK_VIA_HELP_DESK)
 
         return created
 
@@ -14,7 +14,6 @@ from django.contrib.messages.views import SuccessMessageMixin
 from django.http import Http404, HttpResponse, HttpResponseServerError
 from django.shortcuts import redirect, render
 from django.urls import reverse_lazy
-from django.utils import timezone
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import UpdateView
@@ -48,10 +47,9 @@ def oauth_callback(request):
         cfis.account_id = response.json()["companyId"]
         cfis.save()
 
-        OnboardingTask.objects.filter(
-            customer=request.user.customer,
-            task_type=OnboardingTask.TASK_CONNECT_HELP_DESK,
-        ).update(completed=True, updated=timezone.now())
+        OnboardingTask.objects.complete_task(
+            request.user.customer_id, OnboardingTask.TASK_CONNECT_HELP_DESK
+        )
 
         webhook_url_base = reverse_lazy(
             "integrations-helpscout-receive-webhook", args=[cfis.webhook_secret]
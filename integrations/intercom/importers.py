@@ -390,15 +390,14 @@ class IntercomFeedbackImporter(BaseImporter):
             "source_url": source_url,
             "source_username": "Savio Intercom Bot",
         }
-        feedback, created = Feedback.objects.get_or_create(
+        feedback, created = Feedback.objects.get_or_create_by_problem(
             customer=self.customer, problem=message, defaults=defaults
         )
         if created:
             self.create_ack_note(conversation_id, feedback, admin_id)
-            OnboardingTask.objects.filter(
-                customer=self.customer,
-                task_type=OnboardingTask.TASK_SUBMIT_FEEDBACK_VIA_HELP_DESK,
-            ).update(completed=True, updated=datetime.now(timezone.utc))
+            OnboardingTask.objects.complete_task(
+                self.customer.id, OnboardingTask.TASK_SUBMIT_FEEDBACK_VIA_HELP_DESK
+            )
 
     def create_ack_note(self, conversation_id, feedback, admin_id):
         summary = feedback.get_problem_snippet(snippet_length=30, join_char=" ")
@@ -601,13 +600,15 @@ class IntercomFeedbackImporter(BaseImporter):
                                 "source_username": "Savio Intercom Import",
                                 "feature_request": fr,
                                 "state": state,
-                                "import_token": import_token,
                             }
 
-                            obj, created = Feedback.objects.update_or_create(
+                            obj, created = Feedback.objects.update_or_create_by_problem(
                                 customer=self.customer,
                                 problem=self.get_full_message(real_convo),
                                 defaults=defaults,
+                                # Undoing this import shouldn't delete
+                                # feedback that was already here.
+                                create_defaults={"import_token": import_token},
                             )
                             self.logger.info(
                                 f"Finished processiong feedback. Created? {created}"
@@ -12,7 +12,6 @@ from django.contrib.messages.views import SuccessMessageMixin
 from django.http import Http404, HttpResponse, HttpResponseServerError
 from django.shortcuts import redirect, render
 from django.urls import reverse_lazy
-from django.utils import timezone
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import UpdateView
@@ -52,10 +51,9 @@ def intercom_oauth_callback(request):
         )
         customer_importer_settings.save()
         import_feedback.delay(customer_importer_settings.pk, request.user.pk)
-        OnboardingTask.objects.filter(
-            customer=request.user.customer,
-            task_type=OnboardingTask.TASK_CONNECT_HELP_DESK,
-        ).update(completed=True, updated=timezone.now())
+        OnboardingTask.objects.complete_task(
+            request.user.customer_id, OnboardingTask.TASK_CONNECT_HELP_DESK
+        )
 
     if request.GET.get("state") == "onboarding":
         return_url = reverse_lazy("accounts-onboarding-customer-data")
@@ -0,0 +1,35 @@
+# Generated by Django 2.1.3 on 2026-10-19 13:17
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback', '0035_auto_20200210_1919'),
+        ('integrations', '0002_auto_20190416_1843'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InboundEmail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipient', models.CharField(max_length=255)),
+                ('message_id', models.CharField(blank=True, max_length=255)),
+                ('payload', django.contrib.postgres.fields.jsonb.JSONField(default=dict)),
+                ('state', models.CharField(choices=[('RECEIVED', 'Received'), ('PROCESSING', 'Processing'), ('PROCESSED', 'Processed'), ('IGNORED', 'Ignored'), ('FAILED', 'Failed')], default='RECEIVED', max_length=30)),
+                ('error', models.TextField(blank=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('feedback', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='feedback.Feedback')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='inboundemail',
+            index=models.Index(fields=['recipient', 'message_id'], name='inboundemail_message_id'),
+        ),
+    ]
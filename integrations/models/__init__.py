@@ -1 +1,2 @@
 from integrations.slack.models import *
+from integrations.email.models import *
@@ -9,7 +9,7 @@ from django.db.models import Q
 from sentry_sdk import capture_exception, capture_message, configure_scope
 
 from appaccounts.models import AppUser
-from feedback.models import FeedbackTemplate
+from feedback.models import FeedbackIngestRules
 
 from .models import SlackSettings
 
@@ -71,7 +71,8 @@ def get_dialog_json(trigger_id, callback_id, message_ts, message, customer):
             # Then we set the item to the right of the colon as the problem.
             problem = items[1].strip()
 
-    try:
+    template = FeedbackIngestRules.for_customer(customer.id).template
+    if template is not None:
         # If the user has setup a Feedback Template plug the problem into it.
         # We assume the template is something like:
         # Step1:
@@ -83,12 +84,9 @@ def get_dialog_json(trigger_id, callback_id, message_ts, message, customer):
         # This may turn to be a bad assumption but it's annoying
         # to have to take the text we are passing in from the Slack
         # messasge and be forced to move it around right off the hop.
-        feedback_template = FeedbackTemplate.objects.get(customer=customer)
-        template_parts = feedback_template.template.split("\n")
+        template_parts = template.split("\n")
         template_parts.insert(1, problem)
         problem = "\n".join(template_parts)
-    except FeedbackTemplate.DoesNotExist:
-        pass
 
     json = {
         "trigger_id": trigger_id,
@@ -12,7 +12,6 @@ from django.http import HttpResponse, JsonResponse
 from django.shortcuts import redirect, render
 from django.template.defaultfilters import truncatechars
 from django.urls import reverse, reverse_lazy
-from django.utils import timezone
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import DeleteView
@@ -156,10 +155,9 @@ def slack_oauth_callback(request):
                     request.user, tracking.EVENT_SOURCE_SLACK
                 )
 
-            OnboardingTask.objects.filter(
-                customer=request.user.customer,
-                task_type=OnboardingTask.TASK_CONNECT_HELP_DESK,
-            ).update(completed=True, updated=timezone.now())
+            OnboardingTask.objects.complete_task(
+                request.user.customer_id, OnboardingTask.TASK_CONNECT_HELP_DESK
+            )
 
             return redirect("integrations-slack-choose-channel")
         else:
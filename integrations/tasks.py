@@ -0,0 +1,29 @@
+from celery import shared_task
+
+from .models import InboundEmail
+
+
+# acks_late so an email whose worker dies mid way is delivered again. The
+# redelivery usually gets there before the claim times out so
+# clean_up_inbound_emails picks up the ones that stay stuck.
+@shared_task(acks_late=True)
+def process_inbound_email(inbound_email_id):
+    try:
+        InboundEmail.objects.get(pk=inbound_email_id).process()
+    except InboundEmail.DoesNotExist:
+        print(
+            f"Didn't process inbound email #{inbound_email_id} because it doesn't exist"
+        )
+
+
+@shared_task
+def clean_up_inbound_emails():
+    """
+    Requeues emails that got stuck (see InboundEmailManager.get_stuck) and
+    deletes the ones past their retention.
+    """
+    for inbound_email_id in InboundEmail.objects.get_stuck().values_list(
+        "id", flat=True
+    ):
+        process_inbound_email.delay(inbound_email_id)
+    InboundEmail.objects.prune()
@@ -1,3 +1,206 @@
-from django.test import TestCase
+import datetime
+import hmac
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import Customer, User
+from appaccounts.models import AppUser
+from feedback.models import Feedback
+
+from .email.utils import get_feedback_submitter_from_body
+from .models import InboundEmail
+from .tasks import clean_up_inbound_emails, process_inbound_email
+
+
+class InboundEmailTestMixin(object):
+    def setUp(self):
+        super().setUp()
+        self.customer = Customer.objects.create(name="Acme")
+        self.user = User.objects.create_user(
+            "owner@acme.example.com",
+            "password",
+            customer=self.customer,
+            role=User.ROLE_OWNER,
+        )
+
+    def get_payload(self, **kwargs):
+        payload = {
+            "recipient": self.user.create_feedback_email,
+            "Message-Id": "<1@mail.example.com>",
+            "subject": "Fwd: Exports",
+            "body-plain": "From: Jane <jane@customer.example.com>\nI need exports",
+        }
+        payload.update(kwargs)
+        return payload
+
+    def create_inbound_email(self, **kwargs):
+        return InboundEmail.objects.create(
+            recipient=kwargs.get("recipient", self.user.create_feedback_email),
+            message_id=kwargs.get("Message-Id", "<1@mail.example.com>"),
+            payload=self.get_payload(**kwargs),
+        )
+
+    def set_updated(self, inbound_email, age):
+        InboundEmail.objects.filter(pk=inbound_email.pk).update(
+            updated=timezone.now() - age, created=timezone.now() - age
+        )
+
+
+@override_settings(MAILGUN_API_KEY="key")
+class ReceiveEmailWebhookTestCase(InboundEmailTestMixin, TestCase):
+    def post(self, key="key", **kwargs):
+        signature = hmac.new(key.encode(), b"1token", "sha256")
+        data = self.get_payload(timestamp="1", token="token", **kwargs)
+        data["signature"] = signature.hexdigest()
+        with mock.patch.object(process_inbound_email, "delay") as delay:
+            response = self.client.post(reverse("receive-email-webhook"), data)
+        return response, delay
+
+    def test_signed_email_is_stored_and_queued(self):
+        response, delay = self.post()
+
+        self.assertEqual(response.status_code, 200)
+        inbound_email = InboundEmail.objects.get()
+        self.assertEqual(inbound_email.state, InboundEmail.STATE_RECEIVED)
+        self.assertEqual(inbound_email.payload["subject"], "Fwd: Exports")
+        delay.assert_called_once_with(inbound_email.pk)
+
+    def test_bad_signature_is_rejected(self):
+        response, delay = self.post(key="wrong")
+
+        self.assertEqual(response.status_code, 406)
+        self.assertFalse(InboundEmail.objects.exists())
+        delay.assert_not_called()
+
+
+class InboundEmailProcessTestCase(InboundEmailTestMixin, TestCase):
+    def test_processed(self):
+        inbound_email = self.create_inbound_email()
+
+        inbound_email.process()
+
+        self.assertEqual(inbound_email.state, InboundEmail.STATE_PROCESSED)
+        feedback = Feedback.objects.get()
+        self.assertEqual(inbound_email.feedback, feedback)
+        self.assertEqual(feedback.created_by, self.user)
+        self.assertEqual(feedback.user.email, "jane@customer.example.com")
+        self.assertTrue(feedback.problem.startswith("Fwd: Exports\n\n"))
+
+    def test_duplicate_message_id_is_ignored(self):
+        self.create_inbound_email().process()
+        # Mailgun retrying the same delivery.
+        inbound_email = self.create_inbound_email()
+
+        inbound_email.process()
+
+        self.assertEqual(inbound_email.state, InboundEmail.STATE_IGNORED)
+        self.assertEqual(inbound_email.error, "Duplicate message")
+        self.assertEqual(Feedback.objects.count(), 1)
+
+    def test_unknown_recipient_is_ignored(self):
+        inbound_email = self.create_inbound_email(recipient="nobody@example.com")
+
+        inbound_email.process()
+
+        self.assertEqual(inbound_email.state, InboundEmail.STATE_IGNORED)
+        self.assertEqual(inbound_email.error, "Unknown recipient")
+        self.assertFalse(Feedback.objects.exists())
+
+    def test_failure_is_recorded_and_can_be_retried(self):
+        inbound_email = self.create_inbound_email()
+
+        with mock.patch.object(
+            Feedback.objects, "get_or_create_by_problem", side_effect=ValueError("x")
+        ):
+            with self.assertRaises(ValueError):
+                inbound_email.process()
+        self.assertEqual(inbound_email.state, InboundEmail.STATE_FAILED)
+        self.assertIn("ValueError", inbound_email.error)
+
+        inbound_email.process()
+        self.assertEqual(inbound_email.state, InboundEmail.STATE_PROCESSED)
+
+    def test_claim(self):
+        inbound_email = self.create_inbound_email()
+        self.assertTrue(inbound_email.claim())
+        # Another worker has it.
+        self.assertFalse(inbound_email.claim())
+
+        # Until it has had it for too long.
+        self.set_updated(inbound_email, InboundEmail.PROCESSING_TIMEOUT * 2)
+        self.assertTrue(inbound_email.claim())
+
+
+class CleanUpInboundEmailsTestCase(InboundEmailTestMixin, TestCase):
+    def test_stuck_emails_are_requeued(self):
+        stuck = self.create_inbound_email()
+        stuck.claim()
+        self.set_updated(stuck, InboundEmail.PROCESSING_TIMEOUT * 2)
+        lost = self.create_inbound_email(**{"Message-Id": "<2@mail.example.com>"})
+        self.set_updated(lost, InboundEmail.PROCESSING_TIMEOUT * 2)
+        in_progress = self.create_inbound_email(
+            **{"Message-Id": "<3@mail.example.com>"}
+        )
+        in_progress.claim()
+
+        with mock.patch.object(process_inbound_email, "delay") as delay:
+            clean_up_inbound_emails()
+
+        self.assertCountEqual(
+            [call[0][0] for call in delay.call_args_list], [stuck.pk, lost.pk]
+        )
+
+    def test_old_emails_are_pruned(self):
+        def create(state, age, message_id):
+            inbound_email = self.create_inbound_email(**{"Message-Id": message_id})
+            InboundEmail.objects.filter(pk=inbound_email.pk).update(state=state)
+            self.set_updated(inbound_email, datetime.timedelta(days=age))
+            return inbound_email
+
+        kept = [
+            create(InboundEmail.STATE_IGNORED, 1, "<1@x>"),
+            create(InboundEmail.STATE_PROCESSED, 8, "<2@x>"),
+            create(InboundEmail.STATE_FAILED, 8, "<3@x>"),
+        ]
+        create(InboundEmail.STATE_IGNORED, 8, "<4@x>")
+        create(InboundEmail.STATE_PROCESSED, 31, "<5@x>")
+        create(InboundEmail.STATE_FAILED, 31, "<6@x>")
+
+        with mock.patch.object(process_inbound_email, "delay"):
+            clean_up_inbound_emails()
+
+        self.assertCountEqual(
+            InboundEmail.objects.values_list("pk", flat=True),
+            [inbound_email.pk for inbound_email in kept],
+        )
+
+
+class GetFeedbackSubmitterFromBodyTestCase(InboundEmailTestMixin, TestCase):
+    def test_no_candidates(self):
+        body = "From: Teammate <teammate@acme.example.com>\nNo one else here"
+        self.assertIsNone(get_feedback_submitter_from_body(body, self.user))
+        self.assertFalse(AppUser.objects.exists())
+
+    def test_first_existing_app_user_wins(self):
+        bob = AppUser.objects.create(
+            customer=self.customer, name="Bob", email="Bob@Other.example.com"
+        )
+        body = (
+            "From: Teammate <teammate@ACME.example.com>\n"
+            "From: Jane <jane@customer.example.com>\n"
+            "Cc: bob@other.example.com\n"
+        )
+
+        self.assertEqual(get_feedback_submitter_from_body(body, self.user), bob)
+        self.assertEqual(AppUser.objects.count(), 1)
+
+    def test_creates_the_first_candidate(self):
+        body = "From: Jane <Jane@Customer.example.com>\n" "Cc: bob@other.example.com\n"
+
+        app_user = get_feedback_submitter_from_body(body, self.user)
+
+        self.assertEqual(app_user.email, "jane@customer.example.com")
+        self.assertEqual(app_user.customer, self.customer)
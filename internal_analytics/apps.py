@@ -9,6 +9,7 @@ class InternalAnalyticsConfig(AppConfig):
     name = 'internal_analytics'
 
     def ready(self):
+        import internal_analytics.signals  # noqa: F401
         segment.write_key = settings.SEGMENT_WRITE_KEY
         segment.debug = settings.DEBUG
         segment.send = settings.PRODUCTION
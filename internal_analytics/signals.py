@@ -0,0 +1,9 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from accounts.models import Customer
+from .tracking import forget_customer_name
+
+
+@receiver(post_save, sender=Customer)
+def forget_renamed_customer_name(sender, instance, **kwargs):
+    forget_customer_name(instance.id)
@@ -1,3 +1,146 @@
-from django.test import TestCase
+import os
+import queue
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase
+
+from accounts.models import Customer
+
+from .tracker import Event, LocalSink, Tracker
+from .tracking import get_customer_name
+
+
+class BatchRecordingSink(LocalSink):
+    def __init__(self, delay=0):
+        super().__init__()
+        self.delay = delay
+        self.batch_sizes = []
+
+    def send(self, events):
+        time.sleep(self.delay)
+        self.batch_sizes.append(len(events))
+        super().send(events)
+
+
+class FailingSink(object):
+    def send(self, events):
+        raise Exception("Segment is down")
+
+
+class ManualTracker(Tracker):
+    """
+    A Tracker without the background thread so tests decide when events are
+    sent, by calling flush().
+    """
+
+    BATCH_SIZE = 3
+    MAX_QUEUE_SIZE = 10
+    SAMPLE_QUEUE_DEPTH = 2
+
+    def start(self):
+        if self.queue is None:
+            self.queue = queue.Queue(maxsize=self.MAX_QUEUE_SIZE)
+            self.pid = os.getpid()
+
+
+class TrackerTestCase(SimpleTestCase):
+    def setUp(self):
+        self.sink = BatchRecordingSink()
+        self.tracker = ManualTracker(self.sink)
+
+    def track(self, count, **kwargs):
+        return [
+            self.tracker.track(1, f"Event {i}", {"i": i}, **kwargs)
+            for i in range(count)
+        ]
+
+    def test_flush_sends_everything_in_batches(self):
+        self.track(7)
+        self.assertEqual(self.sink.events, [])
+        self.assertEqual(self.tracker.get_metrics()["queue_depth"], 7)
+
+        self.tracker.flush()
+
+        self.assertEqual(self.sink.batch_sizes, [3, 3, 1])
+        self.assertEqual(
+            self.sink.events, [Event(1, f"Event {i}", {"i": i}) for i in range(7)]
+        )
+        metrics = self.tracker.get_metrics()
+        self.assertEqual(metrics["enqueued"], 7)
+        self.assertEqual(metrics["sent"], 7)
+        self.assertEqual(metrics["queue_depth"], 0)
+
+    def test_high_frequency_events_are_sampled_once_the_queue_backs_up(self):
+        # Under SAMPLE_QUEUE_DEPTH everything is kept whatever the dice say.
+        with mock.patch("internal_analytics.tracker.random.random", return_value=0.5):
+            self.assertEqual(
+                self.track(4, high_frequency=True), [True, True, False, False]
+            )
+        with mock.patch("internal_analytics.tracker.random.random", return_value=0.05):
+            self.assertEqual(self.track(1, high_frequency=True), [True])
+        with mock.patch("internal_analytics.tracker.random.random", return_value=0.5):
+            # Other events are never sampled.
+            self.assertEqual(self.track(1), [True])
+
+        metrics = self.tracker.get_metrics()
+        self.assertEqual(metrics["enqueued"], 4)
+        self.assertEqual(metrics["dropped"], 2)
+        self.assertEqual(metrics["queue_depth"], 4)
+
+    def test_events_are_dropped_when_the_queue_is_full(self):
+        self.assertEqual(self.track(12).count(False), 2)
+
+        metrics = self.tracker.get_metrics()
+        self.assertEqual(metrics["enqueued"], 10)
+        self.assertEqual(metrics["dropped"], 2)
+        self.assertEqual(metrics["queue_depth"], 10)
+
+    def test_flush_latency_metrics(self):
+        self.tracker.sink = BatchRecordingSink(delay=0.01)
+        self.track(4)
+
+        self.tracker.flush()
+
+        metrics = self.tracker.get_metrics()
+        self.assertGreaterEqual(metrics["last_flush_seconds"], 0.01)
+        self.assertGreaterEqual(
+            metrics["max_flush_seconds"], metrics["last_flush_seconds"]
+        )
+
+    def test_failed_sends_are_counted(self):
+        self.tracker.sink = FailingSink()
+        self.track(4)
+
+        self.tracker.flush()
+
+        metrics = self.tracker.get_metrics()
+        self.assertEqual(metrics["sent"], 0)
+        self.assertEqual(metrics["failed"], 4)
+        self.assertEqual(metrics["queue_depth"], 0)
+
+    def test_background_thread_sends_events(self):
+        sink = LocalSink()
+        tracker = Tracker(sink)
+        tracker.FLUSH_INTERVAL = 0.01
+
+        tracker.track(1, "Viewed Page", {})
+
+        deadline = time.monotonic() + 5
+        while not tracker.get_metrics()["sent"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(sink.events, [Event(1, "Viewed Page", {})])
+
+
+class GetCustomerNameTestCase(TestCase):
+    def test_rename_is_picked_up(self):
+        customer = Customer.objects.create(name="Acme")
+        self.assertEqual(get_customer_name(customer.id), "Acme")
+
+        customer.name = "Acme Inc"
+        customer.save()
+
+        self.assertEqual(get_customer_name(customer.id), "Acme Inc")
+
+    def test_unknown_customer(self):
+        self.assertEqual(get_customer_name(0), "")
@@ -0,0 +1,177 @@
+import atexit
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import namedtuple
+
+import analytics as segment
+from django.conf import settings
+from sentry_sdk import capture_exception
+
+from common.utils import get_class
+
+Event = namedtuple("Event", ["user_id", "name", "properties"])
+
+
+class SegmentSink(object):
+    def send(self, events):
+        # The Segment client batches the HTTP requests itself. What we save
+        # by doing this from the tracker's thread is the request thread's
+        # time.
+        for event in events:
+            segment.track(event.user_id, event.name, event.properties)
+
+
+class LocalSink(object):
+    """
+    Keeps events in memory instead of sending them anywhere. Handy for tests
+    and local development, set TRACKING_SINK to use it.
+    """
+
+    def __init__(self):
+        self.events = []
+
+    def send(self, events):
+        self.events.extend(events)
+
+
+class Tracker(object):
+    """
+    Queues analytics events in memory and sends them to the sink in batches
+    from a background thread so views don't wait on them.
+
+    Events should be fully built when they are queued; the background thread
+    doesn't touch the DB.
+
+    High frequency events (list/page views) are sampled once the queue backs
+    up and anything that doesn't fit in the queue is dropped. We'd rather
+    lose some analytics than memory or request time.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    BATCH_SIZE = 100
+    FLUSH_INTERVAL = 1.0
+    MAX_QUEUE_SIZE = 10000
+    # Once the queue is this deep only SAMPLE_RATE of high frequency events
+    # are kept.
+    SAMPLE_QUEUE_DEPTH = 1000
+    SAMPLE_RATE = 0.1
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.lock = threading.Lock()
+        self.pid = None
+        self.thread = None
+        self.queue = None
+        self.metrics = {
+            "enqueued": 0,
+            "dropped": 0,
+            "sent": 0,
+            "failed": 0,
+            "last_flush_seconds": 0.0,
+            "max_flush_seconds": 0.0,
+        }
+
+    def track(self, user_id, name, properties, high_frequency=False):
+        self.start()
+        depth = self.queue.qsize()
+        if (
+            high_frequency
+            and depth >= self.SAMPLE_QUEUE_DEPTH
+            and random.random() >= self.SAMPLE_RATE
+        ):
+            self.count("dropped")
+            return False
+        try:
+            self.queue.put_nowait(Event(user_id, name, properties))
+        except queue.Full:
+            self.count("dropped")
+            return False
+        self.count("enqueued")
+        return True
+
+    def start(self):
+        # Started lazily so each process (e.g. after gunicorn or celery fork)
+        # gets its own queue and thread.
+        if self.pid == os.getpid() and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.pid != os.getpid():
+                self.queue = queue.Queue(maxsize=self.MAX_QUEUE_SIZE)
+                self.pid = os.getpid()
+                self.thread = None
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name="tracker", daemon=True
+                )
+                self.thread.start()
+
+    def run(self):
+        while True:
+            batch = self.get_batch(timeout=self.FLUSH_INTERVAL)
+            if batch:
+                self.send(batch)
+
+    def get_batch(self, timeout=None):
+        # Without a timeout this doesn't wait at all.
+        batch = []
+        try:
+            batch.append(self.queue.get(block=timeout is not None, timeout=timeout))
+        except queue.Empty:
+            return batch
+        while len(batch) < self.BATCH_SIZE:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def send(self, batch):
+        start = time.monotonic()
+        try:
+            self.sink.send(batch)
+            self.count("sent", len(batch))
+        except Exception as e:
+            self.count("failed", len(batch))
+            capture_exception(e)
+        elapsed = time.monotonic() - start
+        with self.lock:
+            self.metrics["last_flush_seconds"] = elapsed
+            self.metrics["max_flush_seconds"] = max(
+                self.metrics["max_flush_seconds"], elapsed
+            )
+        self.logger.debug(
+            f"Sent {len(batch)} events in {elapsed:.3f}s, {self.queue.qsize()} queued"
+        )
+
+    def flush(self):
+        """Sends everything that's queued right now from the calling thread."""
+        if self.queue is None or self.pid != os.getpid():
+            return
+        while True:
+            batch = self.get_batch()
+            if not batch:
+                break
+            self.send(batch)
+
+    def count(self, metric, value=1):
+        with self.lock:
+            self.metrics[metric] += value
+
+    def get_metrics(self):
+        with self.lock:
+            metrics = dict(self.metrics)
+        metrics["queue_depth"] = self.queue.qsize() if self.queue else 0
+        return metrics
+
+
+tracker = Tracker(
+    get_class(
+        getattr(settings, "TRACKING_SINK", "internal_analytics.tracker.SegmentSink")
+    )()
+)
+atexit.register(tracker.flush)
@@ -1,83 +1,100 @@
-import analytics as segment
+from django.core.cache import cache
+from accounts.models import Customer, User
+from common.cache import get_customer_cache_key
+from .tracker import tracker
 
 EVENT_SOURCE_CE = 'CHROME_EXTENSION'
 EVENT_SOURCE_WEB_APP = 'WEB_APP'
 EVENT_SOURCE_SLACK = 'SLACK'
 EVENT_SOURCE_API = 'API'
 
-def account_created(user):
-    segment.track(user.id, 'Account Created', {
-        'customer': user.customer.id,
-        'customer_name': user.customer.name,
+# Events are queued and sent in the background by the tracker. Everything in
+# the properties must be resolved here, the tracker doesn't touch the DB.
+
+def get_customer_name_cache_key(customer_id):
+    return get_customer_cache_key(customer_id, 'tracking_customer_name')
+
+def get_customer_name(customer_id):
+    cache_key = get_customer_name_cache_key(customer_id)
+    name = cache.get(cache_key)
+    if name is None:
+        name = Customer.objects.filter(pk=customer_id).values_list('name', flat=True).first() or ""
+        cache.set(cache_key, name, 24 * 60 * 60)
+    return name
+
+def forget_customer_name(customer_id):
+    # Called whenever a customer is saved so renames show up straight away.
+    cache.delete(get_customer_name_cache_key(customer_id))
+
+def get_customer_properties(user):
+    # Views have usually loaded the customer already. If not don't load the
+    # whole thing just for its name.
+    if User.customer.is_cached(user):
+        customer_name = user.customer.name
+    else:
+        customer_name = get_customer_name(user.customer_id)
+    return {
+        'customer': user.customer_id,
+        'customer_name': customer_name,
+    }
+
+def get_user_properties(user):
+    return {
+        'user_email': user.email,
+        'user_name': f"{user.first_name} {user.last_name}",
+        **get_customer_properties(user),
+    }
+
+def get_account_properties(user):
+    return {
+        **get_customer_properties(user),
         'email': user.email,
         'name': f"{user.first_name} {user.last_name}",
         'role': user.job,
-    })
+    }
+
+def account_created(user):
+    tracker.track(user.id, 'Account Created', get_account_properties(user))
 
 def user_created(user, event_source):
-    segment.track(user.id, 'User Created', {
-        'customer': user.customer.id,
-        'customer_name': user.customer.name,
+    tracker.track(user.id, 'User Created', {
+        **get_account_properties(user),
         'event_source': event_source,
-        'email': user.email,
-        'name': f"{user.first_name} {user.last_name}",
-        'role': user.job,
     })
 
 def feedback_created(user_id, customer, feedback, event_source):
-    segment.track(user_id, 'Feedback Created', {
+    tracker.track(user_id, 'Feedback Created', {
         'customer': customer.id,
         'customer_name': customer.name,
         'event_source': event_source,
-        'feature_attached': feedback.feature_request is not None,
+        'feature_attached': feedback.feature_request_id is not None,
         'feedback_type': feedback.feedback_type,
-        'user_attached': feedback.user is not None,
+        'user_attached': feedback.user_id is not None,
         'solution_provided': feedback.solution != "",
         'souce_username': feedback.source_username,
     })
-  
-
 
 def feedback_edited(user):
-    segment.track(user.id, 'Feedback Edited', {
-        'user_email': user.email,
-        'user_name': f"{user.first_name} {user.last_name}",
-        'customer': user.customer.id,
-        'customer_name': user.customer.name,
-    })
+    tracker.track(user.id, 'Feedback Edited', get_user_properties(user))
 
 def feedback_triaged(user, feedback, days):
     if days:
-        segment.track(user.id, 'Feedback Snoozed', {
-            'user_email': user.email,
-            'user_name': f"{user.first_name} {user.last_name}",
-            'customer': user.customer.id,
-            'customer_name': user.customer.name,
+        tracker.track(user.id, 'Feedback Snoozed', {
+            **get_user_properties(user),
             'days': days,
         })
     else:
-        segment.track(user.id, 'Feedback Triaged', {
-            'user_email': user.email,
-            'user_name': f"{user.first_name} {user.last_name}",
-            'customer': user.customer.id,
-            'customer_name': user.customer.name,
-        })
+        tracker.track(user.id, 'Feedback Triaged', get_user_properties(user))
 
 def feedback_list_viewed(user, list_filter):
-    segment.track(user.id, 'Feedback Viewed', {
-        'user_email': user.email,
-        'user_name': f"{user.first_name} {user.last_name}",
-        'customer': user.customer.id,
-        'customer_name': user.customer.name,
+    tracker.track(user.id, 'Feedback Viewed', {
+        **get_user_properties(user),
         'filter': list_filter,
-    })
+    }, high_frequency=True)
 
 def feature_request_created(user, event_source):
-    segment.track(user.id, 'Feature Request Created', {
-        'user_email': user.email,
-        'user_name': f"{user.first_name} {user.last_name}",
-        'customer': user.customer.id,
-        'customer_name': user.customer.name,
+    tracker.track(user.id, 'Feature Request Created', {
+        **get_user_properties(user),
         'event_source': event_source,
     })
 
@@ -89,7 +106,7 @@ def customer_email_sent(sender, recipient, email_type):
         recipient_company_id = recipient.company.id
         recipient_company_name = recipient.company.name
 
-    segment.track(sender.id, 'Customer Email Sent', {
+    tracker.track(sender.id, 'Customer Email Sent', {
         'user_id': recipient.id,
         'user_email': recipient.email,
         'user_name': recipient.name,
@@ -99,56 +116,30 @@ def customer_email_sent(sender, recipient, email_type):
     })
 
 def feature_request_edited(user):
-    segment.track(user.id, 'Feature Request Edited', {
-        'user_email': user.email,
-        'user_name': f"{user.first_name} {user.last_name}",
-        'customer': user.customer.id,
-        'customer_name': user.customer.name,
-    })
+    tracker.track(user.id, 'Feature Request Edited', get_user_properties(user))
 
 def feature_request_list_viewed(user, list_filter):
-    segment.track(user.id, 'Feature Request Viewed', {
-        'user_email': user.email,
-        'user_name': f"{user.first_name} {user.last_name}",
-        'customer': user.customer.id,
-        'customer_name': user.customer.name,
+    tracker.track(user.id, 'Feature Request Viewed', {
+        **get_user_properties(user),
         'filter': list_filter,
-    })
+    }, high_frequency=True)
 
 def feature_request_feedback_details_viewed(user):
-    segment.track(user.id, 'Feature Request Feedback Details Viewed', {
-        'user_email': user.email,
-        'user_name': f"{user.first_name} {user.last_name}",
-        'customer': user.customer.id,
-        'customer_name': user.customer.name,
-    })
+    tracker.track(user.id, 'Feature Request Feedback Details Viewed', get_user_properties(user), high_frequency=True)
 
 def theme_created(user):
-    segment.track(user.id, 'Theme Created', {
-        'user_email': user.email,
-        'user_name': f"{user.first_name} {user.last_name}",
-        'customer': user.customer.id,
-        'customer_name': user.customer.name,
-    })
+    tracker.track(user.id, 'Theme Created', get_user_properties(user))
 
 
 def integration_connected(user, event_source):
-    segment.track(user.id, 'Integration Connected', {
-        'customer': user.customer.id,
-        'customer_name': user.customer.name,
+    tracker.track(user.id, 'Integration Connected', {
+        **get_account_properties(user),
         'event_source': event_source,
-        'email': user.email,
-        'name': f"{user.first_name} {user.last_name}",
-        'role': user.job,
     })
 
 
 def integration_disconnected(user, event_source):
-    segment.track(user.id, 'Integration Disconnected', {
-        'customer': user.customer.id,
-        'customer_name': user.customer.name,
+    tracker.track(user.id, 'Integration Disconnected', {
+        **get_account_properties(user),
         'event_source': event_source,
-        'email': user.email,
-        'name': f"{user.first_name} {user.last_name}",
-        'role': user.job,
     })
@@ -0,0 +1,95 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from common.utils import markdown_hash
+
+PAGE_CACHE_TIMEOUT = 60 * 60
+GENERATION_KEY = "marketing_page_generation"
+
+
+def get_page_cache_key(request):
+    # Pages render absolute URLs for og:url so the scheme and host are part
+    # of the key. The query string isn't: it's mostly utm params and would
+    # just fragment the cache.
+    generation = cache.get_or_set(GENERATION_KEY, 1, None)
+    url = f"{request.scheme}://{request.get_host()}{request.path}"
+    return "marketing_page_{}_{}_{}".format(
+        settings.MARKETING_CACHE_VERSION, generation, markdown_hash(url)
+    )
+
+
+def invalidate_marketing_pages():
+    """
+    Drops every cached marketing page by moving on to a new key generation.
+    The old entries just expire.
+    """
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
+
+
+def is_cacheable_request(request):
+    # Logged in users see their own details in the nav, tracking snippets
+    # and Intercom widget so only cookie-less visitors share a copy.
+    return (
+        request.method in ("GET", "HEAD")
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+    )
+
+
+def cache_marketing_page(view_func):
+    """
+    Caches a marketing view's rendered HTML for anonymous visitors and
+    answers conditional requests with a 304 using the cached ETag and
+    Last-Modified. Only 200s are cached so redirects and 404s always run the
+    view.
+
+    Keys include MARKETING_CACHE_VERSION, which should be bumped when a
+    deploy changes templates, and a generation that invalidate_marketing_pages
+    bumps when CMS content changes.
+    """
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not is_cacheable_request(request):
+            return view_func(request, *args, **kwargs)
+
+        cache_key = get_page_cache_key(request)
+        entry = cache.get(cache_key)
+        if entry is None:
+            response = view_func(request, *args, **kwargs)
+            if response.status_code != 200 or response.streaming:
+                return response
+            entry = {
+                "content": response.content,
+                "content_type": response["Content-Type"],
+                "etag": quote_etag(hashlib.md5(response.content).hexdigest()),
+                "last_modified": int(time.time()),
+            }
+            cache.set(cache_key, entry, PAGE_CACHE_TIMEOUT)
+        else:
+            response = HttpResponse(
+                entry["content"], content_type=entry["content_type"]
+            )
+
+        response["ETag"] = entry["etag"]
+        response["Last-Modified"] = http_date(entry["last_modified"])
+        # Let browsers keep a copy but check back so a deploy or a CMS
+        # publish shows up straight away. The check is usually a 304.
+        patch_cache_control(response, no_cache=True)
+        return get_conditional_response(
+            request,
+            etag=entry["etag"],
+            last_modified=entry["last_modified"],
+            response=response,
+        )
+
+    return wrapper
@@ -0,0 +1,42 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from marketing.sitemaps import StaticSitemap
+
+
+class Command(BaseCommand):
+    help = "Requests every page in the marketing sitemap so the page cache is warm"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--base-url",
+            dest="base_url",
+            default=settings.EMAIL_DOMAIN,
+            help="Site to crawl, defaults to EMAIL_DOMAIN",
+        )
+        parser.add_argument("--workers", dest="workers", type=int, default=4)
+
+    def handle(self, *args, **options):
+        # Crawl over HTTP rather than with the test client so the pages end
+        # up in the cache the web workers use.
+        sitemap = StaticSitemap()
+        base_url = options["base_url"].rstrip("/")
+        urls = [f"{base_url}{sitemap.location(item)}" for item in sitemap.items()]
+
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            results = list(executor.map(self.fetch, urls))
+
+        for url, status in results:
+            if status != 200:
+                print(f"{status} {url}")
+        warmed = len([status for url, status in results if status == 200])
+        print(f"Warmed {warmed} of {len(urls)} pages")
+
+    def fetch(self, url):
+        try:
+            return url, requests.get(url, timeout=30).status_code
+        except requests.RequestException as e:
+            return url, repr(e)
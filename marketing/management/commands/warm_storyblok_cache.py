@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from marketing.storyblok import storyblok
+
+
+class Command(BaseCommand):
+    help = "Fetches every published Storyblok story (and every request we've served) into the cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "slugs",
+            nargs="*",
+            type=str,
+            help="Only refresh these stories, e.g. integrations/trello",
+        )
+
+    def handle(self, *args, **options):
+        if options["slugs"]:
+            for slug in options["slugs"]:
+                storyblok.refresh(f"stories/{slug}", "published", {})
+            total = len(options["slugs"])
+        else:
+            total = storyblok.refresh_all()
+        print(f"Refreshed {total} Storyblok entries")
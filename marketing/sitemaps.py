@@ -1,12 +1,8 @@
-import datetime
-import json
-
-import requests
-from django.conf import settings
 from django.contrib.sitemaps import Sitemap
 from django.urls import reverse
 
 from marketing import urls
+from marketing.storyblok import storyblok
 
 
 class StaticSitemap(Sitemap):
@@ -22,16 +18,14 @@ class StaticSitemap(Sitemap):
             "marketing-intercom-test-data",
             "marketing-headless-cms-fallback",
             "marketing-appsumo",
+            "marketing-storyblok-webhook",
         ]
         for url in urls.urlpatterns:
             if url.name not in hide_from_sitemap:
                 mylist.append(url.name)
 
         # Build list from StoryBlok
-        url = f"https://api.storyblok.com/v1/cdn/links?cv={datetime.datetime.now().timestamp()}&token={settings.STORYBLOK_API_TOKEN}&version=published"
-        response = requests.request("GET", url)
-
-        for item in json.loads(response.text)["links"].items():
+        for item in storyblok.get_links()["links"].items():
             obj = item[1]
             if obj["published"] is True and obj["is_folder"] is False:
                 mylist.append(f'/{item[1]["slug"]}/')
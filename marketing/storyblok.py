@@ -0,0 +1,222 @@
+import glob
+import json
+import logging
+import os
+import time
+import uuid
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+from common.utils import get_class, markdown_hash
+
+from .cache import invalidate_marketing_pages
+
+logger = logging.getLogger(__name__)
+
+
+class StoryNotFound(Exception):
+    pass
+
+
+class StoryblokUnavailable(Exception):
+    pass
+
+
+class StoryblokApi(object):
+    """
+    Talks to Storyblok's content delivery API.
+    """
+
+    BASE_URL = "https://api.storyblok.com/v1/cdn/"
+    TIMEOUT = 5
+
+    def get(self, path, **params):
+        params["token"] = settings.STORYBLOK_API_TOKEN
+        # Bust Storyblok's CDN cache. We only get here when our own copy
+        # needs refreshing so we always want the latest content.
+        params["cv"] = time.time()
+        try:
+            response = requests.get(
+                f"{self.BASE_URL}{path}", params=params, timeout=self.TIMEOUT
+            )
+        except requests.RequestException as e:
+            raise StoryblokUnavailable(repr(e))
+
+        if response.status_code == 404:
+            raise StoryNotFound(path)
+        if not response.ok:
+            raise StoryblokUnavailable(f"{path}: {response.status_code}")
+        return response.json()
+
+
+class FakeStoryblokApi(object):
+    """
+    Serves stories from JSON files on disk instead of Storyblok. Each file in
+    STORYBLOK_FAKE_CONTENT_DIR holds one story and is named after its
+    full_slug, e.g. `integrations/trello.json`. Handy for tests and local
+    development, set STORYBLOK_API to use it.
+    """
+
+    def __init__(self, content_dir=None):
+        self.content_dir = content_dir or settings.STORYBLOK_FAKE_CONTENT_DIR
+
+    def get_stories(self):
+        stories = []
+        for filename in glob.glob(
+            os.path.join(self.content_dir, "**", "*.json"), recursive=True
+        ):
+            with open(filename) as f:
+                story = json.load(f)
+            full_slug = os.path.relpath(filename, self.content_dir)[: -len(".json")]
+            story.setdefault("full_slug", full_slug)
+            story.setdefault("slug", full_slug.split("/")[-1])
+            story.setdefault("name", story["slug"])
+            story.setdefault("uuid", str(uuid.uuid5(uuid.NAMESPACE_URL, full_slug)))
+            stories.append(story)
+        return stories
+
+    def get(self, path, **params):
+        stories = self.get_stories()
+        if path == "links/":
+            return {
+                "links": {
+                    story["uuid"]: {
+                        "slug": story["full_slug"],
+                        "published": True,
+                        "is_folder": False,
+                    }
+                    for story in stories
+                }
+            }
+        if path == "stories/":
+            starts_with = params.get("starts_with", "")
+            stories = [s for s in stories if s["full_slug"].startswith(starts_with)]
+            sort_by = params.get("sort_by")
+            if sort_by:
+                stories.sort(key=lambda s: s.get(sort_by, ""))
+            return {"stories": stories}
+
+        slug = path[len("stories/") :]
+        for story in stories:
+            if story["full_slug"] == slug:
+                return {"story": story}
+        raise StoryNotFound(path)
+
+
+class StoryblokCache(object):
+    """
+    Keeps a copy of every Storyblok response we serve, keyed by the request
+    path, its params and the content version (published or draft).
+
+    Entries are served straight from the cache while they're younger than
+    FRESH_FOR. After that they're still served but a background task is
+    kicked off to refetch them (stale-while-revalidate). Entries live for
+    STALE_FOR so marketing pages keep working if Storyblok is slow or down.
+    Only a cache miss ever waits on Storyblok.
+
+    Storyblok's publish webhook and the warm_storyblok_cache command refresh
+    every entry we know about so most of the time nothing is stale at all.
+    """
+
+    FRESH_FOR = 5 * 60
+    STALE_FOR = 7 * 24 * 60 * 60
+    REFRESH_LOCK_TIMEOUT = 60
+    KNOWN_REQUESTS_KEY = "storyblok_known_requests"
+
+    def __init__(self, api):
+        self.api = api
+
+    def get_cache_key(self, path, params, version):
+        request = json.dumps([path, sorted(params.items()), version])
+        return f"storyblok_{markdown_hash(request)}"
+
+    def get_story(self, slug, version="published"):
+        return self.get(f"stories/{slug}", version=version)
+
+    def get_stories(self, version="published", **params):
+        return self.get("stories/", version=version, **params)
+
+    def get_links(self, version="published"):
+        return self.get("links/", version=version)
+
+    def get(self, path, version="published", **params):
+        """
+        Returns the decoded response for `path`. Raises StoryNotFound if
+        Storyblok doesn't have it and StoryblokUnavailable if we don't have
+        a copy and can't get one.
+        """
+        entry = cache.get(self.get_cache_key(path, params, version))
+        if entry is None:
+            entry = self.refresh(path, version, params)
+        elif time.time() - entry["fetched_at"] > self.FRESH_FOR:
+            self.schedule_refresh(path, version, params)
+
+        if entry["data"] is None:
+            raise StoryNotFound(path)
+        return entry["data"]
+
+    def refresh(self, path, version, params):
+        try:
+            data = self.api.get(path, version=version, **params)
+        except StoryNotFound:
+            # Remember misses too. The headless CMS fallback catches every
+            # unknown URL so bots would otherwise hit Storyblok on each one.
+            data = None
+
+        cache_key = self.get_cache_key(path, params, version)
+        previous_entry = cache.get(cache_key)
+        entry = {"data": data, "fetched_at": time.time()}
+        cache.set(cache_key, entry, self.STALE_FOR)
+        if previous_entry is not None and previous_entry["data"] != data:
+            # Cached marketing pages were rendered from the old content.
+            invalidate_marketing_pages()
+        if data is not None:
+            self.remember(path, version, params)
+        return entry
+
+    def schedule_refresh(self, path, version, params):
+        from .tasks import refresh_storyblok_content  # Avoid circular import.
+
+        lock_key = f"{self.get_cache_key(path, params, version)}_refreshing"
+        if cache.add(lock_key, True, self.REFRESH_LOCK_TIMEOUT):
+            refresh_storyblok_content.delay(path, version, params)
+
+    def remember(self, path, version, params):
+        known = cache.get(self.KNOWN_REQUESTS_KEY, [])
+        request = [path, version, params]
+        if request not in known:
+            known.append(request)
+            cache.set(self.KNOWN_REQUESTS_KEY, known, self.STALE_FOR)
+
+    def refresh_all(self):
+        """
+        Refetches every response we've served plus every published story.
+        Returns the number of entries refreshed.
+        """
+        requests_to_refresh = list(cache.get(self.KNOWN_REQUESTS_KEY, []))
+        links = self.refresh("links/", "published", {})["data"] or {"links": {}}
+        for link in links["links"].values():
+            if link["published"] and not link["is_folder"]:
+                requests_to_refresh.append([f"stories/{link['slug']}", "published", {}])
+
+        refreshed = 1
+        seen = set()
+        for path, version, params in requests_to_refresh:
+            key = self.get_cache_key(path, params, version)
+            if key in seen:
+                continue
+            seen.add(key)
+            try:
+                self.refresh(path, version, params)
+                refreshed += 1
+            except StoryblokUnavailable as e:
+                # Keep serving whatever we had.
+                logger.warning(f"Couldn't refresh {path}: {e}")
+        return refreshed
+
+
+storyblok = StoryblokCache(
+    get_class(getattr(settings, "STORYBLOK_API", "marketing.storyblok.StoryblokApi"))()
+)
@@ -0,0 +1,22 @@
+import logging
+
+from celery import shared_task
+
+from .storyblok import StoryblokUnavailable, storyblok
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def refresh_storyblok_content(path, version, params):
+    try:
+        storyblok.refresh(path, version, params)
+    except StoryblokUnavailable as e:
+        # The stale copy keeps being served and we'll try again on the next
+        # request after the refresh lock expires.
+        logger.warning(f"Couldn't refresh {path}: {e}")
+
+
+@shared_task
+def warm_storyblok_cache():
+    storyblok.refresh_all()
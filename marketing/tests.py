@@ -1,3 +1,187 @@
-from django.test import TestCase
+import hmac
+import json
+import os
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from .cache import GENERATION_KEY
+from .storyblok import (
+    FakeStoryblokApi,
+    StoryblokCache,
+    StoryblokUnavailable,
+    StoryNotFound,
+    storyblok,
+)
+from .tasks import refresh_storyblok_content, warm_storyblok_cache
+
+LOCMEM_CACHE = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+class CountingStoryblokApi(FakeStoryblokApi):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.requests = []
+
+    def get(self, path, **params):
+        self.requests.append(path)
+        return super().get(path, **params)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class StoryblokTestCase(SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        content_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(content_dir.cleanup)
+        self.content_dir = content_dir.name
+        self.api = CountingStoryblokApi(self.content_dir)
+        # The tasks use the module level instance.
+        patcher = mock.patch.object(storyblok, "api", self.api)
+        self.addCleanup(patcher.stop)
+        patcher.start()
+
+    def write_story(self, full_slug, title):
+        filename = os.path.join(self.content_dir, f"{full_slug}.json")
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename, "w") as f:
+            json.dump({"content": {"title": title}}, f)
+
+    def run_tasks_now(self):
+        # Like a worker picking them straight up.
+        for task in (refresh_storyblok_content, warm_storyblok_cache):
+            patcher = mock.patch.object(task, "delay", side_effect=task)
+            self.addCleanup(patcher.stop)
+            patcher.start()
+
+
+class StoryblokCacheTestCase(StoryblokTestCase):
+    def setUp(self):
+        super().setUp()
+        self.write_story("integrations/trello", "Trello")
+
+    def get_title(self):
+        return storyblok.get_story("integrations/trello")["story"]["content"]["title"]
+
+    def later(self, seconds):
+        return mock.patch(
+            "marketing.storyblok.time.time", return_value=time.time() + seconds
+        )
+
+    def test_fresh_content_is_served_from_the_cache(self):
+        self.assertEqual(self.get_title(), "Trello")
+        self.write_story("integrations/trello", "Trello 2")
+
+        self.assertEqual(self.get_title(), "Trello")
+        self.assertEqual(self.api.requests, ["stories/integrations/trello"])
+
+    def test_stale_content_is_served_while_it_is_refreshed(self):
+        self.get_title()
+        self.write_story("integrations/trello", "Trello 2")
+
+        with self.later(StoryblokCache.FRESH_FOR + 1), mock.patch.object(
+            refresh_storyblok_content, "delay"
+        ) as delay:
+            self.assertEqual(self.get_title(), "Trello")
+            # Only one refresh is queued however many requests see it stale.
+            self.assertEqual(self.get_title(), "Trello")
+        delay.assert_called_once_with("stories/integrations/trello", "published", {})
+
+        refresh_storyblok_content(*delay.call_args[0])
+        self.assertEqual(self.get_title(), "Trello 2")
+
+    def test_stale_content_is_served_when_storyblok_is_down(self):
+        self.run_tasks_now()
+        self.get_title()
+
+        with self.later(StoryblokCache.FRESH_FOR + 1), mock.patch.object(
+            self.api, "get", side_effect=StoryblokUnavailable("down")
+        ), self.assertLogs("marketing.tasks", "WARNING") as logs:
+            self.assertEqual(self.get_title(), "Trello")
+        self.assertEqual(self.get_title(), "Trello")
+        self.assertIn("Couldn't refresh stories/integrations/trello", logs.output[0])
+
+    def test_missing_stories_are_cached(self):
+        for i in range(2):
+            with self.assertRaises(StoryNotFound):
+                storyblok.get_story("integrations/jira")
+        self.assertEqual(self.api.requests, ["stories/integrations/jira"])
+
+    def test_changed_content_invalidates_marketing_pages(self):
+        self.get_title()
+        generation = cache.get_or_set(GENERATION_KEY, 1, None)
+
+        storyblok.refresh("stories/integrations/trello", "published", {})
+        self.assertEqual(cache.get(GENERATION_KEY), generation)
+
+        self.write_story("integrations/trello", "Trello 2")
+        storyblok.refresh("stories/integrations/trello", "published", {})
+        self.assertEqual(cache.get(GENERATION_KEY), generation + 1)
+
+
+@override_settings(STORYBLOK_WEBHOOK_SECRET="secret")
+class StoryblokWebhookTestCase(StoryblokTestCase):
+    def setUp(self):
+        super().setUp()
+        self.run_tasks_now()
+        self.write_story("integrations/trello", "Trello")
+
+    def post(self, body, secret="secret"):
+        body = json.dumps(body).encode("utf-8")
+        signature = hmac.new(secret.encode("utf-8"), body, "sha1").hexdigest()
+        return self.client.post(
+            reverse("marketing-storyblok-webhook"),
+            body,
+            content_type="application/json",
+            HTTP_WEBHOOK_SIGNATURE=signature,
+        )
+
+    def test_publishing_refreshes_the_story(self):
+        storyblok.get_story("integrations/trello")
+        self.write_story("integrations/trello", "Trello 2")
+
+        response = self.post({"full_slug": "integrations/trello"})
+
+        self.assertEqual(response.status_code, 200)
+        story = storyblok.get_story("integrations/trello")
+        self.assertEqual(story["story"]["content"]["title"], "Trello 2")
+
+    def test_invalid_signature_is_rejected(self):
+        storyblok.get_story("integrations/trello")
+        self.write_story("integrations/trello", "Trello 2")
+
+        response = self.post({"full_slug": "integrations/trello"}, secret="wrong")
+
+        self.assertEqual(response.status_code, 401)
+        story = storyblok.get_story("integrations/trello")
+        self.assertEqual(story["story"]["content"]["title"], "Trello")
+
+    @override_settings(STORYBLOK_WEBHOOK_SECRET=None)
+    def test_rejected_without_a_secret(self):
+        response = self.post({"full_slug": "integrations/trello"}, secret="")
+
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class MarketingPageCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_og_url_leaves_out_the_query_string(self):
+        url = reverse("marketing-home")
+        og_url = '<meta property="og:url" content="http://testserver/" />'
+
+        response = self.client.get(url, {"utm_source": "newsletter"})
+        self.assertContains(response, og_url)
+        self.assertNotContains(response, "utm_source")
+
+        # Served from the cache filled by the first visitor.
+        response = self.client.get(url)
+        self.assertContains(response, og_url)
@@ -226,6 +226,11 @@ urlpatterns = [
         views.ahrefs_verification,
         name="marketing-ahrefs-verification",
     ),
+    path(
+        "app/storyblok-webhook/",
+        views.receive_storyblok_webhook,
+        name="marketing-storyblok-webhook",
+    ),
     re_path(
         r"^(?!app|!admin)(?P<slug>[a-zA-Z0-9\-/]+)/$",
         views.headless_cms_fallback,
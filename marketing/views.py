@@ -1,21 +1,29 @@
+import hmac
+import json
 from urllib.parse import urlencode
 
-import requests
 from django.conf import settings
 from django.http import Http404, HttpResponse
 from django.shortcuts import redirect, render
 from django.urls import reverse
-from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
 
+from .cache import cache_marketing_page
+from .storyblok import StoryblokUnavailable, StoryNotFound, storyblok
+from .tasks import refresh_storyblok_content, warm_storyblok_cache
 
+
+@cache_marketing_page
 def home(request):
     return render(request, "marketing-home.html")
 
 
+@cache_marketing_page
 def pricing(request):
     return render(request, "pricing.html")
 
 
+@cache_marketing_page
 def terms(request):
     return render(request, "terms.html")
 
@@ -27,54 +35,67 @@ def appsumo(request, code):
     return redirect(url)
 
 
+@cache_marketing_page
 def privacy(request):
     return render(request, "privacy.html")
 
 
+@cache_marketing_page
 def data_processing_agreement(request):
     return render(request, "data_processing_agreement.html")
 
 
+@cache_marketing_page
 def about(request):
     return render(request, "about.html")
 
 
+@cache_marketing_page
 def use_cases(request):
     return render(request, "use-cases.html")
 
 
+@cache_marketing_page
 def features(request):
     return render(request, "features.html")
 
 
+@cache_marketing_page
 def feature_request(request):
     return render(request, "feature-request.html")
 
 
+@cache_marketing_page
 def customer_attributes(request):
     return render(request, "customer-attributes.html")
 
 
+@cache_marketing_page
 def collect_feedback(request):
     return render(request, "use-case-collect-feedback.html")
 
 
+@cache_marketing_page
 def analyze_feedback(request):
     return render(request, "use-case-analyze-feedback.html")
 
 
+@cache_marketing_page
 def prioritize_feedback(request):
     return render(request, "use-case-prioritize-feedback.html")
 
 
+@cache_marketing_page
 def use_feedback(request):
     return render(request, "use-case-use-feedback.html")
 
 
+@cache_marketing_page
 def close_loop(request):
     return render(request, "use-case-close-loop.html")
 
 
+@cache_marketing_page
 def help(request):
     return render(request, "help.html")
 
@@ -83,10 +104,12 @@ def intercom_test_data(request):
     return render(request, "intercom-test-data.html")
 
 
+@cache_marketing_page
 def segment_integration(request):
     return render(request, "segment.html")
 
 
+@cache_marketing_page
 def intercom_integration(request):
     return render(request, "intercom.html")
 
@@ -98,167 +121,210 @@ def helpscout_integration(request):
         return render(request, "helpscout.html")
 
 
+@cache_marketing_page
 def icp_support(request):
     return render(request, "customers/support.html")
 
 
+@cache_marketing_page
 def helpscout_integration_product(request):
     return render(request, "helpscout-product.html")
 
 
+@cache_marketing_page
 def intercom_integration_product(request):
     return render(request, "intercom-product.html")
 
 
+@cache_marketing_page
 def help_helpscout_integration(request):
     return render(request, "help/helpscout.html")
 
 
+@cache_marketing_page
 def help_intercom_integration(request):
     return render(request, "help/intercom.html")
 
 
+@cache_marketing_page
 def help_api_integration(request):
     return render(request, "help/api.html")
 
 
+@cache_marketing_page
 def slack_integration(request):
     return render(request, "slack.html")
 
 
+@cache_marketing_page
 def all_integrations(request):
-    querystring = {
-        "token": settings.STORYBLOK_API_TOKEN,
-        "ct": timezone.now().timestamp(),
-        "starts_with": "integrations",
-        "sort_by": "name",
-        "per_page": 50,
-    }
-
-    response = requests.get(
-        "https://api.storyblok.com/v1/cdn/stories/", params=querystring
-    )
-
-    if response.ok:
-        content = response.json()
-        print(content)
-        return render(request, "all_integrations.html", context=content)
-    else:
+    try:
+        content = storyblok.get_stories(
+            starts_with="integrations", sort_by="name", per_page=50
+        )
+    except (StoryNotFound, StoryblokUnavailable):
         raise Http404()
+    return render(request, "all_integrations.html", context=content)
 
 
+@cache_marketing_page
 def help_zapier_integration(request):
     return render(request, "zapier.html")
 
 
+@cache_marketing_page
 def chrome_extension(request):
     return render(request, "chrome-extension.html")
 
 
+@cache_marketing_page
 def send_email(request):
     return render(request, "send-email.html")
 
 
+@cache_marketing_page
 def mental_model(request):
     return render(request, "mental-model.html")
 
 
+@cache_marketing_page
 def triage(request):
     return render(request, "triage.html")
 
 
+@cache_marketing_page
 def product_planning(request):
     return render(request, "product-planning.html")
 
 
+@cache_marketing_page
 def blog_index(request):
     return render(request, "blog/index.html")
 
 
+@cache_marketing_page
 def blog_savio_segment(request):
     return render(request, "blog/savio-segment-integration.html")
 
 
+@cache_marketing_page
 def blog_cs_influence_roadmap(request):
     return render(request, "blog/cs-influence-roadmap.html")
 
 
+@cache_marketing_page
 def blog_customer_feedback_guide(request):
     return render(request, "blog/product-leaders-guide-customer-feedback.html")
 
 
+@cache_marketing_page
 def blog_track_feature_requests_in_typeform(request):
     return render(request, "blog/track-feature-requests-in-typeform.html")
 
 
+@cache_marketing_page
 def blog_tracking_feature_requests_in_intercom(request):
     return render(request, "blog/tracking-feature-requests-in-intercom.html")
 
 
+@cache_marketing_page
 def blog_tracking_feature_requests_in_helpscout(request):
     return render(request, "blog/tracking-feature-requests-in-helpscout.html")
 
 
+@cache_marketing_page
 def blog_tracking_feature_requests_from_slack(request):
     return render(request, "blog/tracking-feature-requests-from-slack.html")
 
 
+@cache_marketing_page
 def blog_tracking_feature_requests_from_hubspot_crm(request):
     return render(request, "blog/tracking-feature-requests-in-hubspot-crm.html")
 
 
+@cache_marketing_page
 def blog_using_zapier_to_collect_customer_feedback(request):
     return render(request, "blog/using-zapier-to-collect-customer-feedback.html")
 
 
+@cache_marketing_page
 def canny_alternative(request):
     return render(request, "alternatives/canny.html")
 
 
+@cache_marketing_page
 def pb_alternative(request):
     return render(request, "alternatives/productboard.html")
 
 
+@cache_marketing_page
 def trello_alternative(request):
     return render(request, "alternatives/trello.html")
 
 
+@cache_marketing_page
 def uservoice_alternative(request):
     return render(request, "alternatives/uservoice.html")
 
 
+@cache_marketing_page
 def aha_alternative(request):
     return render(request, "alternatives/aha.html")
 
 
+@cache_marketing_page
 def customer_feedback_playbook(request):
     return render(request, "customer-feedback-playbook/index.html")
 
 
+@cache_marketing_page
 def customer_feedback_playbook_why_collect(request):
     return render(request, "customer-feedback-playbook/why-collect.html")
 
 
+@cache_marketing_page
 def customer_feedback_playbook_four_systems(request):
     return render(request, "customer-feedback-playbook/four-systems.html")
 
 
+@cache_marketing_page
 def headless_cms_fallback(request, slug):
-    querystring = {
-        "token": settings.STORYBLOK_API_TOKEN,
-        "ct": timezone.now().timestamp(),
-    }
-
-    response = requests.get(
-        f"https://api.storyblok.com/v1/cdn/stories/{slug}", params=querystring
-    )
-
-    if response.ok:
-        content = response.json()
-        template = content["story"]["content"]["django_template"]
-        return render(request, template, context=content)
-    else:
+    try:
+        content = storyblok.get_story(slug)
+    except (StoryNotFound, StoryblokUnavailable):
         raise Http404()
+    template = content["story"]["content"]["django_template"]
+    return render(request, template, context=content)
+
+
+@csrf_exempt
+def receive_storyblok_webhook(request):
+    if request.method != "POST":
+        return HttpResponse("Only POST accepted", status=400)
+
+    if not settings.STORYBLOK_WEBHOOK_SECRET:
+        # Without a secret we can't tell who sent it.
+        return HttpResponse("Webhook secret not configured", status=403)
+
+    signature = request.META.get("HTTP_WEBHOOK_SIGNATURE", "")
+    digest = hmac.new(
+        settings.STORYBLOK_WEBHOOK_SECRET.encode("utf-8"), request.body, "sha1"
+    ).hexdigest()
+    if not hmac.compare_digest(signature, digest):
+        return HttpResponse("Invalid signature", status=401)
+
+    try:
+        json_data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return HttpResponse("Invalid JSON", status=400)
+
+    # Refresh the story that changed right away so it's live on the next
+    # request, then everything else since lists and links include it too.
+    full_slug = json_data.get("full_slug")
+    if full_slug:
+        refresh_storyblok_content.delay(f"stories/{full_slug}", "published", {})
+    warm_storyblok_cache.delay()
+    return HttpResponse(status=200)
 
 
 def ahrefs_verification(request):
@@ -5,20 +5,33 @@ def exposed_settings(request):
     return {
         'PRODUCTION': settings.PRODUCTION,
         'INTERCOM_APP_ID': settings.INTERCOM_APP_ID,
+        'MARKETING_CACHE_VERSION': settings.MARKETING_CACHE_VERSION,
     }
 
 def getvars(request):
     """
     Builds a GET variables string to be uses in template links like pagination
     when persistence of the GET vars is needed.
+
+    It's only built if a template uses it.
     """
-    variables = request.GET.copy()
+    def get_getvars():
+        variables = request.GET.copy()
+
+        if 'page' in variables:
+            del variables['page']
 
-    if 'page' in variables:
-        del variables['page']
+        if variables:
+            return '&{0}'.format(variables.urlencode())
+        return ""
+    return {'getvars': get_getvars}
 
-    if variables:
-        qstring = {'getvars': '&{0}'.format(variables.urlencode())}
-    else:
-        qstring = ""
-    return qstring
+def canonical_url(request):
+    """
+    The absolute URL of the page without the query string, for og:url.
+    Cached marketing pages are shared across query strings so they must not
+    render the one of whoever filled the cache.
+    """
+    def get_canonical_url():
+        return request.build_absolute_uri(request.path)
+    return {'canonical_url': get_canonical_url}
@@ -143,6 +143,7 @@ TEMPLATES = [
                 "django.contrib.messages.context_processors.messages",
                 "prodtool.context_processors.exposed_settings",
                 "prodtool.context_processors.getvars",
+                "prodtool.context_processors.canonical_url",
                 "dummydata.context_processors.has_dummy_data",
                 "accounts.context_processors.onboarding_status",
             ],
@@ -167,10 +168,14 @@ DATABASES = {
     }
 }
 
+# Shared by every web and Celery process. Celery uses db 0 on the same
+# Redis. See common.cache.TieredRedisCache for the in-process L1 options.
 CACHES = {
     "default": {
-        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "BACKEND": "common.cache.TieredRedisCache",
+        "LOCATION": "redis://prodtool.l1i6lb.0001.use2.cache.amazonaws.com:6379/1",
         "KEY_PREFIX": "production",
+        "OPTIONS": {"L1_MAX_ENTRIES": 1000, "L1_TIMEOUT": 5,},
     }
 }
 
@@ -213,6 +218,13 @@ HELPSCOUT_CLIENT_SECRET = os.environ["HELPSCOUT_CLIENT_SECRET"]
 HELPSCOUT_WEBHOOK_SIGNING_KEY = os.environ["HELPSCOUT_WEBHOOK_SIGNING_KEY"]
 
 STORYBLOK_API_TOKEN = os.environ["STORYBLOK_API_TOKEN"]
+# The Storyblok webhook rejects everything until this is set.
+STORYBLOK_WEBHOOK_SECRET = os.environ.get("STORYBLOK_WEBHOOK_SECRET")
+STORYBLOK_API = "marketing.storyblok.StoryblokApi"
+
+# Part of every cached marketing page and fragment key. Bump it when a
+# deploy changes marketing templates.
+MARKETING_CACHE_VERSION = os.environ.get("MARKETING_CACHE_VERSION", "1")
 
 PLAN_TIERED = "plan_H0mfouAFXGWOGc"
 PLAN_EARLY_ADOPTER_20_PER_USER = "plan_El2pYaCzTgKQSi"
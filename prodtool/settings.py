@@ -28,6 +28,9 @@ MAILGUN_API_KEY = "IMNOTSECRET"
 
 SEGMENT_WRITE_KEY = "IMNOTSECRET"
 SEGMENT_WEBHOOK_SHARED_SECRET = "IMNOTSECRET"
+# Where internal_analytics.tracker sends events. Use
+# "internal_analytics.tracker.LocalSink" to keep them in memory instead.
+TRACKING_SINK = "internal_analytics.tracker.SegmentSink"
 
 STRIPE_API_KEY = "IMNOTSECRET"
 STRIPE_ENDPOINT_SECRET = "IMNOTSECRET"
@@ -125,6 +128,7 @@ TEMPLATES = [
                 "django.contrib.messages.context_processors.messages",
                 "prodtool.context_processors.exposed_settings",
                 "prodtool.context_processors.getvars",
+                "prodtool.context_processors.canonical_url",
                 "dummydata.context_processors.has_dummy_data",
                 "accounts.context_processors.onboarding_status",
             ],
@@ -149,10 +153,14 @@ DATABASES = {
     }
 }
 
+# Shared by every web and Celery process. Celery uses db 0 on the same
+# Redis. See common.cache.TieredRedisCache for the in-process L1 options.
 CACHES = {
     "default": {
-        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "BACKEND": "common.cache.TieredRedisCache",
+        "LOCATION": "redis://localhost:6379/1",
         "KEY_PREFIX": "development",
+        "OPTIONS": {"L1_MAX_ENTRIES": 1000, "L1_TIMEOUT": 5,},
     }
 }
 
@@ -190,6 +198,16 @@ HELPSCOUT_CLIENT_SECRET = "IM_NOT_SECRET"
 HELPSCOUT_WEBHOOK_SIGNING_KEY = "IM_NOT_SECRET"
 
 STORYBLOK_API_TOKEN = "IM_NOT_SECRET"
+STORYBLOK_WEBHOOK_SECRET = "IM_NOT_SECRET"
+# Where marketing.storyblok fetches CMS content from. Use
+# "marketing.storyblok.FakeStoryblokApi" to serve the JSON stories in
+# STORYBLOK_FAKE_CONTENT_DIR instead.
+STORYBLOK_API = "marketing.storyblok.StoryblokApi"
+
+# Part of every cached marketing page and fragment key. Bump it when a
+# deploy changes marketing templates.
+MARKETING_CACHE_VERSION = "development"
+STORYBLOK_FAKE_CONTENT_DIR = os.path.join(BASE_DIR, "marketing", "fake_cms")
 
 PLAN_TIERED = "plan_GwSV9PWY04hZ93"
 PLAN_EARLY_ADOPTER_20_PER_USER = "plan_Ek0Ns9AhiBtR1o"
@@ -13,3 +13,15 @@ class ReturnUrlMixin(RequestContextMixin):
         context = super().get_context_data(**kwargs)
         context['return'] = self.get_return_url()
         return context
+
+class CachedObjectMixin:
+    """
+    Only looks the object up once per request. SingleObjectMixin.get_object()
+    queries every time it's called and views tend to call it a lot.
+    """
+    def get_object(self, queryset=None):
+        if queryset is not None:
+            return super().get_object(queryset)
+        if not hasattr(self, '_object'):
+            self._object = super().get_object()
+        return self._object